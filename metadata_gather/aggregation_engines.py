@@ -0,0 +1,76 @@
+"""
+Pluggable engines that aggregate column batches into per-column statistics.
+
+An engine receives a ColumnBatch and returns the ColumnStatistics of its values: how many
+there are, how many are null and the types of the non-null ones, in the order they first
+appear. Every engine must produce the same statistics for the same batch, so the metadata
+summarized from them is the same whatever the engine.
+
+The python engine only relies on builtins that loop in C (list.count, map, dict.fromkeys),
+so no Python code runs per value.
+"""
+import itertools
+import operator
+import os
+from typing import Optional
+
+from common import ColumnBatch, ColumnStatistics
+
+aggregation_engines = {}
+
+# Engines in order of preference, the first one registered is used by default
+_PREFERENCE = ['python']
+
+# Environment variable to force the use of a given engine
+ENGINE_ENV_VAR = 'METADATA_GATHER_ENGINE'
+
+PYTHON = 'python'
+
+_NONE_TYPE = type(None)
+
+
+def aggregation_engine(name):
+    """
+    This decorator registers functions to be used as aggregation engines.
+
+    :param name: the name of the engine
+    """
+    def deco(f):
+        assert name not in aggregation_engines, f"engine {name} already registered"
+        aggregation_engines[name] = f
+        return f
+    return deco
+
+
+@aggregation_engine(PYTHON)
+def _aggregate_with_builtins(batch: ColumnBatch) -> ColumnStatistics:
+    values = batch.values if isinstance(batch.values, list) else list(batch.values)
+    if batch.null_mask is None:
+        nulls = values.count(None)
+        present = values
+    else:
+        nulls = sum(map(bool, batch.null_mask))
+        present = itertools.compress(values, map(operator.not_, batch.null_mask))
+
+    types = dict.fromkeys(map(type, present))
+    types.pop(_NONE_TYPE, None)
+    return ColumnStatistics(batch.name, len(values), nulls, tuple(types))
+
+
+def get_aggregation_engine(name: Optional[str] = None) -> str:
+    """
+    Resolve the name of the aggregation engine to use.
+
+    :param name: the name of the engine. When None, the one in the METADATA_GATHER_ENGINE
+    environment variable is used, or else the fastest one registered
+    :return: the name of a registered engine
+    :raises ValueError if the engine is not registered
+    """
+    name = name or os.environ.get(ENGINE_ENV_VAR)
+    if name is None:
+        return next(preferred for preferred in _PREFERENCE if preferred in aggregation_engines)
+
+    if name not in aggregation_engines:
+        raise ValueError(f"Unknown aggregation engine '{name}'. Available engines are: "
+                         f"{', '.join(aggregation_engines)}")
+    return name
@@ -0,0 +1,129 @@
+"""
+This module isolates the logic to send requests to a running crawl daemon.
+
+It only depends on the standard library and on common, so a client talking to a daemon
+does not pay for importing extractors, crawler and storage.
+"""
+import json
+import socket
+from typing import Any, Dict, List, Optional
+
+from common import FieldStatistics, GatherError, Metadata
+
+
+class DaemonError(GatherError):
+    """
+    Base exception for errors reported by a daemon
+    """
+    pass
+
+
+def default_socket_path(db_path: str) -> str:
+    """
+    Get the path of the socket a daemon serving a given DB listens on by default.
+
+    :param db_path: path to the db file
+    :return: the path of the socket
+    """
+    return db_path + '.sock'
+
+
+def send_message(sock: socket.socket, message: Dict[str, Any]) -> None:
+    """
+    Send a message, as a line of JSON.
+
+    :param sock: the socket to send the message through
+    :param message: the message to send
+    """
+    sock.sendall(json.dumps(message).encode() + b'\n')
+
+
+def receive_message(sock: socket.socket) -> Dict[str, Any]:
+    """
+    Receive a message sent with send_message().
+
+    :param sock: the socket to receive the message from
+    :return: the message
+    :raises ValueError if the message is not valid
+    """
+    with sock.makefile('rb') as f:
+        message = json.loads(f.readline())
+    if not isinstance(message, dict):
+        raise ValueError('Invalid message')
+    return message
+
+
+def send_request(socket_path: str, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Send a request to the daemon listening on socket_path, and wait for its response.
+
+    :param socket_path: the path of the socket the daemon listens on
+    :param request: the request to send
+    :return: the response, or None if no daemon is listening on socket_path
+    :raises DaemonError if the daemon could not process the request
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+
+        try:
+            send_message(sock, request)
+            response = receive_message(sock)
+        except (OSError, ValueError):
+            raise DaemonError('Lost connection to the daemon.')
+    finally:
+        sock.close()
+
+    if response.get('status') != 'ok':
+        raise DaemonError(response.get('message', 'Unexpected error occurred.'))
+    return response
+
+
+def remote_crawl(socket_path: str, abs_path: str, db_path: str, with_hash: bool = False,
+                 append_only: bool = False, with_statistics: bool = False) -> Optional[bool]:
+    """
+    Ask the daemon listening on socket_path to extract metadata from abs_path and store it.
+
+    :param socket_path: the path of the socket the daemon listens on
+    :param abs_path: the file to extract metadata from
+    :param db_path: path to the db file the daemon must be serving
+    :param with_hash: whether to compare content hashes to detect changes
+    :param append_only: whether a file that grew can be assumed to have been appended to
+    :param with_statistics: whether to compute the statistics of the values of each field
+    :return: True if the file was crawled, False if it did not change, or None if no daemon is listening
+    :raises DaemonError if the daemon could not crawl the file
+    """
+    response = send_request(socket_path, {'command': 'crawl', 'path': abs_path, 'database_path': db_path,
+                                          'with_hash': with_hash, 'append_only': append_only,
+                                          'with_statistics': with_statistics})
+    return None if response is None else response['crawled']
+
+
+def remote_describe(socket_path: str, abs_path: str, db_path: str) -> Optional[List[Metadata]]:
+    """
+    Ask the daemon listening on socket_path for the metadata stored for abs_path.
+
+    :param socket_path: the path of the socket the daemon listens on
+    :param abs_path: the file the metadata was extracted from
+    :param db_path: path to the db file the daemon must be serving
+    :return: the metadata of the file, empty if it was never crawled, or None if no daemon is listening
+    :raises DaemonError if the daemon could not retrieve the metadata
+    """
+    response = send_request(socket_path, {'command': 'describe', 'path': abs_path, 'database_path': db_path})
+    return None if response is None else [_decode_metadata(*metadata) for metadata in response['metadata']]
+
+
+def _decode_metadata(field, type_, total_occurrences, null_occurrences, total_margin=None, null_margin=None,
+                     statistics=None) -> Metadata:
+    """
+    Rebuild metadata sent as JSON, where tuples become lists.
+    """
+    if statistics is not None:
+        minimum, maximum, mean, variance, distinct, lengths, top_values = statistics
+        statistics = FieldStatistics(minimum, maximum, mean, variance, distinct,
+                                     None if lengths is None else tuple(tuple(pair) for pair in lengths),
+                                     tuple(tuple(pair) for pair in top_values))
+    return Metadata(field, type_, total_occurrences, null_occurrences, total_margin, null_margin, statistics)
@@ -3,31 +3,104 @@ This module isolate all the data structures shared by multiple modules
 to avoid coupling.
 """
 from collections import namedtuple
-from typing import Union
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional, Union
+
+
+class GatherError(Exception):
+    """
+    Base exception for the errors reported to the user
+    """
+    pass
+
 
 # Normalized record that represents information retrieved from an arbitrary source. These
 # are produced by extractors and consumed by crawler
 MetadataRecord = namedtuple('MetadataField', 'name, value')
 
-# Normalized metadata. These are produced by the crawler and stored in the DB
-Metadata = namedtuple('Metadata', 'field, type, total_occurrences, null_occurrences')
+# Statistics of a single column, gathered by columnar extractors without producing one record per
+# value. <types> holds the types of the non-null values found in the column. These are consumed by crawler
+ColumnStatistics = namedtuple('ColumnStatistics', 'name, occurrences, nulls, types')
+
+# Consecutive values of a single column, aggregated at once by an aggregation engine. <values> is a
+# sequence and <null_mask>, if given, a sequence of booleans telling which values are null. Without
+# it, None values are null
+ColumnBatch = namedtuple('ColumnBatch', 'name, values, null_mask')
+ColumnBatch.__new__.__defaults__ = (None,)
+
+# Normalized metadata. These are produced by the crawler and stored in the DB. Metadata estimated
+# from a sample of a file is approximate: its margins are the half-width of the 95% confidence
+# interval of its occurrences. The margins of exact metadata are None. <statistics> holds the
+# FieldStatistics of the field when they were computed, and None otherwise
+Metadata = namedtuple('Metadata', 'field, type, total_occurrences, null_occurrences, total_margin, null_margin, '
+                                  'statistics')
+Metadata.__new__.__defaults__ = (None, None, None)
+
+# Statistics of the non-null values of a field. minimum, maximum, mean and variance are only computed
+# for numbers (booleans, integers, floats and decimals), and lengths only for strings: it holds (bound,
+# count) pairs, the amount of strings whose length is at most <bound> and more than the previous bound,
+# a power of two. distinct is an estimate of the amount of distinct values, exact for few values, and
+# top_values holds (value, count) pairs of the most frequent values, most frequent first, whose counts
+# are upper bounds. Decimals are reported as floats, and dates and timestamps as ISO 8601 strings
+FieldStatistics = namedtuple('FieldStatistics', 'minimum, maximum, mean, variance, distinct, lengths, top_values')
+
+# How much of a file to sample: at least a fraction of its bytes and at least an amount of rows. A
+# None target is not required
+SampleSize = namedtuple('SampleSize', 'fraction, rows')
+
+# Identifies the content of a file when it was crawled: its size in bytes, its modification
+# time in nanoseconds and, optionally, a hash of its content
+FileFingerprint = namedtuple('FileFingerprint', 'size, mtime, content_hash')
+
+# A file in the catalog and the Metadata stored for it, a list
+FileMetadata = namedtuple('FileMetadata', 'path, metadata')
+
+# A field whose type differs across files, and how many files it has each type in, as (type, files)
+# pairs ordered by type
+FieldTypes = namedtuple('FieldTypes', 'field, types')
 
 # Mapping between supported data types and our internal representation
 _RECORD_TYPE_MAPPING = {
+    bool: "B",
     int: "I",
+    float: "F",
+    Decimal: "N",
+    date: "D",
+    datetime: "T",
     str: "S",
     None: None
 }
 
 # Mapping between our internal data types and its human-friendly representation
 _RECORD_TYPE_NAME = {
+    "B": "Boolean",
     "I": "Integer",
+    "F": "Float",
+    "N": "Decimal",
+    "D": "Date",
+    "T": "Timestamp",
     "S": "String",
     None: "null"
 }
 
+# The internal types each internal type widens to, narrowest first. Numbers widen from booleans to
+# decimals, dates widen to timestamps, and every type widens to strings
+_WIDER_TYPES = {
+    "B": ("I", "F", "N", "S"),
+    "I": ("F", "N", "S"),
+    "F": ("N", "S"),
+    "N": ("S",),
+    "D": ("T", "S"),
+    "T": ("S",),
+    "S": (),
+}
 
-def get_internal_type(a_type: Union[int, str, None]) -> str:
+# Every internal type, in the order of their codes in the DB schema and in crawler
+INTERNAL_TYPES = tuple(_WIDER_TYPES)
+
+
+def get_internal_type(a_type: Union[type, None]) -> str:
     """
     Translate a type into an internal type
 
@@ -53,3 +126,33 @@ def get_human_friendly_type(internal_type: str) -> str:
         return _RECORD_TYPE_NAME[internal_type]
     except KeyError:
         raise ValueError
+
+
+def widen_type(type_a: Optional[str], type_b: Optional[str]) -> Optional[str]:
+    """
+    Get the narrowest internal type that both given internal types widen to, which is the type
+    of a field whose values have both types.
+
+    :param type_a: an internal type, or None for no type (only null values)
+    :param type_b: another internal type, or None for no type
+    :return: the widened internal type
+    :raises: ValueError if any type is unsupported
+    """
+    if type_a is None:
+        type_a = type_b
+    elif type_b is None:
+        type_b = type_a
+    if type_a is None:
+        return None
+
+    try:
+        wider_a, wider_b = _WIDER_TYPES[type_a], _WIDER_TYPES[type_b]
+    except KeyError:
+        raise ValueError
+
+    if type_a == type_b or type_b in wider_a:
+        return type_b
+    if type_a in wider_b:
+        return type_a
+    # strings are the only type both chains widen to
+    return "S"
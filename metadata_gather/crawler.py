@@ -2,78 +2,297 @@
 This module isolates the logic to summarize records provided by an arbitrary sources into
 normalized metadata.
 """
-from typing import Generator, Iterable
+from array import array
+import functools
+import itertools
+import os
+import sqlite3
+from typing import Generator, Iterable, Optional
 
-from common import Metadata, MetadataRecord, get_internal_type
+from aggregation_engines import aggregation_engines, get_aggregation_engine
+from common import (ColumnBatch, ColumnStatistics, GatherError, INTERNAL_TYPES, Metadata, MetadataRecord,
+                    get_internal_type, widen_type)
+from field_statistics import FieldProfiler
 
 
-class CrawlingError(Exception):
+# Amount of records transposed into column batches at once
+_COLUMN_BATCH_SIZE = 64 * 1024
+
+# Internal types by type code. Code 0 is for fields with no type found yet
+_TYPES = [None] + list(INTERNAL_TYPES)
+
+_TYPE_CODES = {internal_type: code for code, internal_type in enumerate(_TYPES)}
+
+# The code of the type two types widen to, by their codes
+_WIDENED_CODES = [[_TYPE_CODES[widen_type(type_a, type_b)] for type_b in _TYPES] for type_a in _TYPES]
+
+# The code of the type a set of types widens to, by the mask of their codes (bit <code> set)
+_WIDENED_MASKS = [functools.reduce(lambda widened, code: _WIDENED_CODES[widened][code],
+                                   (code for code in range(len(_TYPES)) if mask & 1 << code), 0)
+                  for mask in range(1 << len(_TYPES))]
+
+# Environment variable to set the amount of fields summarized in memory before spilling them to disk
+SPILL_THRESHOLD_ENV_VAR = 'METADATA_GATHER_SPILL_THRESHOLD'
+
+_DEFAULT_SPILL_THRESHOLD = 1000000
+
+
+class CrawlingError(GatherError):
     """
     Base exception for crawling errors
     """
     pass
 
 
-class _MetadataAggregator:
+class _AggregatorStore:
     """
-    Help class to provide the logic to summarize individual records into normalized metadata.
+    Help class to keep the state of the summary of every field of a source in a compact way.
+
+    Field names are mapped to integer slots, in the order they are found, and the occurrences,
+    nulls and type code of each field are kept in parallel typed arrays, so a field costs a few
+    bytes besides its name. When a new field would exceed the spill threshold, every field held
+    is spilled to a temporary DB on disk and the arrays start over, so the memory used is bounded
+    whatever the amount of fields. Spilled fields are merged when the metadata is produced.
 
     This class is intended to use inside this module only.
     """
-    __slots__ = 'field_name', 'type_', 'occurrences', 'nulls'
+    __slots__ = 'spill_threshold', 'slots', 'occurrences', 'nulls', 'types', '_spilled', '_position'
+
+    def __init__(self, spill_threshold=None):
+        self.spill_threshold = get_spill_threshold(spill_threshold)
+        self._spilled = None
+        # the position of the field in the first slot, among every field found
+        self._position = 0
+        self._reset()
+
+    def _reset(self):
+        self.slots = dict()
+        self.occurrences = array('q')
+        self.nulls = array('q')
+        self.types = array('b')
+
+    def _name(self, slot):
+        return next(itertools.islice(self.slots, slot, None))
 
-    def __init__(self, field_name):
-        self.field_name = field_name
-        self.type_ = None
-        self.occurrences = 0
-        self.nulls = 0
+    def add(self, field_name, occurrences, nulls):
+        """
+        Count occurrences and nulls of a field.
 
-    @property
-    def type(self):
-        return self.type_
+        :return: the slot of the field, which is valid until the next call
+        """
+        try:
+            slot = self.slots[field_name]
+        except KeyError:
+            if len(self.slots) == self.spill_threshold:
+                self._spill()
+            slot = self.slots[field_name] = len(self.slots)
+            self.occurrences.append(0)
+            self.nulls.append(0)
+            self.types.append(0)
 
-    @type.setter
-    def type(self, t):
+        self.occurrences[slot] += occurrences
+        self.nulls[slot] += nulls
+        return slot
+
+    def add_type(self, slot, t):
         try:
-            t = get_internal_type(t)
+            internal_type = get_internal_type(t)
         except ValueError:
-            raise CrawlingError(f"The type of field '{self.field_name}' is unknown")
+            raise CrawlingError(f"The type of field '{self._name(slot)}' is unknown")
+
+        self.merge_type(slot, internal_type)
 
-        if self.type_ is None:
-            self.type_ = t
-        elif self.type_ != t:
-            raise CrawlingError(f"The type of field '{self.field_name}' is not consistent")
+    def merge_type(self, slot, internal_type):
+        try:
+            code = _TYPE_CODES[internal_type]
+        except KeyError:
+            raise CrawlingError(f"The type of field '{self._name(slot)}' is unknown")
+
+        if self.types[slot] != code:
+            self.types[slot] = _WIDENED_CODES[self.types[slot]][code]
+
+    def _spill(self):
+        if self._spilled is None:
+            # an empty name opens a private temporary DB on disk, deleted when it's closed
+            self._spilled = sqlite3.connect('')
+            self._spilled.execute("CREATE TABLE fields (name TEXT, position INTEGER, occurrences INTEGER, "
+                                  "nulls INTEGER, type INTEGER)")
+
+        self._spilled.executemany("INSERT INTO fields VALUES (?, ?, ?, ?, ?)",
+                                  zip(self.slots, itertools.count(self._position), self.occurrences, self.nulls,
+                                      self.types))
+        self._position += len(self.slots)
+        self._reset()
+
+    def to_metadata(self, profilers=None) -> Generator[Metadata, None, None]:
+        """
+        Produce the metadata of every field, in the order they were first found.
+
+        :param profilers: the FieldProfiler of each field, if profiling
+        """
+        if self._spilled is None:
+            fields = zip(self.slots, self.occurrences, self.nulls, self.types)
+        else:
+            self._spill()
+            # the sum of the distinct powers of two of the codes of a field is the mask of its codes
+            masks = self._spilled.execute("SELECT name, SUM(occurrences), SUM(nulls), SUM(DISTINCT 1 << type) "
+                                          "FROM fields GROUP BY name ORDER BY MIN(position)")
+            fields = ((name, occurrences, nulls, _WIDENED_MASKS[mask]) for name, occurrences, nulls, mask in masks)
 
-    def increment_nulls(self):
-        self.nulls += 1
+        try:
+            for name, occurrences, nulls, code in fields:
+                statistics = None if profilers is None else profilers[name].statistics()
+                yield Metadata(name, _TYPES[code], occurrences, nulls, statistics=statistics)
+        finally:
+            if self._spilled is not None:
+                self._spilled.close()
+
+
+def get_spill_threshold(threshold: Optional[int] = None) -> Optional[int]:
+    """
+    Resolve the amount of fields summarized in memory before they are spilled to disk.
 
-    def increment_occurrences(self):
-        self.occurrences += 1
+    :param threshold: the amount of fields. When None, the one in the METADATA_GATHER_SPILL_THRESHOLD
+    environment variable is used, or else 1000000
+    :return: the amount of fields, or None if fields are never spilled (a threshold of 0)
+    :raises ValueError if the threshold is negative
+    """
+    if threshold is None:
+        threshold = int(os.environ.get(SPILL_THRESHOLD_ENV_VAR, _DEFAULT_SPILL_THRESHOLD))
+
+    if threshold < 0:
+        raise ValueError(f"Invalid spill threshold {threshold}, it must be 0 (never spill) or greater")
+    return threshold or None
 
 
-def crawl(records: Iterable[MetadataRecord]) -> Generator[Metadata, None, None]:
+def crawl(records: Iterable[MetadataRecord], profile: bool = False,
+          spill_threshold: Optional[int] = None) -> Generator[Metadata, None, None]:
     """
     Summarize an iterable of records into normalized metadata.
 
+    A field whose values have different types has the narrowest type all of them widen to,
+    see common.widen_type(). When profiling, the FieldStatistics of each field are computed
+    in the same pass, see field_statistics. Profilers are always kept in memory.
+
     :param records: an iterable of records to summarize
+    :param profile: whether to compute the statistics of the values of each field
+    :param spill_threshold: the amount of fields summarized in memory before spilling them to disk,
+    see get_spill_threshold()
     :raises: Crawling error if anything goes wrong. For instance, if any record
     has an unsupported type.
     """
-    aggregations = dict()
+    store = _AggregatorStore(spill_threshold)
+    profilers = dict() if profile else None
 
     for (record_name, record_value) in records:
-        # get an aggregator for this record, or create one there isn't.
+        slot = store.add(record_name, 1, record_value is None)
+        if record_value is not None:
+            store.add_type(slot, type(record_value))
+
+        if profile:
+            try:
+                profiler = profilers[record_name]
+            except KeyError:
+                profiler = profilers[record_name] = FieldProfiler()
+            if record_value is not None:
+                profiler.update(record_value)
+
+    yield from store.to_metadata(profilers)
+
+
+def crawl_statistics(statistics: Iterable[ColumnStatistics],
+                     spill_threshold: Optional[int] = None) -> Generator[Metadata, None, None]:
+    """
+    Summarize an iterable of per-column statistics into normalized metadata.
+
+    The same rules that crawl applies to records are applied to statistics: the
+    type of a column is the narrowest type its types widen to, see
+    common.widen_type(). Statistics sharing the same column name are summarized
+    together.
+
+    :param statistics: an iterable of statistics to summarize
+    :param spill_threshold: the amount of columns summarized in memory before spilling them to disk,
+    see get_spill_threshold()
+    :raises: Crawling error if anything goes wrong. For instance, if any column
+    has an unsupported type.
+    """
+    store = _AggregatorStore(spill_threshold)
+
+    for (name, occurrences, nulls, types) in statistics:
+        slot = store.add(name, occurrences, nulls)
+        for t in types:
+            store.add_type(slot, t)
+
+    yield from store.to_metadata()
+
+
+def columnize(records: Iterable[MetadataRecord],
+              batch_size: int = _COLUMN_BATCH_SIZE) -> Generator[ColumnBatch, None, None]:
+    """
+    Transpose records into column batches: the values of each field, in order, for every
+    <batch_size> records.
+
+    Fields are produced in the order they first appear, so summarizing the batches produces
+    the metadata in the same order as crawl() does.
+
+    :param records: an iterable of records to transpose
+    :param batch_size: the amount of records transposed into each group of batches
+    :return: a generator object that produces ColumnBatch objects
+    """
+    columns = dict()
+    pending = 0
+    for name, value in records:
         try:
-            aggr = aggregations[record_name]
+            columns[name].append(value)
         except KeyError:
-            aggr = _MetadataAggregator(record_name)
-            aggregations[record_name] = aggr
+            columns[name] = [value]
 
-        aggr.increment_occurrences()
-        if record_value is None:
-            aggr.increment_nulls()
-        else:
-            aggr.type = type(record_value)
+        pending += 1
+        if pending == batch_size:
+            yield from (ColumnBatch(name, values) for name, values in columns.items())
+            columns = dict()
+            pending = 0
+
+    yield from (ColumnBatch(name, values) for name, values in columns.items())
+
+
+def crawl_columns(batches: Iterable[ColumnBatch], engine: Optional[str] = None) -> Generator[Metadata, None, None]:
+    """
+    Summarize an iterable of column batches into normalized metadata.
+
+    Each batch is aggregated at once by an aggregation engine, so the cost per value is much
+    lower than crawl()'s. The metadata produced is the same crawl() produces for the same
+    values, and the same rules are applied.
+
+    :param batches: an iterable of column batches to summarize, see columnize()
+    :param engine: the name of the aggregation engine, see aggregation_engines.get_aggregation_engine()
+    :raises: Crawling error if anything goes wrong. For instance, if any value has an unsupported type.
+    :raises ValueError if the engine is not registered
+    """
+    aggregate = aggregation_engines[get_aggregation_engine(engine)]
+    return crawl_statistics(map(aggregate, batches))
+
+
+def merge_metadata(partials: Iterable[Iterable[Metadata]],
+                   spill_threshold: Optional[int] = None) -> Generator[Metadata, None, None]:
+    """
+    Merge the metadata summarized from different parts of the same source.
+
+    Metadata is a mergeable representation of the summarized state: the metadata produced
+    by crawling each part of a source, merged in order, is the same as the metadata produced
+    by crawling the whole source. The same type rules are applied while merging: types are
+    widened. Statistics of the values of fields can't be merged: they are dropped.
+
+    :param partials: an iterable with the metadata of each part, in the order of the parts
+    :param spill_threshold: the amount of fields merged in memory before spilling them to disk,
+    see get_spill_threshold()
+    :raises: Crawling error if the type of a field is unknown
+    """
+    store = _AggregatorStore(spill_threshold)
+
+    for partial in partials:
+        for metadata in partial:
+            slot = store.add(metadata.field, metadata.total_occurrences, metadata.null_occurrences)
+            store.merge_type(slot, metadata.type)
 
-    yield from (Metadata(aggr.field_name, aggr.type, aggr.occurrences, aggr.nulls)
-                for aggr in aggregations.values())
+    yield from store.to_metadata()
@@ -0,0 +1,237 @@
+"""
+This module isolates the logic of the crawl daemon: a resident process that serves crawl
+and describe requests over a Unix socket, so they don't pay for starting the interpreter,
+importing every extractor and opening the DB.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import os
+import signal
+import socket
+import socketserver
+import threading
+from typing import Any, Dict, Optional
+
+from client import DaemonError, default_socket_path, receive_message, send_message
+from common import GatherError
+from storage_manager import open_storage
+from fingerprint import fingerprint_if_changed
+from tasks import crawl_changed, is_worth_splitting, store_crawl_result
+
+
+class _PathLocks:
+    """
+    Help class to serialize the requests on the same file, so they don't crawl and store it
+    concurrently. Locks are discarded once no request holds them.
+
+    This class is intended to use inside this module only.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = dict()
+
+    @contextmanager
+    def hold(self, path: str):
+        with self._lock:
+            lock, holders = self._locks.get(path) or (threading.Lock(), 0)
+            self._locks[path] = (lock, holders + 1)
+
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                holders = self._locks[path][1] - 1
+                if holders:
+                    self._locks[path] = (lock, holders)
+                else:
+                    del self._locks[path]
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    """
+    Handle a connection to the daemon: a single request, and its response.
+
+    This class is intended to use inside this module only.
+    """
+    def handle(self):
+        try:
+            response = self.server.daemon.process(receive_message(self.request))
+        except ValueError:
+            response = {'status': 'error', 'message': 'Invalid request.'}
+        except OSError:
+            return
+
+        try:
+            send_message(self.request, response)
+        except OSError:
+            # the client is gone
+            pass
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class CrawlDaemon:
+    """
+    Serves crawl and describe requests for a single DB.
+
+    Requests are processed concurrently, each one in its own thread. A single pool of worker
+    processes and a single connection to the DB are kept for the whole life of the daemon.
+    Files are fingerprinted and stored by the thread of their request, and parsed by the pool:
+    a big file is split into chunks crawled by several workers, and any other file is crawled
+    whole by a single worker, so concurrent requests are parsed on several CPUs. Requests on the
+    same file are serialized.
+    """
+    def __init__(self, db_path: str, socket_path: Optional[str] = None, workers: Optional[int] = None):
+        """
+        :param db_path: path to the db file. It's created if it doesn't exists.
+        :param socket_path: the path of the socket to listen on. Defaults to the db path followed by '.sock'
+        :param workers: the amount of worker processes. Defaults to the amount of CPUs
+        :raises DaemonError if another daemon is listening on the socket
+        :raises StoringException if the DB can't be opened
+        """
+        self.db_path = db_path
+        self.socket_path = socket_path or default_socket_path(db_path)
+        self._workers = workers or os.cpu_count() or 1
+        self._path_locks = _PathLocks()
+        self._storage_lock = threading.Lock()
+
+        _remove_stale_socket(self.socket_path)
+        self._storage = open_storage(db_path, check_same_thread=False)
+        try:
+            self._server = _UnixServer(self.socket_path, _RequestHandler)
+        except BaseException:
+            self._storage.close()
+            raise
+        self._executor = ProcessPoolExecutor(max_workers=self._workers)
+        self._server.daemon = self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def serve_forever(self) -> None:
+        """
+        Process requests until shutdown() is called.
+        """
+        self._server.serve_forever()
+
+    def shutdown(self) -> None:
+        """
+        Stop serve_forever(). It must be called from another thread.
+        """
+        self._server.shutdown()
+
+    def close(self) -> None:
+        """
+        Stop listening and release the worker pool and the connection to the DB.
+        """
+        self._server.server_close()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+        self._executor.shutdown()
+        with self._storage_lock:
+            self._storage.close()
+
+    def process(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Process a request, see client.send_request().
+
+        :param request: the request to process
+        :return: the response to the request
+        """
+        try:
+            if request.get('database_path', self.db_path) != self.db_path:
+                raise DaemonError(f"The daemon listening on '{self.socket_path}' serves the database "
+                                  f"'{self.db_path}'")
+
+            command = request.get('command')
+            if command == 'crawl':
+                return {'status': 'ok', 'crawled': self._crawl(request['path'], bool(request.get('with_hash')),
+                                                               bool(request.get('append_only')),
+                                                               bool(request.get('with_statistics')))}
+            if command == 'describe':
+                with self._storage_lock:
+                    metadata = list(self._storage.retrieve_metadata(request['path']))
+                return {'status': 'ok', 'metadata': [list(m) for m in metadata]}
+            if command == 'ping':
+                return {'status': 'ok'}
+
+            raise DaemonError(f"Unknown command '{command}'")
+        except GatherError as e:
+            return {'status': 'error', 'message': str(e)}
+        except Exception:
+            return {'status': 'error', 'message': 'Unexpected error occurred.'}
+
+    def _crawl(self, abs_path: str, with_hash: bool, append_only: bool, with_statistics: bool) -> bool:
+        with self._path_locks.hold(abs_path):
+            with self._storage_lock:
+                stored = self._storage.retrieve_fingerprint(abs_path)
+                crawled_bytes = self._storage.retrieve_crawled_bytes(abs_path)
+
+            fingerprint = fingerprint_if_changed(abs_path, stored, with_hash)
+            if fingerprint is None:
+                return False
+
+            if not with_statistics and is_worth_splitting(abs_path, self._workers):
+                # its chunks are crawled by the pool
+                result = crawl_changed(abs_path, stored, crawled_bytes, fingerprint, with_hash, append_only,
+                                       self._workers, self._executor)
+            else:
+                # a single worker, which must not split it: the pool would wait on itself
+                result = self._executor.submit(crawl_changed, abs_path, stored, crawled_bytes, fingerprint, with_hash,
+                                               append_only, 1, None, None, with_statistics).result()
+
+            with self._storage_lock:
+                store_crawl_result(self._storage, abs_path, result)
+            return True
+
+
+def _remove_stale_socket(socket_path: str) -> None:
+    """
+    Remove the socket left by a daemon that is not running anymore.
+
+    :param socket_path: the path of the socket
+    :raises DaemonError if a daemon is listening on the socket
+    """
+    if not os.path.exists(socket_path):
+        return
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except ConnectionRefusedError:
+        os.unlink(socket_path)
+        return
+    finally:
+        sock.close()
+
+    raise DaemonError(f"A daemon is already listening on '{socket_path}'")
+
+
+def _raise_system_exit(signum, frame):
+    raise SystemExit(0)
+
+
+def serve(db_path: str, socket_path: Optional[str] = None, workers: Optional[int] = None) -> None:
+    """
+    Run a crawl daemon until it's interrupted or terminated.
+
+    :param db_path: path to the db file. It's created if it doesn't exists.
+    :param socket_path: the path of the socket to listen on. Defaults to the db path followed by '.sock'
+    :param workers: the amount of worker processes. Defaults to the amount of CPUs
+    :raises DaemonError if another daemon is listening on the socket
+    """
+    signal.signal(signal.SIGTERM, _raise_system_exit)
+    with CrawlDaemon(db_path, socket_path, workers) as daemon:
+        print(f"Listening on '{daemon.socket_path}'", flush=True)
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
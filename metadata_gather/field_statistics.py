@@ -0,0 +1,189 @@
+"""
+This module isolates the logic to compute statistics of the values of a field in a single
+streaming pass, with bounded memory:
+   - minimum, maximum, mean and variance of numbers, updated for every value (Welford's method)
+   - distinct values, counted exactly up to a threshold and estimated with HyperLogLog beyond it
+   - a histogram of the lengths of strings, in power of two buckets
+   - the most frequent values, tracked by a bounded amount of counters
+"""
+from datetime import date
+from decimal import Decimal
+import math
+from typing import Dict, Optional, Union
+
+from common import FieldStatistics
+
+# Distinct values counted exactly before switching to HyperLogLog
+_EXACT_DISTINCT = 1024
+
+# HyperLogLog precision: the sketch has 2 ** _HLL_PRECISION registers, for a relative error
+# around 1.04 / sqrt(2 ** _HLL_PRECISION), about 1.6%
+_HLL_PRECISION = 12
+_HLL_REGISTERS = 1 << _HLL_PRECISION
+_HLL_ALPHA = 0.7213 / (1 + 1.079 / _HLL_REGISTERS)
+
+# Counters kept to track the most frequent values
+_FREQUENT_COUNTERS = 64
+
+# Most frequent values reported
+_TOP_VALUES = 10
+
+_MASK_64 = (1 << 64) - 1
+
+
+def _hash64(value: Union[int, str]) -> int:
+    """
+    Hash a value into 64 well mixed bits.
+
+    Python's hash of an integer is the integer itself, so it's mixed with the finalizer of
+    splitmix64. Hashes of strings are randomized per process, which is fine as long as the
+    sketches of a field are not shared among processes.
+    """
+    h = hash(value) & _MASK_64
+    h = ((h ^ (h >> 30)) * 0xbf58476d1ce4e5b9) & _MASK_64
+    h = ((h ^ (h >> 27)) * 0x94d049bb133111eb) & _MASK_64
+    return h ^ (h >> 31)
+
+
+class _DistinctCounter:
+    """
+    Help class to count distinct values: exactly while there are few of them, and with a
+    HyperLogLog sketch once there are more than _EXACT_DISTINCT.
+
+    This class is intended to use inside this module only.
+    """
+    __slots__ = '_values', '_registers'
+
+    def __init__(self):
+        self._values = set()
+        self._registers = None
+
+    def add(self, value: Union[int, str]) -> None:
+        if self._registers is None:
+            self._values.add(value)
+            if len(self._values) > _EXACT_DISTINCT:
+                self._registers = bytearray(_HLL_REGISTERS)
+                for v in self._values:
+                    self._add_to_sketch(v)
+                self._values = None
+        else:
+            self._add_to_sketch(value)
+
+    def _add_to_sketch(self, value: Union[int, str]) -> None:
+        h = _hash64(value)
+        idx = h & (_HLL_REGISTERS - 1)
+        # the rank is the position of the first set bit among the remaining ones
+        rank = 64 - _HLL_PRECISION - (h >> _HLL_PRECISION).bit_length() + 1
+        if rank > self._registers[idx]:
+            self._registers[idx] = rank
+
+    def count(self) -> int:
+        if self._registers is None:
+            return len(self._values)
+
+        estimate = _HLL_ALPHA * _HLL_REGISTERS ** 2 / sum(2.0 ** -r for r in self._registers)
+        zeros = self._registers.count(0)
+        if estimate <= 2.5 * _HLL_REGISTERS and zeros:
+            # linear counting is more accurate for small cardinalities
+            estimate = _HLL_REGISTERS * math.log(_HLL_REGISTERS / zeros)
+        return round(estimate)
+
+
+class _FrequentValues:
+    """
+    Help class to track the most frequent values with a bounded amount of counters (Space-Saving).
+
+    Once there are _FREQUENT_COUNTERS counters, a new value replaces one of the values with the
+    smallest count, and inherits that count plus one. Counts are upper bounds, overestimated by
+    at most the smallest count, and any value more frequent than that is guaranteed a counter,
+    even if it first appears after the counters are full.
+
+    This class is intended to use inside this module only.
+    """
+    __slots__ = '_counts', '_minimum', '_smallest'
+
+    def __init__(self):
+        self._counts = dict()
+        # the smallest count, and values that may have it: candidates are checked when they're replaced
+        self._minimum = 0
+        self._smallest = []
+
+    def add(self, value: Union[int, str]) -> None:
+        counts = self._counts
+        if value in counts or len(counts) < _FREQUENT_COUNTERS:
+            counts[value] = counts.get(value, 0) + 1
+            return
+
+        while True:
+            if not self._smallest:
+                self._minimum = min(counts.values())
+                self._smallest = [v for v, count in counts.items() if count == self._minimum]
+            replaced = self._smallest.pop()
+            if counts[replaced] == self._minimum:
+                break
+        del counts[replaced]
+        counts[value] = self._minimum + 1
+
+    def top(self, k: int):
+        return tuple(sorted(self._counts.items(), key=lambda item: item[1], reverse=True)[:k])
+
+
+class FieldProfiler:
+    """
+    Computes the statistics of the non-null values of a field, one value at a time.
+    """
+    __slots__ = '_count', '_minimum', '_maximum', '_mean', '_m2', '_lengths', '_distinct', '_frequent'
+
+    def __init__(self):
+        self._count = 0
+        self._minimum = None
+        self._maximum = None
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._lengths: Dict[int, int] = dict()
+        self._distinct = _DistinctCounter()
+        self._frequent = _FrequentValues()
+
+    def update(self, value: Union[bool, int, float, Decimal, date, str]) -> None:
+        """
+        Account for a non-null value. Decimals are accounted for as floats, and dates and
+        timestamps as their ISO 8601 strings, without numeric statistics nor lengths.
+
+        :param value: the value, of any of the supported types
+        """
+        if isinstance(value, str):
+            length = len(value)
+            bound = 1 << (length - 1).bit_length() if length else 0
+            self._lengths[bound] = self._lengths.get(bound, 0) + 1
+        elif isinstance(value, date):
+            value = value.isoformat()
+        else:
+            if isinstance(value, Decimal):
+                value = float(value)
+            self._count += 1
+            if self._minimum is None or value < self._minimum:
+                self._minimum = value
+            if self._maximum is None or value > self._maximum:
+                self._maximum = value
+            delta = value - self._mean
+            self._mean += delta / self._count
+            self._m2 += delta * (value - self._mean)
+
+        self._distinct.add(value)
+        self._frequent.add(value)
+
+    def statistics(self) -> Optional[FieldStatistics]:
+        """
+        :return: the statistics of the values accounted for so far, or None if there were none
+        """
+        distinct = self._distinct.count()
+        if not distinct:
+            return None
+
+        numeric = self._count > 0
+        return FieldStatistics(self._minimum, self._maximum,
+                               self._mean if numeric else None,
+                               self._m2 / self._count if numeric else None,
+                               distinct,
+                               tuple(sorted(self._lengths.items())) if self._lengths else None,
+                               self._frequent.top(_TOP_VALUES))
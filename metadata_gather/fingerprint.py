@@ -0,0 +1,98 @@
+"""
+This module isolates the logic to detect whether a file changed since it was crawled.
+"""
+import hashlib
+import os
+from typing import Optional
+
+from common import FileFingerprint
+
+# Amount of bytes read at once while hashing a file
+_BLOCK_SIZE = 1024 * 1024
+
+
+def content_hash(file_path: str, size: Optional[int] = None) -> str:
+    """
+    Compute a fast hash of the content of a file.
+
+    :param file_path: the path to the file
+    :param size: the amount of bytes to hash, from the beginning of the file. The whole file if None
+    :return: the hash, as an hexadecimal string
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, mode='rb') as f:
+        while size is None or size > 0:
+            block = f.read(_BLOCK_SIZE if size is None else min(_BLOCK_SIZE, size))
+            if not block:
+                break
+            digest.update(block)
+            if size is not None:
+                size -= len(block)
+    return digest.hexdigest()
+
+
+def fingerprint_if_changed(file_path: str, stored: Optional[FileFingerprint],
+                           with_hash: bool = False) -> Optional[FileFingerprint]:
+    """
+    Fingerprint a file, unless it did not change since it was fingerprinted.
+
+    A file with the stored size and modification time is unchanged, which only takes a
+    stat. When hashing, a file with the stored size whose modification time changed is
+    also unchanged if its content hash is the stored one.
+
+    :param file_path: the path to the file
+    :param stored: the fingerprint stored when the file was crawled, if any
+    :param with_hash: whether to include a content hash in the fingerprint and compare it
+    :return: the current fingerprint of the file, or None if it's unchanged
+    """
+    stat = os.stat(file_path)
+    fingerprint = FileFingerprint(stat.st_size, stat.st_mtime_ns, None)
+
+    if stored is not None and stored.size == fingerprint.size and stored.mtime == fingerprint.mtime:
+        return None
+
+    if with_hash:
+        fingerprint = fingerprint._replace(content_hash=content_hash(file_path))
+        if stored is not None and stored.size == fingerprint.size and stored.content_hash == fingerprint.content_hash:
+            return None
+
+    return fingerprint
+
+
+def is_appended(file_path: str, stored: Optional[FileFingerprint], current: FileFingerprint,
+                with_hash: bool = False) -> bool:
+    """
+    Whether a file grew since it was fingerprinted, keeping its previous content.
+
+    Without hashing, any file that grew is assumed to have been appended to. When hashing,
+    the content of the file up to its previous size must have the stored hash.
+
+    :param file_path: the path to the file
+    :param stored: the fingerprint stored when the file was crawled, if any
+    :param current: the current fingerprint of the file
+    :param with_hash: whether to verify the previous content with its hash
+    :return: True if the file was appended to. False otherwise.
+    """
+    if stored is None or current.size <= stored.size:
+        return False
+
+    if not with_hash:
+        return True
+
+    return stored.content_hash is not None and content_hash(file_path, stored.size) == stored.content_hash
+
+
+def ends_with_line_break(file_path: str, size: int) -> bool:
+    """
+    Whether the first <size> bytes of a file end with a line break.
+
+    :param file_path: the path to the file
+    :param size: the amount of bytes to consider
+    :return: True if the byte before <size> is a line break. False otherwise.
+    """
+    if size <= 0:
+        return False
+
+    with open(file_path, mode='rb') as f:
+        f.seek(size - 1)
+        return f.read(1) == b'\n'
@@ -1,12 +1,17 @@
 import argparse
+import csv
+import json
+import math
 import os
 import sys
-from typing import List, Type
+from typing import Iterable, List, Optional, Type
 
-from metadata_extractor import extract_metadata_from_file, ExtractionError
-from crawler import crawl, CrawlingError
-from storage_manager import MetadataStorageManager, StoringException
-from common import Metadata, get_human_friendly_type
+from client import default_socket_path, remote_crawl, remote_describe
+from common import FieldStatistics, FieldTypes, FileMetadata, GatherError, Metadata, SampleSize, get_human_friendly_type
+from instrumentation import Instrumentation
+
+# Modules to extract, crawl and store metadata in-process (tasks, and everything it depends on) are
+# imported only when no daemon is running, so talking to a daemon doesn't pay for importing them
 
 
 def absolute_path(file_path: str) -> str:
@@ -18,6 +23,18 @@ def absolute_path(file_path: str) -> str:
     return os.path.abspath(os.path.expanduser(file_path))
 
 
+def path_prefix(prefix: str) -> str:
+    """
+    Return the absolute path for a given prefix of paths, keeping its trailing separator, if any
+    :param prefix: a relative prefix
+    :return: the absolute prefix
+    """
+    abs_prefix = absolute_path(prefix)
+    if prefix.endswith(os.sep) and not abs_prefix.endswith(os.sep):
+        abs_prefix += os.sep
+    return abs_prefix
+
+
 def readable_file(file_path: str) -> str:
     """
     Check if a given file path is readable.
@@ -33,67 +50,285 @@ def readable_file(file_path: str) -> str:
     raise argparse.ArgumentTypeError(f"The entered path '{file_path}' is not readable")
 
 
-def is_already_crawled(storage_manager: MetadataStorageManager, file_path: str) -> bool:
+def perform_crawling(abs_path: str, db_path: str, workers: Optional[int] = None, with_hash: bool = False,
+                     append_only: bool = False, socket_path: Optional[str] = None,
+                     sample: Optional[SampleSize] = None, with_statistics: bool = False,
+                     instrumentation: Optional[Instrumentation] = None) -> None:
     """
-    Whether a given file was already crawled
+    Extract metadata from abs_path and store it.
+
+    Big files are split into chunks crawled in parallel, when their format allows it. A
+    file that did not change since it was crawled is not crawled again, while the metadata
+    of a file that changed is replaced.
+
+    When a daemon is listening on socket_path, the file is crawled by the daemon, with its
+    own workers. Otherwise, or when sampling or measuring, it's crawled in-process.
 
-    :param storage_manager: an instance of the storage manager to check metadata
-    :param file_path: a path
-    :return: True if that file was already crawled. False otherwise.
+    :param abs_path: the file to extract metadata from
+    :param db_path: path to the db file. It's created if it doesn't exists.
+    :param workers: the amount of worker processes. Defaults to the amount of CPUs
+    :param with_hash: whether to compare content hashes to detect changes
+    :param append_only: whether a file that grew can be assumed to have been appended to
+    :param socket_path: the path of the socket of the daemon. The file is always crawled in-process if None
+    :param sample: how much of the file to sample, see sampling.sample_file(). The file is crawled exactly if None
+    :param with_statistics: whether to compute the statistics of the values of each field
+    :param instrumentation: if given, the measurement of crawling the file is added to it
     """
-    try:
-        next(storage_manager.retrieve_metadata(file_path))
-    except StopIteration:
-        return False
-    else:
-        return True
+    crawled = None
+    if socket_path is not None and sample is None and instrumentation is None:
+        crawled = remote_crawl(socket_path, abs_path, db_path, with_hash, append_only, with_statistics)
+
+    if crawled is None:
+        from tasks import crawl_and_store
+        crawled = crawl_and_store(abs_path, db_path, workers, with_hash, append_only, sample, with_statistics,
+                                  instrumentation)
+
+    if not crawled:
+        print(f"File '{abs_path}' already crawled", file=sys.stderr)
+        sys.exit(1)
 
 
-def perform_crawling(abs_path: str, db_path: str) -> None:
+def perform_batch_crawling(sources: List[str], db_path: str, workers: Optional[int],
+                           with_hash: bool = False, append_only: bool = False, pipelined: bool = False,
+                           sample: Optional[SampleSize] = None, with_statistics: bool = False,
+                           instrumentation: Optional[Instrumentation] = None) -> None:
     """
-    Extract metadata from abs_path and store it.
+    Extract metadata from several files in parallel and store it.
 
-    :param abs_path: the file to extract metadata from
+    Failures are reported once the whole batch was processed. When pipelined, the
+    statistics of each stage of the pipeline are reported as well.
+
+    :param sources: the directories, glob patterns and files to extract metadata from
     :param db_path: path to the db file. It's created if it doesn't exists.
+    :param workers: the amount of worker processes. Defaults to the amount of CPUs
+    :param with_hash: whether to compare content hashes to detect changes
+    :param append_only: whether files that grew can be assumed to have been appended to
+    :param pipelined: whether to crawl with the pipeline, overlapping disk reads, parsing and storing
+    :param sample: how much of each file to sample, see sampling.sample_file(). Files are crawled exactly if None
+    :param with_statistics: whether to compute the statistics of the values of each field
+    :param instrumentation: if given, the measurement of crawling each file is added to it. Not supported when
+                            pipelined
     """
-    s = MetadataStorageManager(db_path)
-    if is_already_crawled(s, abs_path):
-        print(f"File '{abs_path}' already crawled", file=sys.stderr)
+    from tasks import collect_paths, crawl_batch
+    if pipelined:
+        from pipeline import crawl_pipeline
+        summary = crawl_pipeline(collect_paths(sources), db_path, workers, with_hash, append_only, sample=sample,
+                                 with_statistics=with_statistics)
+        for stage in summary.stages:
+            print(f"Stage '{stage.name}': {stage.items} items, queue depth max {stage.max_depth}, "
+                  f"mean {stage.mean_depth:.1f}", file=sys.stderr)
+    else:
+        summary = crawl_batch(collect_paths(sources), db_path, workers, with_hash, append_only, sample,
+                              with_statistics, instrumentation)
+
+    for path in summary.skipped:
+        print(f"File '{path}' already crawled", file=sys.stderr)
+    for failure in summary.failures:
+        print(f"Could not crawl file '{failure.path}': {failure.reason}", file=sys.stderr)
+    print(f'Crawled: {len(summary.crawled)}, skipped: {len(summary.skipped)}, failed: {len(summary.failures)}')
+
+    if summary.failures:
         sys.exit(1)
 
-    records = extract_metadata_from_file(abs_path)
-    crawled_data = crawl(records)
-    s.store_metadata(abs_path, crawled_data)
+
+def perform_watching(directories: List[str], db_path: str, workers: Optional[int] = None, with_hash: bool = False,
+                     append_only: bool = False, settle: float = 2.0, poll_interval: Optional[float] = None) -> None:
+    """
+    Crawl the supported files under some directories as they are created or modified, until
+    interrupted.
+
+    Every file crawled is reported as soon as it's stored, and every failure as soon as it
+    happens.
+
+    :param directories: the directories to watch, recursively
+    :param db_path: path to the db file. It's created if it doesn't exists.
+    :param workers: the amount of worker processes to crawl big files. Defaults to the amount of CPUs
+    :param with_hash: whether to compare content hashes to detect changes
+    :param append_only: whether files that grew can be assumed to have been appended to
+    :param settle: the seconds a file must be quiet to be crawled
+    :param poll_interval: if given, directories are scanned every <poll_interval> seconds instead of using inotify
+    """
+    from watcher import watch
+    try:
+        for event in watch(directories, db_path, settle, poll_interval, workers, with_hash, append_only):
+            if event.error is None:
+                print(f"Crawled file '{event.path}'", flush=True)
+            else:
+                print(f"Could not crawl file '{event.path}': {event.error}", file=sys.stderr, flush=True)
+    except KeyboardInterrupt:
+        pass
 
 
-def perform_describe(abs_path: str, db_path: str) -> None:
+def perform_describe(abs_path: str, db_path: str, socket_path: Optional[str] = None) -> None:
     """
     Print metadata extracted from a given source file.
 
+    The metadata is retrieved by the daemon listening on socket_path, if any, or in-process.
+
     :param abs_path: the file the metadata was extracted from
     :param db_path: path to the db file. It's created if it doesn't exists.
+    :param socket_path: the path of the socket of the daemon. The metadata is always retrieved in-process if None
     """
-    s = MetadataStorageManager(db_path)
-    metadata = list(s.retrieve_metadata(abs_path))
+    metadata = None
+    if socket_path is not None:
+        metadata = remote_describe(socket_path, abs_path, db_path)
+
+    if metadata is None:
+        from tasks import describe_file
+        metadata = describe_file(abs_path, db_path)
+
     if not metadata:
         print('Could not find metadata for the entered path', file=sys.stderr)
         sys.exit(1)
     pretty_print(abs_path, metadata)
 
 
+def perform_query(prefix: Optional[str], db_path: str, field: Optional[str] = None, type_conflicts: bool = False,
+                  output_format: str = 'text') -> None:
+    """
+    Print the files in the catalog whose path starts with a prefix and that have a field, with
+    their metadata, or the fields whose type differs across those files.
+
+    Results are printed as they are retrieved, in a single pass over the DB.
+
+    :param prefix: the prefix of the paths of the files. Every file matches if None
+    :param db_path: path to the db file. It's created if it doesn't exists.
+    :param field: the name of a field the files must have. Only the metadata of that field is printed
+    :param type_conflicts: whether to print the fields whose type differs across files instead of the files
+    :param output_format: text, csv, or json (a JSON object per line)
+    """
+    from tasks import find_type_conflicts, query_catalog
+    if type_conflicts:
+        printed = print_type_conflicts(find_type_conflicts(db_path, prefix), output_format)
+    else:
+        printed = print_files(query_catalog(db_path, prefix, field), output_format)
+
+    if not printed:
+        print('Could not find metadata matching the query', file=sys.stderr)
+        sys.exit(1)
+
+
+def _metadata_to_dict(m: Metadata) -> dict:
+    return dict(m._asdict(), type=get_human_friendly_type(m.type),
+                statistics=None if m.statistics is None else m.statistics._asdict())
+
+
+def print_files(files: Iterable[FileMetadata], output_format: str = 'text') -> int:
+    """
+    Print files and their metadata, as they are produced
+
+    :param files: the files to print
+    :param output_format: text, csv, or json (a JSON object per line)
+    :return: the amount of files printed
+    """
+    writer = csv.writer(sys.stdout)
+    if output_format == 'csv':
+        writer.writerow(['path', 'field', 'type', 'total_occurrences', 'null_occurrences', 'total_margin',
+                         'null_margin'])
+
+    printed = 0
+    for path, metadata in files:
+        printed += 1
+        if output_format == 'csv':
+            writer.writerows([path, m.field, get_human_friendly_type(m.type), m.total_occurrences,
+                              m.null_occurrences, m.total_margin, m.null_margin] for m in metadata)
+        elif output_format == 'json':
+            print(json.dumps({'path': path, 'fields': [_metadata_to_dict(m) for m in metadata]}))
+        else:
+            print(path)
+            for m in metadata:
+                print(f'\t{m.field}, {get_human_friendly_type(m.type)}, '
+                      f'{m.total_occurrences - m.null_occurrences}, {m.null_occurrences}')
+    return printed
+
+
+def print_type_conflicts(conflicts: Iterable[FieldTypes], output_format: str = 'text') -> int:
+    """
+    Print fields whose type differs across files, as they are produced
+
+    :param conflicts: the fields to print
+    :param output_format: text, csv, or json (a JSON object per line)
+    :return: the amount of fields printed
+    """
+    writer = csv.writer(sys.stdout)
+    if output_format == 'csv':
+        writer.writerow(['field', 'type', 'files'])
+
+    printed = 0
+    for field, types in conflicts:
+        printed += 1
+        if output_format == 'csv':
+            writer.writerows([field, get_human_friendly_type(t), files] for t, files in types)
+        elif output_format == 'json':
+            print(json.dumps({'field': field, 'types': {get_human_friendly_type(t): files for t, files in types}}))
+        else:
+            print(f'{field}: ' + ', '.join(f'{get_human_friendly_type(t)} in {files} file{"s" if files > 1 else ""}'
+                                           for t, files in types))
+    return printed
+
+
 def pretty_print(abs_path: str, metadata: List[Type[Metadata]]) -> None:
     """
     Print a list of metadata objects
 
+    Approximate occurrences are printed with the margin of their 95% confidence interval. The
+    margin of non-null occurrences is the sum of the other two, which bounds it conservatively.
+
     :param abs_path: the file the metadata was extracted from
     :param metadata: the list of registries to print
     """
     print(f'File: {abs_path}')
     print(f'Total entries: {len(metadata)}')
+    if any(m.total_margin is not None for m in metadata):
+        print('Approximate: estimated from a sample, with 95% confidence intervals')
     print('Fields:')
     for m in metadata:
-        print(f'\t{m.field}, {get_human_friendly_type(m.type)}, '
-              f'{m.total_occurrences - m.null_occurrences}, {m.null_occurrences}')
+        if m.total_margin is None:
+            print(f'\t{m.field}, {get_human_friendly_type(m.type)}, '
+                  f'{m.total_occurrences - m.null_occurrences}, {m.null_occurrences}')
+        else:
+            print(f'\t{m.field}, {get_human_friendly_type(m.type)}, '
+                  f'~{m.total_occurrences - m.null_occurrences} (±{m.total_margin + m.null_margin}), '
+                  f'~{m.null_occurrences} (±{m.null_margin})')
+        if m.statistics is not None:
+            print_statistics(m.statistics)
+
+
+def print_statistics(statistics: FieldStatistics) -> None:
+    """
+    Print the statistics of the values of a field, below the field
+
+    :param statistics: the statistics to print
+    """
+    if statistics.mean is not None:
+        print(f'\t\tmin {statistics.minimum}, max {statistics.maximum}, mean {statistics.mean:.6g}, '
+              f'std dev {math.sqrt(statistics.variance):.6g}')
+    if statistics.lengths is not None:
+        print('\t\tlengths: ' + ', '.join(f'<={bound}: {count}' for bound, count in statistics.lengths))
+    print(f'\t\tdistinct: ~{statistics.distinct}')
+    print('\t\ttop values: ' + ', '.join(f'{json.dumps(value)} ({count})' for value, count in statistics.top_values))
+
+
+def report_metrics(instrumentation: Instrumentation, metrics_format: str, output: Optional[str] = None) -> None:
+    """
+    Report the measurements of the files crawled
+
+    :param instrumentation: the measurements to report
+    :param metrics_format: summary, json or prometheus
+    :param output: the file to write the report to. It's printed to stderr if None
+    """
+    if metrics_format == 'json':
+        report = instrumentation.to_json() + '\n'
+    elif metrics_format == 'prometheus':
+        report = instrumentation.to_prometheus()
+    else:
+        report = instrumentation.summary() + '\n'
+
+    if output is None:
+        sys.stderr.write(report)
+    else:
+        with open(output, 'w') as output_file:
+            output_file.write(report)
 
 
 def main():
@@ -102,27 +337,137 @@ def main():
 
     group.add_argument('-c', '--crawl', metavar='FILE_PATH',
                        type=readable_file, help='metadata file to process. Allowed extensions '
-                                                'are "csv" and "json"')
+                                                'are "csv", "json", "jsonl" and "ndjson", optionally '
+                                                'compressed as "gz", "bz2", "xz" or "zst"')
+    group.add_argument('-b', '--batch', metavar='PATH', nargs='+',
+                       type=absolute_path, help='directories, glob patterns or files to process in parallel')
     group.add_argument('-d', '--describe', metavar='FILE_PATH',
                        type=absolute_path, help='metadata file to describe')
+    group.add_argument('-w', '--watch', metavar='DIRECTORY', nargs='+',
+                       type=absolute_path, help='directories to watch, crawling files as they are created or '
+                                                'modified, until interrupted')
+    group.add_argument('-q', '--query', metavar='PREFIX', nargs='?', const='', type=path_prefix,
+                       help='list the files in the database whose path starts with PREFIX (every file by default), '
+                            'with their metadata')
+    group.add_argument('--serve', action='store_true',
+                       help='run a daemon serving crawl and describe requests for the database, until interrupted')
 
     parser.add_argument('--database-path', default='metadata_gather.db',
                         type=absolute_path,
                         help="The database path, metadata_gather.db in your current"
                              "working directory by default")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="The amount of worker processes for parallel crawling, the amount of CPUs by default")
+    parser.add_argument('--hash', action='store_true', dest='with_hash',
+                        help="Also compare content hashes to detect files that did not change since they were "
+                             "crawled, even if their modification time did")
+    parser.add_argument('--append-only', action='store_true',
+                        help="Assume files that grew since they were crawled were only appended to, and crawl "
+                             "just the appended data. With --hash, the previous content is verified")
+    parser.add_argument('--pipeline', action='store_true', dest='pipelined',
+                        help="In batch mode, crawl with a pipeline that overlaps disk reads, parsing and storing, "
+                             "and report the queue depth of each stage")
+    parser.add_argument('--statistics', action='store_true', dest='with_statistics',
+                        help="Also compute statistics of the values of each field in the same pass: min, max, mean "
+                             "and standard deviation of integers, lengths of strings, distinct and top values")
+    parser.add_argument('--sample-fraction', type=float, default=None, metavar='FRACTION',
+                        help="Estimate the metadata of CSV and JSON Lines files from a random sample of at least "
+                             "FRACTION of their bytes, instead of reading them whole")
+    parser.add_argument('--sample-rows', type=int, default=None, metavar='ROWS',
+                        help="Estimate the metadata of CSV and JSON Lines files from a random sample of at least "
+                             "ROWS rows, instead of reading them whole")
+    parser.add_argument('--field', default=None, metavar='NAME',
+                        help="In query mode, only list the files having the field NAME, and only its metadata")
+    parser.add_argument('--type-conflicts', action='store_true',
+                        help="In query mode, list the fields whose type differs across the files instead")
+    parser.add_argument('--format', choices=['text', 'csv', 'json'], default='text', dest='output_format',
+                        help="In query mode, the output format: text (default), csv or json (an object per line)")
+    parser.add_argument('--settle', type=float, default=2.0, metavar='SECONDS',
+                        help="In watch mode, the seconds a file must go unmodified before it's crawled, 2 by default")
+    parser.add_argument('--poll-interval', type=float, default=None, metavar='SECONDS',
+                        help="In watch mode, scan the directories every SECONDS instead of using inotify. Polling is "
+                             "used anyway where inotify is not available")
+    parser.add_argument('--socket', type=absolute_path, default=None,
+                        help="The socket of the daemon, the database path followed by .sock by default. Crawl and "
+                             "describe requests are sent to the daemon when it's running, and processed in-process "
+                             "otherwise")
+    parser.add_argument('--no-daemon', action='store_true',
+                        help="Process crawl and describe requests in-process, even if a daemon is running")
+    parser.add_argument('--metrics', choices=['summary', 'json', 'prometheus'], default=None, metavar='FORMAT',
+                        help="Measure the wall and CPU time of each stage of crawling each file, the bytes read, the "
+                             "values summarized per second and the peak memory, and report them as a summary, json "
+                             "or prometheus text. Files are crawled in-process, and not pipelined")
+    parser.add_argument('--metrics-output', type=absolute_path, default=None, metavar='PATH',
+                        help="Write the metrics to PATH instead of stderr")
+    parser.add_argument('--profile', type=absolute_path, default=None, metavar='PATH',
+                        help="Profile the calling process with cProfile and write the stats to PATH, to be read with "
+                             "the pstats module")
 
     args = parser.parse_args()
 
-    if args.crawl:
-        perform_crawling(args.crawl, args.database_path)
+    sample = SampleSize(getattr(args, 'sample_fraction', None), getattr(args, 'sample_rows', None))
+    if sample.fraction is not None and not 0 < sample.fraction <= 1:
+        parser.error('--sample-fraction must be greater than 0 and at most 1')
+    if sample.rows is not None and sample.rows <= 0:
+        parser.error('--sample-rows must be greater than 0')
+    if sample == (None, None):
+        sample = None
+
+    socket_path = getattr(args, 'socket', None) or default_socket_path(args.database_path)
+    if getattr(args, 'no_daemon', False):
+        socket_path = None
+
+    instrumentation = None
+    metrics_format = getattr(args, 'metrics', None)
+    if metrics_format is not None:
+        if not (args.crawl or args.batch) or getattr(args, 'pipelined', False):
+            parser.error('--metrics is only supported with -c or -b, without --pipeline')
+        instrumentation = Instrumentation()
+
+    profiler = None
+    if getattr(args, 'profile', None) is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        _dispatch(args, sample, socket_path, instrumentation)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if instrumentation is not None:
+            report_metrics(instrumentation, metrics_format, getattr(args, 'metrics_output', None))
+
+
+def _dispatch(args: argparse.Namespace, sample: Optional[SampleSize], socket_path: Optional[str],
+              instrumentation: Optional[Instrumentation]) -> None:
+    if getattr(args, 'serve', False):
+        from daemon import serve
+        serve(args.database_path, socket_path, args.workers)
+    elif args.crawl:
+        perform_crawling(args.crawl, args.database_path, getattr(args, 'workers', None),
+                         getattr(args, 'with_hash', False), getattr(args, 'append_only', False), socket_path, sample,
+                         getattr(args, 'with_statistics', False), instrumentation)
+    elif getattr(args, 'watch', None):
+        perform_watching(args.watch, args.database_path, args.workers, getattr(args, 'with_hash', False),
+                         getattr(args, 'append_only', False), getattr(args, 'settle', 2.0),
+                         getattr(args, 'poll_interval', None))
+    elif args.describe:
+        perform_describe(args.describe, args.database_path, socket_path)
+    elif getattr(args, 'query', None) is not None:
+        perform_query(args.query or None, args.database_path, getattr(args, 'field', None),
+                      getattr(args, 'type_conflicts', False), getattr(args, 'output_format', 'text'))
     else:
-        perform_describe(args.describe, args.database_path)
+        perform_batch_crawling(args.batch, args.database_path, args.workers, getattr(args, 'with_hash', False),
+                               getattr(args, 'append_only', False), getattr(args, 'pipelined', False), sample,
+                               getattr(args, 'with_statistics', False), instrumentation)
 
 
 if __name__ == '__main__':
     try:
         main()
-    except (ExtractionError, CrawlingError, StoringException) as e:
+    except GatherError as e:
         print(str(e), file=sys.stderr)
         sys.exit(1)
     except Exception:
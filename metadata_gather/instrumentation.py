@@ -0,0 +1,320 @@
+"""
+This module isolates the opt-in instrumentation of crawls: the wall and CPU time spent in
+each stage of crawling a file, the bytes it read, the values it summarized and how much the
+peak memory of the process grew while crawling it.
+
+Code that crawls a file marks its stages with stage() and timed(), which do nothing unless
+the file is being measured with measure_file(). Stages nest: the time of a stage does not
+include the time of the stages entered inside it, so the times of the stages of a file add
+up to the time spent crawling it. Measuring is per process and not thread-safe: only one
+file can be measured at a time in a process.
+
+The stages are:
+   - fingerprint -> checking whether the file changed since it was crawled
+   - extract -> reading the file and producing its records or per-column statistics
+   - aggregate -> summarizing the records or statistics into metadata
+   - workers -> waiting for the chunks of the file crawled by worker processes
+   - store -> retrieving and storing metadata in the DB
+   - other -> anything else, e.g. opening and closing the DB
+"""
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+import json
+import resource
+import time
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+# Time spent in a stage while crawling a file, in seconds
+StageMeasurement = namedtuple('StageMeasurement', 'name, wall, cpu')
+
+# The measurement of crawling a file: the time of each stage, the bytes read by the process while
+# crawling it (None where it can't be known), the amount of values summarized and the growth of the
+# peak RSS of the process while crawling it, above its RSS when it started, in KiB
+FileMeasurement = namedtuple('FileMeasurement', 'path, stages, bytes_read, values, peak_rss_growth_kb')
+
+STAGES = ['fingerprint', 'extract', 'aggregate', 'workers', 'store', 'other']
+
+_PROC_IO = '/proc/self/io'
+_PROC_STATUS = '/proc/self/status'
+_PROC_CLEAR_REFS = '/proc/self/clear_refs'
+
+
+def _bytes_read() -> Optional[int]:
+    """
+    :return: the bytes read by this process so far, or None if the OS does not report them
+    """
+    try:
+        with open(_PROC_IO) as io_file:
+            for line in io_file:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _status_kb(key: str) -> Optional[int]:
+    """
+    :param key: the field of the status of this process, e.g. VmRSS
+    :return: the value of the field, in KiB, or None if the OS does not report it
+    """
+    try:
+        with open(_PROC_STATUS) as status_file:
+            for line in status_file:
+                if line.startswith(key + ':'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _reset_peak_rss() -> Optional[int]:
+    """
+    Reset the peak RSS of this process to its current RSS, where the OS allows it.
+
+    :return: the current RSS, in KiB, or None if the peak can't be reset
+    """
+    try:
+        with open(_PROC_CLEAR_REFS, 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        return None
+    return _status_kb('VmRSS')
+
+
+def _max_rss() -> int:
+    """
+    :return: the peak RSS of this process so far, in KiB
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class _FileRecorder:
+    """
+    Help class to accumulate the exclusive time of the stages of a file.
+
+    This class is intended to use inside this module only.
+    """
+    def __init__(self, previous: Optional[FileMeasurement] = None):
+        self.totals = OrderedDict((name, [0.0, 0.0]) for name in STAGES)
+        if previous is not None:
+            for name, wall, cpu in previous.stages:
+                self.totals.setdefault(name, [0.0, 0.0])
+                self.totals[name][0] += wall
+                self.totals[name][1] += cpu
+        self.values = previous.values if previous is not None else 0
+        self._stack = []
+        self._started = None
+
+    def _charge(self) -> None:
+        # charge the time since the last switch to the stage on top of the stack
+        now = time.perf_counter(), time.process_time()
+        if self._stack:
+            total = self.totals.setdefault(self._stack[-1], [0.0, 0.0])
+            total[0] += now[0] - self._started[0]
+            total[1] += now[1] - self._started[1]
+        self._started = now
+
+    def push(self, name: str) -> None:
+        self._charge()
+        self._stack.append(name)
+
+    def pop(self) -> None:
+        self._charge()
+        self._stack.pop()
+
+
+_current: Optional[_FileRecorder] = None
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Charge the time spent inside the context to a stage of the file being measured, if any.
+
+    :param name: the name of the stage
+    """
+    recorder = _current
+    if recorder is None:
+        yield
+        return
+
+    recorder.push(name)
+    try:
+        yield
+    finally:
+        recorder.pop()
+
+
+def timed(iterable: Iterable, name: str) -> Iterable:
+    """
+    Charge the time spent producing each element of an iterable to a stage of the file being
+    measured, if any.
+
+    :param iterable: the iterable to time
+    :param name: the name of the stage
+    :return: an iterable producing the same elements
+    """
+    if _current is None:
+        return iterable
+    return _timed(iter(iterable), name, _current)
+
+
+def _timed(iterator, name: str, recorder: _FileRecorder):
+    while True:
+        recorder.push(name)
+        try:
+            element = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            recorder.pop()
+        yield element
+
+
+def count_values(values: int) -> None:
+    """
+    Account for values summarized while crawling the file being measured, if any.
+
+    :param values: the amount of values
+    """
+    if _current is not None:
+        _current.values += values
+
+
+class _Measurement:
+    """
+    Holds the measurement of a file once measure_file() is done with it.
+    """
+    result: Optional[FileMeasurement] = None
+
+
+@contextmanager
+def measure_file(path: str, previous: Optional[FileMeasurement] = None):
+    """
+    Measure the stages of crawling a file, inside the context.
+
+    :param path: the path of the file
+    :param previous: a measurement of the same file to add to, e.g. taken in another process
+    :return: a context manager whose value holds the FileMeasurement, in its result attribute, on exit
+    """
+    global _current
+    assert _current is None, 'only one file can be measured at a time'
+    measurement = _Measurement()
+    recorder = _FileRecorder(previous)
+    start_bytes = _bytes_read()
+    # without resetting the peak, only its growth beyond the peak of earlier files can be told
+    start_rss = _reset_peak_rss()
+    peak_was_reset = start_rss is not None
+    if not peak_was_reset:
+        start_rss = _max_rss()
+    _current = recorder
+    recorder.push('other')
+    try:
+        yield measurement
+    finally:
+        recorder.pop()
+        _current = None
+        end_bytes = _bytes_read()
+        bytes_read = None if start_bytes is None or end_bytes is None else end_bytes - start_bytes
+        if previous is not None and previous.bytes_read is not None and bytes_read is not None:
+            bytes_read += previous.bytes_read
+        end_rss = _status_kb('VmHWM') if peak_was_reset else None
+        growth = max((_max_rss() if end_rss is None else end_rss) - start_rss, 0)
+        if previous is not None:
+            growth = max(growth, previous.peak_rss_growth_kb)
+        measurement.result = FileMeasurement(
+            path, [StageMeasurement(name, wall, cpu) for name, (wall, cpu) in recorder.totals.items()],
+            bytes_read, recorder.values, growth)
+
+
+def call_measured(func: Callable, path: str, *args, **kwargs) -> Tuple[Any, FileMeasurement]:
+    """
+    Call a function crawling a file, measuring it, e.g. in a worker process.
+
+    :param func: the function to call, with the path of the file as first argument
+    :param path: the path of the file
+    :return: the result of the function, and the measurement
+    """
+    with measure_file(path) as measurement:
+        result = func(path, *args, **kwargs)
+    return result, measurement.result
+
+
+class Instrumentation:
+    """
+    Collects the measurements of the files crawled, and reports them.
+    """
+    def __init__(self):
+        self.files: List[FileMeasurement] = []
+
+    def add(self, measurement: FileMeasurement) -> None:
+        self.files.append(measurement)
+
+    def stage_totals(self) -> List[StageMeasurement]:
+        """
+        :return: the time of each stage, added over every file
+        """
+        totals = OrderedDict((name, [0.0, 0.0]) for name in STAGES)
+        for measurement in self.files:
+            for name, wall, cpu in measurement.stages:
+                total = totals.setdefault(name, [0.0, 0.0])
+                total[0] += wall
+                total[1] += cpu
+        return [StageMeasurement(name, wall, cpu) for name, (wall, cpu) in totals.items()]
+
+    def summary(self) -> str:
+        """
+        :return: a human readable summary, with the totals of every stage and a line per file
+        """
+        lines = ['Stage totals:']
+        for name, wall, cpu in self.stage_totals():
+            lines.append(f'\t{name}: wall {wall:.3f}s, cpu {cpu:.3f}s')
+
+        lines.append('Files:')
+        for m in self.files:
+            wall = sum(s.wall for s in m.stages)
+            rate = m.values / wall if wall else 0.0
+            read = 'unknown' if m.bytes_read is None else f'{m.bytes_read / 2 ** 20:.1f} MiB'
+            lines.append(f'\t{m.path}: wall {wall:.3f}s, read {read}, {m.values} values ({rate:.0f}/s), '
+                         f'peak RSS growth {m.peak_rss_growth_kb / 1024:.1f} MiB')
+            lines.append('\t\t' + ', '.join(f'{s.name} {s.wall:.3f}s' for s in m.stages if s.wall))
+        return '\n'.join(lines)
+
+    def to_json(self) -> str:
+        """
+        :return: every measurement, as a JSON document
+        """
+        return json.dumps({
+            'stages': [s._asdict() for s in self.stage_totals()],
+            'files': [dict(m._asdict(), stages=[s._asdict() for s in m.stages]) for m in self.files],
+        }, indent=2)
+
+    def to_prometheus(self) -> str:
+        """
+        :return: every measurement, in the Prometheus text exposition format
+        """
+        lines = []
+
+        def metric(name: str, kind: str, description: str, samples: Iterable[Tuple[dict, float]]):
+            lines.append(f'# HELP metadata_gather_{name} {description}')
+            lines.append(f'# TYPE metadata_gather_{name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{_escape_label(str(label))}"' for key, label in labels.items())
+                lines.append(f'metadata_gather_{name}{{{label_text}}} {value}')
+
+        metric('stage_wall_seconds', 'counter', 'Wall time spent in each stage of crawling a file.',
+               (({'path': m.path, 'stage': s.name}, s.wall) for m in self.files for s in m.stages))
+        metric('stage_cpu_seconds', 'counter', 'CPU time spent in each stage of crawling a file.',
+               (({'path': m.path, 'stage': s.name}, s.cpu) for m in self.files for s in m.stages))
+        metric('bytes_read', 'counter', 'Bytes read by the process while crawling a file.',
+               (({'path': m.path}, m.bytes_read) for m in self.files if m.bytes_read is not None))
+        metric('values', 'counter', 'Values summarized while crawling a file.',
+               (({'path': m.path}, m.values) for m in self.files))
+        metric('peak_rss_growth_bytes', 'gauge', 'Growth of the peak resident memory while crawling a file.',
+               (({'path': m.path}, m.peak_rss_growth_kb * 1024) for m in self.files))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -2,17 +2,48 @@
 This module isolates all the logic to extract metadata records from allowed sources.
 It exposes the following:
    - extract_metadata_from_file() -> reads a given file and produces the corresponding MetadataRecords
+   - extract_statistics_from_file() -> reads a given file and produces its per-column ColumnStatistics
+   - supports_statistics() -> whether statistics can be extracted from a given file
+   - is_supported_file() -> whether metadata can be extracted from a given file
+   - split_file() -> splits a given file into byte ranges that can be extracted independently
+   - supports_splitting() -> whether a given file can be split
    - ExtractionError -> the exception raised when anything goes wrong
+
+Files compressed with a registered decompressor (gzip, bzip2, xz and, if zstandard is
+installed, zstd) are extracted as their format, e.g. "events.jsonl.gz" as JSON Lines,
+decompressing them on the fly. They can't be split.
 """
-from typing import Generator
+from typing import Generator, List, Optional, Tuple
 
-from common import MetadataRecord
+from common import ColumnStatistics, MetadataRecord
 from .exceptions import ExtractionError
-from .file_extractor import file_extractors
+from .compression import compression_of
+from .file_extractor import decompressors, file_extractors, file_splitters, statistics_extractors
 
 # This imports allows the decorator to register all the allowed extractors
 from . import csv_extractor  # noqa: F401
 from . import json_extractor  # noqa: F401
+from . import jsonl_extractor  # noqa: F401
+
+
+def _get_extension(file_path: str) -> str:
+    """
+    Get the extension of the format of a given file, before the suffix of its compression if
+    it's compressed.
+
+    :param file_path: the path to the file
+    :return: the extension, without the leading dot
+    :raises ExtractionError if the file does not have an extension
+    """
+    if compression_of(file_path) is not None:
+        file_path = file_path.rsplit(".", 1)[0]
+
+    try:
+        _, extension = file_path.rsplit(".", 1)
+    except ValueError:
+        raise ExtractionError(f"The file '{file_path}' does not have an extension")
+
+    return extension
 
 
 def extract_metadata_from_file(file_path: str) -> Generator[MetadataRecord, None, None]:
@@ -20,22 +51,120 @@ def extract_metadata_from_file(file_path: str) -> Generator[MetadataRecord, None
     Extract metadata from a given file.
 
     The extractor is selected according to the extension of the provided file. Allowed
-    extensions are ".csv" and ".json"
+    extensions are ".csv", ".json", ".jsonl" and ".ndjson", optionally followed by the
+    suffix of a compression, e.g. ".csv.gz"
 
     :param file_path: the path to the file to extract metadata from
     :return: a generator object that produces MetadataField objects
     :raises ExtractionError if extraction fails
     """
-    try:
-        _, extension = file_path.rsplit(".", 1)
-    except ValueError:
-        raise ExtractionError(f"The file '{file_path}' does not have an extension")
+    extension = _get_extension(file_path)
 
     try:
         yield from file_extractors[extension](file_path)
     except KeyError:
         raise ExtractionError(f"Unsupported extension '{extension}'. "
-                              f"Allowed extensions are: {', '.join(file_extractors.keys())}")
+                              f"Allowed extensions are: {', '.join(file_extractors.keys())}, optionally "
+                              f"compressed with: {', '.join(decompressors.keys())}")
+
+
+def is_supported_file(file_path: str) -> bool:
+    """
+    Whether metadata can be extracted from a given file.
+
+    :param file_path: the path to the file
+    :return: True if there is an extractor for the extension of the file. False otherwise.
+    """
+    try:
+        return _get_extension(file_path) in file_extractors
+    except ExtractionError:
+        return False
+
+
+def supports_statistics(file_path: str) -> bool:
+    """
+    Whether per-column statistics can be extracted from a given file.
+
+    :param file_path: the path to the file
+    :return: True if there is a columnar extractor for the extension of the file. False otherwise.
+    """
+    try:
+        return _get_extension(file_path) in statistics_extractors
+    except ExtractionError:
+        return False
+
+
+def extract_statistics_from_file(file_path: str, start: Optional[int] = None,
+                                 end: Optional[int] = None) -> Generator[ColumnStatistics, None, None]:
+    """
+    Extract per-column statistics from a given file.
+
+    This avoids producing one record per value, which is much cheaper for columnar
+    formats. Only extensions with a columnar extractor are allowed, see supports_statistics().
+
+    :param file_path: the path to the file to extract statistics from
+    :param start: the offset of a range returned by split_file(). The whole file is processed if None
+    :param end: the end of the range starting at <start>
+    :return: a generator object that produces ColumnStatistics objects
+    :raises ExtractionError if extraction fails
+    """
+    extension = _get_extension(file_path)
+
+    try:
+        extractor = statistics_extractors[extension]
+    except KeyError:
+        raise ExtractionError(f"Unsupported extension '{extension}' for statistics extraction. "
+                              f"Allowed extensions are: {', '.join(statistics_extractors.keys())}")
+
+    if start is None:
+        yield from extractor(file_path)
+    elif compression_of(file_path) is not None:
+        raise ExtractionError(f"The compressed file '{file_path}' can't be extracted by ranges")
+    else:
+        yield from extractor(file_path, start, end)
+
+
+def supports_splitting(file_path: str) -> bool:
+    """
+    Whether a given file can be split into ranges extracted independently.
+
+    :param file_path: the path to the file
+    :return: True if there is a file splitter for the extension of the file, and it's not compressed. False
+             otherwise.
+    """
+    if compression_of(file_path) is not None:
+        return False
+
+    try:
+        return _get_extension(file_path) in file_splitters
+    except ExtractionError:
+        return False
+
+
+def split_file(file_path: str, chunks: int) -> List[Tuple[int, int]]:
+    """
+    Split a given file into byte ranges that can be extracted independently.
+
+    Extracting every range, in order, produces the same result as extracting the whole
+    file. Only extensions with a file splitter are allowed, see supports_splitting().
+
+    :param file_path: the path to the file to split
+    :param chunks: the amount of ranges wanted. Fewer ranges may be returned
+    :return: a list of (start, end) byte offsets
+    :raises ExtractionError if splitting fails
+    """
+    extension = _get_extension(file_path)
+    if compression_of(file_path) is not None:
+        raise ExtractionError(f"The compressed file '{file_path}' can't be split")
+
+    try:
+        splitter = file_splitters[extension]
+    except KeyError:
+        raise ExtractionError(f"Unsupported extension '{extension}' for splitting. "
+                              f"Allowed extensions are: {', '.join(file_splitters.keys())}")
+
+    return splitter(file_path, chunks)
 
 
-__all__ = [extract_metadata_from_file, ExtractionError]
+__all__ = [extract_metadata_from_file, extract_statistics_from_file, is_supported_file, split_file,
+           supports_splitting, supports_statistics, ExtractionError]
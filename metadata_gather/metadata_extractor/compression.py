@@ -0,0 +1,104 @@
+"""
+Transparent decompression of compressed files, streamed as they are read.
+
+A compressed file is named after its format followed by the suffix of its compression, e.g.
+"events.jsonl.gz". Extractors open files with open_text(), which decompresses them on the fly
+when their suffix has a registered decompressor, so a compressed file is never decompressed to
+disk nor fully held in memory. Compressed files can't be split into byte ranges.
+"""
+import bz2
+import gzip
+import io
+import lzma
+import zlib
+from typing import Optional, TextIO
+
+from .exceptions import ExtractionError
+from .file_extractor import decompressor, decompressors
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bytes of decompressed content buffered at once
+_BUFFER_SIZE = 256 * 1024
+
+_DECOMPRESSION_ERRORS = (OSError, EOFError, zlib.error, lzma.LZMAError) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+@decompressor('gz')
+def _open_gzip(file_path: str):
+    return gzip.open(file_path, mode='rb')
+
+
+@decompressor('bz2')
+def _open_bz2(file_path: str):
+    return bz2.open(file_path, mode='rb')
+
+
+@decompressor('xz')
+def _open_xz(file_path: str):
+    return lzma.open(file_path, mode='rb')
+
+
+if zstandard is not None:
+    @decompressor('zst')
+    def _open_zstd(file_path: str):
+        raw = open(file_path, mode='rb')
+        try:
+            return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        except Exception:
+            raw.close()
+            raise
+
+
+class _DecompressingReader(io.RawIOBase):
+    """
+    Raw stream reading the decompressed content of a file, reporting corrupted or truncated
+    content as an ExtractionError.
+    """
+    def __init__(self, stream, file_path: str):
+        super().__init__()
+        self._stream = stream
+        self._file_path = file_path
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        try:
+            return self._stream.readinto(b)
+        except _DECOMPRESSION_ERRORS as e:
+            raise ExtractionError(f"Could not decompress file '{self._file_path}': {e}")
+
+    def close(self):
+        self._stream.close()
+        super().close()
+
+
+def compression_of(file_path: str) -> Optional[str]:
+    """
+    Get the compression of a given file, from its suffix.
+
+    :param file_path: the path to the file
+    :return: the suffix of the compression, without the leading dot, or None if the file is not compressed
+    """
+    suffix = file_path.rpartition('.')[2]
+    return suffix if suffix in decompressors else None
+
+
+def open_text(file_path: str, newline: Optional[str] = '') -> TextIO:
+    """
+    Open a file as a text stream, decompressing it on the fly if it's compressed.
+
+    :param file_path: the path to the file
+    :param newline: how to translate line endings, as open() does
+    :return: a text stream
+    """
+    compression = compression_of(file_path)
+    if compression is None:
+        return open(file_path, mode='r', newline=newline)
+
+    raw = _DecompressingReader(decompressors[compression](file_path), file_path)
+    return io.TextIOWrapper(io.BufferedReader(raw, _BUFFER_SIZE), newline=newline)
@@ -1,10 +1,38 @@
-from csv import Error, DictReader, QUOTE_NONE
-from typing import Generator, Union
+from contextlib import contextmanager
+from csv import Error, DictReader, QUOTE_NONE, reader
+from datetime import date, datetime, timedelta, timezone
+import io
+import locale
+import mmap
+import operator
+import os
+import re
+from typing import BinaryIO, Callable, Generator, Iterator, List, Optional, Tuple, Union
 
-from common import MetadataRecord
+from common import ColumnStatistics, MetadataRecord
 
 from .exceptions import ExtractionError
-from .file_extractor import file_extractor
+from .compression import compression_of, open_text
+from .file_chunks import count_lines, open_range, split_on_lines
+from .file_extractor import file_extractor, file_splitter, statistics_extractor
+
+# Bytes of a file mapped in memory at once by the mapped scanner, which bounds the memory it maps
+_WINDOW_SIZE = 16 * 1024 * 1024
+
+# Bytes of whole lines classified at once by the mapped scanner
+_SCAN_BLOCK_SIZE = 1024 * 1024
+
+# A number with a fraction or an exponent
+_FLOAT = re.compile(r'[+-]?(?:[0-9]+\.[0-9]*|\.[0-9]+|[0-9]+)(?:[eE][+-]?[0-9]+)?')
+
+_BOOLEANS = {'true': True, 'false': False}
+
+# An ISO 8601 date, optionally followed by a time, with optional fractions of a second and UTC offset
+_DATE_TIME = re.compile(r'([0-9]{4})-([0-9]{2})-([0-9]{2})'
+                        r'(?:[T ]([0-9]{2}):([0-9]{2}):([0-9]{2})(?:\.([0-9]{1,6}))?(Z|[+-][0-9]{2}:[0-9]{2})?)?')
+
+# Drops the first decimal point of a cell, so the cells of numbers with a fraction are digits
+_DROP_POINT = operator.methodcaller('replace', b'.', b'', 1)
 
 
 def _sanitize_key(column_name: str) -> str:
@@ -18,12 +46,52 @@ def _sanitize_key(column_name: str) -> str:
     return column_name.strip('" ')
 
 
-def _sanitize_value(value: str) -> Union[int, str, None]:
+def _parse_unquoted(value: str) -> Union[float, bool, date, datetime]:
+    """
+    Parse a value read from a CSV file that is not a string, null nor an integer. Checks are
+    precompiled and made in order:
+     * a number with a fraction or an exponent -> float
+     * true or false, in any case -> bool
+     * an ISO 8601 date, YYYY-MM-DD -> date
+     * an ISO 8601 timestamp, YYYY-MM-DD HH:MM:SS or with a T separator, with optional fractions
+       of a second and UTC offset (Z or +HH:MM) -> datetime
+
+    :param value: the value to parse, without leading and trailing spaces
+    :return: the parsed value
+    :raises ValueError if the value has none of the types, or it's not a valid date or timestamp
+    """
+    if _FLOAT.fullmatch(value):
+        return float(value)
+
+    boolean = _BOOLEANS.get(value.lower())
+    if boolean is not None:
+        return boolean
+
+    match = _DATE_TIME.fullmatch(value)
+    if match is None:
+        raise ValueError(value)
+
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    if hour is None:
+        return date(int(year), int(month), int(day))
+
+    tz = None
+    if offset == 'Z':
+        tz = timezone.utc
+    elif offset is not None:
+        sign = -1 if offset[0] == '-' else 1
+        tz = timezone(sign * timedelta(hours=int(offset[1:3]), minutes=int(offset[4:6])))
+    return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                    int(fraction.ljust(6, '0')) if fraction else 0, tz)
+
+
+def _sanitize_value(value: str) -> Union[int, str, None, float, bool, date, datetime]:
     """
     Sanitize a value read from a CSV file as following:
-     * if its equal to 'null' -> None
      * if starts with quote -> str
-     * otherwise -> int - if casting fails, a ValueError is raised
+     * if its equal to 'null' -> None
+     * if casting to int succeeds -> int
+     * otherwise, see _parse_unquoted() - if parsing fails, a ValueError is raised
 
     :param value: the value to sanitize
     :return: sanitized value
@@ -36,7 +104,10 @@ def _sanitize_value(value: str) -> Union[int, str, None]:
     if value.lower() == 'null':
         return None
 
-    return int(value)
+    try:
+        return int(value)
+    except ValueError:
+        return _parse_unquoted(value)
 
 
 def _perform_extraction(file_path: str) -> Generator[MetadataRecord, None, None]:
@@ -50,7 +121,7 @@ def _perform_extraction(file_path: str) -> Generator[MetadataRecord, None, None]
     :return: a generator object that produces MetadataField objects
     :raises ExtractionError if extraction fails
     """
-    with open(file_path, newline='', mode='r') as csv_file:
+    with open_text(file_path) as csv_file:
         csv_reader = DictReader(csv_file, delimiter=',', quoting=QUOTE_NONE)
         for row in csv_reader:
             for key, value in row.items():
@@ -71,20 +142,286 @@ def _perform_extraction(file_path: str) -> Generator[MetadataRecord, None, None]
                 yield MetadataRecord(key, value)
 
 
-@file_extractor("csv")
-def extract_data_from_csv(file_path: str) -> Generator[MetadataRecord, None, None]:
+def _scan_statistics(header: List[str], csv_reader: Iterator[List[str]],
+                     line_number: Callable[[], int]) -> List[ColumnStatistics]:
     """
-    Perform the extraction of records from the given CSV file.
+    Compute per-column statistics from the rows produced by a CSV reader.
 
-    The returned generator object produces N * M MetadataRecord for a CSV
-    with N columns and M rows.
+    Column names are sanitized once from the header, and cells are only classified
+    by type, as _sanitize_value() does, so no record is created for them. Rows and
+    cells are validated exactly as _perform_extraction does, raising the same errors.
 
-    :param file_path: the path to the file to create records from
-    :return: a generator object that produces MetadataField objects
+    :param header: the columns of the CSV, as read from its first line
+    :param csv_reader: the reader producing the rows to compute statistics from
+    :param line_number: a callable returning the line number of the last row read, for errors
+    :return: a list with one ColumnStatistics for each column, empty if there are no rows
+    :raises ExtractionError if extraction fails
+    """
+    # as DictReader does, a repeated column name takes the value of its last occurrence
+    last_index = {name: idx for idx, name in enumerate(header)}
+    names = [_sanitize_key(name) for name in last_index]
+    indexes = list(last_index.values())
+    width = len(header)
+
+    rows = 0
+    nulls = [0] * len(names)
+    # integers and strings are the most common types, flagged without hashing them
+    has_int = [False] * len(names)
+    has_str = [False] * len(names)
+    other_types = [dict() for _ in names]
+    for row in csv_reader:
+        if not row:
+            continue
+        rows += 1
+
+        # a missing value raises IndexError, reported as an unexpected error like _perform_extraction does
+        for slot, idx in enumerate(indexes):
+            value = row[idx].strip(' ')
+            if value.startswith('"'):
+                has_str[slot] = True
+            elif value.lower() == 'null':
+                nulls[slot] += 1
+            else:
+                try:
+                    int(value)
+                except ValueError:
+                    try:
+                        other_types[slot][type(_parse_unquoted(value))] = None
+                    except ValueError:
+                        if not row[idx]:
+                            raise ExtractionError(f"Missing value for column '{names[slot]}' at line "
+                                                  f"{line_number()}")
+                        else:
+                            raise ExtractionError(f"Unknown type for value '{row[idx]}' (column '{names[slot]}') "
+                                                  f"at line {line_number()}")
+                else:
+                    has_int[slot] = True
+
+        if len(row) > width:
+            raise ExtractionError(f"Missing column name for value {row[width:]} at line {line_number()}")
+
+    if not rows:
+        return []
+
+    return [ColumnStatistics(name, rows, nulls[slot],
+                             (int,) * has_int[slot] + (str,) * has_str[slot] + tuple(other_types[slot]))
+            for slot, name in enumerate(names)]
+
+
+def _mapped_blocks(f: BinaryIO, start: int, end: int) -> Iterator[bytes]:
+    """
+    Read the bytes of a file in [start, end) as blocks of whole lines.
+
+    The file is mapped in memory one window at a time, so the pages of the file mapped (which
+    count towards the RSS of the process) are bounded by the size of a window.
+
+    :param f: the file, opened in binary mode
+    :param start: the offset of the first byte to read. It must be a line boundary
+    :param end: the offset past the last byte to read
+    :return: an iterator of blocks, each ending after a line break, except maybe the last one
+    """
+    pos = start
+    window_size = _WINDOW_SIZE
+    while pos < end:
+        offset = pos - pos % mmap.ALLOCATIONGRANULARITY
+        length = min(end - offset, window_size)
+        progressed = False
+        with mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ, offset=offset) as window:
+            window_end = offset + length
+            while pos < window_end:
+                stop = min(pos + _SCAN_BLOCK_SIZE, window_end)
+                if stop < end:
+                    line_break = window.rfind(b'\n', pos - offset, stop - offset)
+                    if line_break < 0:
+                        line_break = window.find(b'\n', stop - offset)
+                    if line_break >= 0:
+                        stop = offset + line_break + 1
+                    elif window_end == end:
+                        # the last line of the range has no line break
+                        stop = end
+                    else:
+                        # the rest of the window is part of a line that ends after it
+                        break
+                yield window[pos - offset:stop - offset]
+                pos = stop
+                progressed = True
+
+        # a line longer than a window needs a bigger one
+        window_size = _WINDOW_SIZE if progressed else 2 * window_size
+
+
+def _classify_block(block: bytes, width: int,
+                    indexes: List[int]) -> Optional[Tuple[int, List[Tuple[int, Tuple[type, ...]]]]]:
+    """
+    Classify the cells of a block of lines column by column, without decoding them.
+
+    Only the cells that are exactly null, true or false, start with a quote or are made of ASCII
+    digits (after an optional minus sign, and with an optional decimal point) are classified,
+    with operations that loop in C over whole columns. Any other cell (padded with spaces, with
+    an exponent, a date, invalid...) may need the exact rules, or an error reported on its line.
+
+    :param block: whole lines of a CSV file
+    :param width: the amount of columns of the header
+    :param indexes: the index of the cells of each column to classify
+    :return: the amount of rows, and the amount of null cells and the types of the other cells of each column, or
+             None if some cell or row can't be classified this way
+    """
+    if b'\r' in block:
+        if block.count(b'\r') != block.count(b'\r\n'):
+            return None
+        block = block.replace(b'\r\n', b'\n')
+
+    rows = [line.split(b',') for line in block.split(b'\n') if line]
+    if not rows:
+        return 0, [(0, ())] * len(indexes)
+    if set(map(len, rows)) != {width}:
+        return None
+
+    columns = list(zip(*rows))
+    counts = []
+    for idx in indexes:
+        column = columns[idx]
+        lines = b'\n' + b'\n'.join(column)
+        nulls = column.count(b'null')
+        quoted = lines.count(b'\n"')
+        booleans = column.count(b'true') + column.count(b'false')
+        if lines.count(b'\n-'):
+            # negative numbers are digits once their sign is dropped
+            column = lines.replace(b'\n-', b'\n').split(b'\n')
+        digits = sum(map(bytes.isdigit, column))
+        floats = 0
+        if nulls + quoted + booleans + digits != len(rows):
+            floats = sum(map(bytes.isdigit, map(_DROP_POINT, column))) - digits
+            if nulls + quoted + booleans + digits + floats != len(rows):
+                return None
+        counts.append((nulls, (int,) * (digits > 0) + (str,) * (quoted > 0) + (float,) * (floats > 0)
+                       + (bool,) * (booleans > 0)))
+
+    return len(rows), counts
+
+
+def _scan_mapped_statistics(header: List[str], f: BinaryIO, start: int, end: int,
+                            lines_before: Callable[[], int]) -> List[ColumnStatistics]:
+    """
+    Compute per-column statistics from the rows of a CSV file in [start, end), mapped in memory.
+
+    Blocks of rows are classified as bytes, see _classify_block(). Blocks with any cell that
+    can't be classified that way are decoded and scanned by _scan_statistics(), so cells are
+    classified and errors are reported exactly as with any other reader. Unlike decoding the
+    file, this doesn't detect bytes that are not valid in its encoding inside classified cells.
+
+    :param header: the columns of the CSV, as read from its first line
+    :param f: the file, opened in binary mode
+    :param start: the offset of the first row. It must be a line boundary
+    :param end: the offset past the last row
+    :param lines_before: a callable returning the amount of lines before start, for errors
+    :return: a list with one ColumnStatistics for each column, empty if there are no rows
+    :raises ExtractionError if extraction fails
+    """
+    last_index = {name: idx for idx, name in enumerate(header)}
+    names = [_sanitize_key(name) for name in last_index]
+    indexes = list(last_index.values())
+    encoding = locale.getpreferredencoding(False)
+
+    rows = 0
+    nulls = [0] * len(names)
+    types = [dict() for _ in names]
+    block_lines = 0
+    for block in _mapped_blocks(f, start, end):
+        classified = _classify_block(block, len(header), indexes)
+        if classified is not None:
+            block_rows, columns = classified
+        else:
+            block_reader = reader(io.StringIO(block.decode(encoding), newline=''), delimiter=',', quoting=QUOTE_NONE)
+            first_line = block_lines
+            statistics = _scan_statistics(header, block_reader,
+                                          lambda: lines_before() + first_line + block_reader.line_num)
+            block_rows = statistics[0].occurrences if statistics else 0
+            columns = [(column.nulls, column.types) for column in statistics]
+
+        for slot, (null_cells, column_types) in enumerate(columns):
+            nulls[slot] += null_cells
+            types[slot].update(dict.fromkeys(column_types))
+        rows += block_rows
+        block_lines += block.count(b'\n')
+
+    if not rows:
+        return []
+
+    # the same order as _scan_statistics(): integers and strings first, then the other types as found
+    return [ColumnStatistics(name, rows, nulls[slot], (int,) * (int in types[slot]) + (str,) * (str in types[slot])
+                             + tuple(t for t in types[slot] if t is not int and t is not str))
+            for slot, name in enumerate(names)]
+
+
+def _perform_mapped_statistics_extraction(file_path: str, start: Optional[int] = None,
+                                          end: Optional[int] = None) -> Optional[List[ColumnStatistics]]:
+    """
+    Perform the extraction of per-column statistics from the given CSV file, mapped in memory.
+
+    :param file_path: the path to the file to compute statistics from
+    :param start: the offset of the first row to process. All rows are processed if None
+    :param end: the offset past the last row to process
+    :return: a list with one ColumnStatistics for each column, or None if the header can't be read as bytes
+    :raises ExtractionError if extraction fails
+    """
+    with open(file_path, mode='rb') as f:
+        first_line = f.readline()
+        if not first_line.rstrip(b'\r\n') or b'\r' in first_line.rstrip(b'\r\n'):
+            # empty files, and headers the text reader would split differently
+            return None
+
+        header = next(reader([first_line.decode(locale.getpreferredencoding(False))], delimiter=',',
+                             quoting=QUOTE_NONE))
+        if start is None:
+            start, end = f.tell(), os.fstat(f.fileno()).st_size
+        return _scan_mapped_statistics(header, f, start, end, lambda: count_lines(file_path, start))
+
+
+def _perform_statistics_extraction(file_path: str, start: Optional[int] = None,
+                                   end: Optional[int] = None) -> List[ColumnStatistics]:
+    """
+    Perform the extraction of per-column statistics from the given CSV file.
+
+    Uncompressed files are mapped in memory and scanned as bytes, see _scan_mapped_statistics().
+
+    :param file_path: the path to the file to compute statistics from
+    :param start: the offset of the first row to process. All rows are processed if None
+    :param end: the offset past the last row to process
+    :return: a list with one ColumnStatistics for each column
     :raises ExtractionError if extraction fails
     """
+    if compression_of(file_path) is None:
+        statistics = _perform_mapped_statistics_extraction(file_path, start, end)
+        if statistics is not None:
+            return statistics
+
+    with open_text(file_path) as csv_file:
+        csv_reader = reader(csv_file, delimiter=',', quoting=QUOTE_NONE)
+        try:
+            header = next(csv_reader)
+        except StopIteration:
+            return []
+
+        if start is None:
+            return _scan_statistics(header, csv_reader, lambda: csv_reader.line_num)
+
+    with open_range(file_path, start, end) as range_file:
+        range_reader = reader(range_file, delimiter=',', quoting=QUOTE_NONE)
+        # lines before the range are only counted when an error must be reported
+        return _scan_statistics(header, range_reader,
+                                lambda: count_lines(file_path, start) + range_reader.line_num)
+
+
+@contextmanager
+def _extraction_errors(file_path: str):
+    """
+    Translate any error raised while processing the given CSV file into an ExtractionError.
+
+    :param file_path: the path to the file being processed
+    """
     try:
-        yield from _perform_extraction(file_path)
+        yield
     except ExtractionError:
         raise
     except IOError:
@@ -93,3 +430,57 @@ def extract_data_from_csv(file_path: str) -> Generator[MetadataRecord, None, Non
         raise ExtractionError(f"The file '{file_path}' is not a valid CSV")
     except Exception:
         raise ExtractionError(f"Unexpected error while processing CSV file '{file_path}'")
+
+
+@file_extractor("csv")
+def extract_data_from_csv(file_path: str) -> Generator[MetadataRecord, None, None]:
+    """
+    Perform the extraction of records from the given CSV file.
+
+    The returned generator object produces N * M MetadataRecord for a CSV
+    with N columns and M rows.
+
+    :param file_path: the path to the file to create records from
+    :return: a generator object that produces MetadataField objects
+    :raises ExtractionError if extraction fails
+    """
+    with _extraction_errors(file_path):
+        yield from _perform_extraction(file_path)
+
+
+@statistics_extractor("csv")
+def extract_statistics_from_csv(file_path: str, start: Optional[int] = None,
+                                end: Optional[int] = None) -> Generator[ColumnStatistics, None, None]:
+    """
+    Perform the extraction of per-column statistics from the given CSV file.
+
+    The returned generator object produces one ColumnStatistics for each column
+    of the CSV, and none if it has no rows.
+
+    :param file_path: the path to the file to compute statistics from
+    :param start: the offset of a range returned by split_csv_file(). All rows are processed if None
+    :param end: the end of the range starting at <start>
+    :return: a generator object that produces ColumnStatistics objects
+    :raises ExtractionError if extraction fails
+    """
+    with _extraction_errors(file_path):
+        yield from _perform_statistics_extraction(file_path, start, end)
+
+
+@file_splitter("csv")
+def split_csv_file(file_path: str, chunks: int) -> List[Tuple[int, int]]:
+    """
+    Split the rows of the given CSV file into byte ranges aligned to line boundaries.
+
+    The header is not part of any range: extract_statistics_from_csv() reads it from
+    the beginning of the file for every range.
+
+    :param file_path: the path to the file to split
+    :param chunks: the amount of ranges wanted. Fewer ranges may be returned
+    :return: a list of (start, end) byte offsets
+    :raises ExtractionError if splitting fails
+    """
+    with _extraction_errors(file_path):
+        with open(file_path, mode='rb') as csv_file:
+            csv_file.readline()
+            return split_on_lines(file_path, chunks, csv_file.tell())
@@ -1,4 +1,7 @@
-class ExtractionError(Exception):
+from common import GatherError
+
+
+class ExtractionError(GatherError):
     """
     Base exception for extraction errors
     """
@@ -0,0 +1,111 @@
+"""
+Helpers to process a file in independent chunks, split on line boundaries.
+"""
+import io
+import os
+from typing import List, TextIO, Tuple
+
+# Amount of bytes read at once while scanning a file
+_BLOCK_SIZE = 1024 * 1024
+
+
+class _RangeReader(io.RawIOBase):
+    """
+    Raw stream that reads a limited amount of bytes from another binary stream.
+    """
+    def __init__(self, raw, length: int):
+        super().__init__()
+        self._raw = raw
+        self._remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._remaining <= 0:
+            return 0
+
+        with memoryview(b) as view:
+            read = self._raw.readinto(view[:self._remaining])
+        self._remaining -= read
+        return read
+
+    def close(self):
+        self._raw.close()
+        super().close()
+
+
+def open_range(file_path: str, start: int, end: int) -> TextIO:
+    """
+    Open the bytes of a file in [start, end) as a text stream.
+
+    The stream is opened as open() does with newline='', so start and end must be
+    line boundaries.
+
+    :param file_path: the path to the file
+    :param start: the offset of the first byte of the range
+    :param end: the offset past the last byte of the range
+    :return: a text stream for the range
+    """
+    raw = open(file_path, mode='rb', buffering=0)
+    try:
+        raw.seek(start)
+        return io.TextIOWrapper(io.BufferedReader(_RangeReader(raw, end - start)), newline='')
+    except Exception:
+        raw.close()
+        raise
+
+
+def split_on_lines(file_path: str, chunks: int, start: int = 0) -> List[Tuple[int, int]]:
+    """
+    Split the bytes of a file from start to its end into ranges of similar size, aligned
+    to line boundaries.
+
+    Fewer ranges than requested are returned when lines are too long to split the file
+    in that many ranges.
+
+    :param file_path: the path to the file
+    :param chunks: the amount of ranges wanted
+    :param start: the offset where the first range begins. It must be a line boundary
+    :return: a list of (start, end) offsets, in order
+    """
+    size = os.path.getsize(file_path)
+    boundaries = [start]
+
+    with open(file_path, mode='rb') as f:
+        for idx in range(1, chunks):
+            offset = start + (size - start) * idx // chunks
+            if offset <= boundaries[-1]:
+                continue
+
+            # a boundary is the offset after a line break. Starting from the previous byte
+            # keeps the offset when it is a boundary already
+            f.seek(offset - 1)
+            f.readline()
+            boundary = f.tell()
+            if boundaries[-1] < boundary < size:
+                boundaries.append(boundary)
+
+    boundaries.append(max(size, start))
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def count_lines(file_path: str, end: int) -> int:
+    """
+    Count the line breaks of a file before a given offset.
+
+    :param file_path: the path to the file
+    :param end: the offset where to stop counting
+    :return: the amount of line breaks found
+    """
+    lines = 0
+    with open(file_path, mode='rb') as f:
+        remaining = end
+        while remaining > 0:
+            block = f.read(min(_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            lines += block.count(b'\n')
+            remaining -= len(block)
+
+    return lines
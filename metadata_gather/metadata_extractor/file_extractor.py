@@ -1,5 +1,11 @@
 file_extractors = {}
 
+statistics_extractors = {}
+
+file_splitters = {}
+
+decompressors = {}
+
 
 def file_extractor(extension):
     """
@@ -15,3 +21,54 @@ def file_extractor(extension):
         file_extractors[extension] = f
         return f
     return deco
+
+
+def statistics_extractor(extension):
+    """
+    This decorator registers functions to be used as columnar extractors.
+
+    Columnar extractors produce one ColumnStatistics per column instead of one
+    record per value. They are optional: a format is always required to have a
+    regular extractor, registered with file_extractor.
+
+    :param extension: the extension to match
+    """
+    def deco(f):
+        assert extension not in statistics_extractors, f"extension {extension} already registered"
+        statistics_extractors[extension] = f
+        return f
+    return deco
+
+
+def file_splitter(extension):
+    """
+    This decorator registers functions to be used as file splitters.
+
+    A file splitter receives a file path and an amount of chunks, and returns byte
+    ranges that the extractors of the same extension can process independently,
+    through their start and end arguments.
+
+    :param extension: the extension to match
+    """
+    def deco(f):
+        assert extension not in file_splitters, f"extension {extension} already registered"
+        file_splitters[extension] = f
+        return f
+    return deco
+
+
+def decompressor(suffix):
+    """
+    This decorator registers functions to be used as decompressors.
+
+    A decompressor receives a file path and returns a binary stream of its decompressed
+    content, read as it's decompressed. Files whose path ends with a registered suffix
+    after the extension of their format (e.g. "csv.gz") are extracted through it.
+
+    :param suffix: the suffix to match, without the leading dot
+    """
+    def deco(f):
+        assert suffix not in decompressors, f"suffix {suffix} already registered"
+        decompressors[suffix] = f
+        return f
+    return deco
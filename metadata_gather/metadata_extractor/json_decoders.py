@@ -0,0 +1,79 @@
+"""
+Pluggable JSON decoders used by the JSON extractors.
+
+A decoder is a function that decodes a complete JSON document from a string. The
+standard library decoder is always available, and faster ones are registered when
+their packages are installed. Every decoder must produce the same values as the
+standard library does, or raise a ValueError. Decoders may be stricter than the
+standard library (e.g. with integers bigger than 64 bits or NaN), so documents they
+reject are decoded again by the standard library, which decides what is invalid.
+"""
+import json
+import os
+from typing import Any, Callable, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+json_decoders = {}
+
+# Decoders in order of preference, the first one registered is used by default
+_PREFERENCE = ['orjson', 'stdlib']
+
+# Environment variable to force the use of a given decoder
+DECODER_ENV_VAR = 'METADATA_GATHER_JSON_DECODER'
+
+STDLIB = 'stdlib'
+
+
+def json_decoder(name):
+    """
+    This decorator registers functions to be used as JSON decoders.
+
+    :param name: the name of the decoder
+    """
+    def deco(f):
+        assert name not in json_decoders, f"decoder {name} already registered"
+        json_decoders[name] = f
+        return f
+    return deco
+
+
+@json_decoder(STDLIB)
+def _stdlib_loads(document: str) -> Any:
+    return json.loads(document)
+
+
+if orjson is not None:
+    json_decoder('orjson')(orjson.loads)
+
+
+def get_json_decoder(name: Optional[str] = None) -> str:
+    """
+    Resolve the name of the JSON decoder to use.
+
+    :param name: the name of the decoder. When None, the one in the METADATA_GATHER_JSON_DECODER
+    environment variable is used, or else the fastest one registered
+    :return: the name of a registered decoder
+    :raises ValueError if the decoder is not registered
+    """
+    name = name or os.environ.get(DECODER_ENV_VAR)
+    if name is None:
+        return next(preferred for preferred in _PREFERENCE if preferred in json_decoders)
+
+    if name not in json_decoders:
+        raise ValueError(f"Unknown JSON decoder '{name}'. Available decoders are: {', '.join(json_decoders)}")
+    return name
+
+
+def get_loads(name: Optional[str] = None) -> Callable[[str], Any]:
+    """
+    Get the function of a JSON decoder, see get_json_decoder().
+
+    :param name: the name of the decoder
+    :return: a function that decodes a JSON document
+    :raises ValueError if the decoder is not registered
+    """
+    return json_decoders[get_json_decoder(name)]
@@ -1,34 +1,241 @@
 from collections.abc import Mapping
 import json
-from typing import Generator
+import re
+from typing import Any, Generator, Iterator, List, Optional, TextIO, Tuple
 
 from common import MetadataRecord
 
+from .compression import open_text
 from .exceptions import ExtractionError
 from .file_extractor import file_extractor
+from .json_decoders import STDLIB, get_json_decoder, json_decoders
+from .json_paths import JSONFlattener
 
+# Amount of characters read from the file at once
+_CHUNK_SIZE = 64 * 1024
 
-def _perform_extractor(file_path: str) -> Generator[MetadataRecord, None, None]:
+# Characters buffered, at least, to decode an element before it's deemed invalid. Elements up to
+# twice the biggest one decoded so far are buffered as well
+_MAX_ELEMENT_SIZE = 16 * 2 ** 20
+
+# Characters a JSON value can start with (besides '[')
+_VALUE_START = '{"-0123456789tfn'
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# A delimiter between array elements (or the closing bracket) surrounded by whitespaces
+_DELIMITER = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+
+# Amount of candidate ends tried when decoding the elements of a chunk at once
+_BATCH_ATTEMPTS = 3
+
+_decoder = json.JSONDecoder()
+
+
+class _JSONArrayStream:
     """
-    Perform the extraction of records from the given JSON file.
+    Help class to decode the elements of a top-level JSON array one by one.
+
+    Only the element being decoded and the pending part of the last chunk read are kept
+    in memory, so the memory used does not depend on the size of the file. An element that
+    can't be decoded is deemed invalid once it's bigger than _MAX_ELEMENT_SIZE and twice the
+    biggest element decoded so far, so an early syntax error does not buffer the rest of the file.
+
+    This class is intended to use inside this module only.
+    """
+    __slots__ = '_file', '_chunk_size', '_loads', '_buffer', '_pos', '_eof', '_largest'
+
+    def __init__(self, json_file: TextIO, chunk_size: int = _CHUNK_SIZE, decoder: str = STDLIB):
+        """
+        :param json_file: the file to read the array from
+        :param chunk_size: the amount of characters read at once
+        :param decoder: the name of the JSON decoder used for the elements that are fully in a chunk
+        """
+        self._file = json_file
+        self._chunk_size = chunk_size
+        self._loads = None if decoder == STDLIB else json_decoders[decoder]
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        # elements bigger than a chunk are always decoded by _decode(), which keeps track of them
+        self._largest = 0
+
+    def _fill(self) -> bool:
+        """
+        Discard the consumed part of the buffer and append a new chunk to it.
+
+        The chunk read is at least as big as the pending data, so decoding an element
+        bigger than a chunk takes linear time.
+
+        :return: False if the end of the file was reached, True otherwise
+        """
+        if self._eof:
+            return False
+
+        pending = self._buffer[self._pos:]
+        chunk = self._file.read(max(self._chunk_size, len(pending)))
+        if not chunk:
+            self._eof = True
+            return False
+
+        self._buffer = pending + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """
+        Skip whitespaces and return the next character, without consuming it.
+
+        :return: the next character, or an empty string at the end of the file
+        """
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
 
-    The returned generator object produces one MetadataRecord for each element
-    in each JSON object read from file_path.
+    def _error(self, message: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(message, self._buffer, self._pos)
+
+    def _decode(self) -> Any:
+        """
+        Decode the JSON value starting at the current position.
+
+        :raises JSONDecodeError if the value is not valid JSON
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # the value may continue in the next chunk, unless it's bigger than any valid one would be
+                pending = len(self._buffer) - self._pos
+                if pending < max(_MAX_ELEMENT_SIZE, 2 * self._largest) and self._fill():
+                    continue
+                raise
+
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(self._buffer) and self._fill():
+                continue
+
+            self._largest = max(self._largest, end - self._pos)
+            self._pos = end
+            return value
+
+    def _decode_batch(self) -> Tuple[List[Any], bool]:
+        """
+        Decode at once, with the configured decoder, the elements fully contained in the buffer.
+
+        Elements end at a closing brace followed by a delimiter, but such a brace may be part
+        of a string or of a nested object. The text up to a candidate end is decoded as an
+        array, which only succeeds if the candidate is the end of an element: the decoder
+        never accepts an unterminated string or object. A few candidates are tried, from the
+        end of the buffer backwards.
+
+        :return: the elements decoded, which may be none, and whether the array was closed
+        """
+        buffer, pos = self._buffer, self._pos
+        delimiter = _DELIMITER.match
+        attempts = _BATCH_ATTEMPTS
+        end = buffer.rfind('}', pos)
+        while end != -1 and attempts:
+            match = delimiter(buffer, end + 1)
+            if match is not None:
+                attempts -= 1
+                try:
+                    values = self._loads(f'[{buffer[pos:end + 1]}]')
+                except ValueError:
+                    pass
+                else:
+                    self._pos = match.end()
+                    return values, match.group(1) == ']'
+            end = buffer.rfind('}', pos, end)
+
+        return [], False
+
+    def _elements(self) -> Iterator[Any]:
+        """
+        Decode the elements of the array, up to its closing bracket.
+
+        With a decoder other than the standard library, elements fully contained in the
+        buffer are decoded with it. The rest, and any element it can't decode, are decoded
+        by the standard library.
+        """
+        decode = _decoder.raw_decode
+        delimiter = _DELIMITER.match
+        while True:
+            if self._loads is not None:
+                values, closed = self._decode_batch()
+                yield from values
+                if closed:
+                    return
+
+            # fast path: decode the elements (and delimiters) fully contained in the buffer
+            buffer, pos = self._buffer, self._pos
+            try:
+                while True:
+                    value, end = decode(buffer, pos)
+                    match = delimiter(buffer, end)
+                    if match is None:
+                        break
+                    pos = match.end()
+                    yield value
+                    if match.group(1) == ']':
+                        self._pos = pos
+                        return
+            except json.JSONDecodeError:
+                pass
+            self._pos = pos
+
+            # slow path: the next element or delimiter crosses the end of the buffer
+            yield self._decode()
+            char = self._peek()
+            self._pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise self._error("Expecting ',' delimiter")
+
+    def __iter__(self) -> Iterator[Any]:
+        char = self._peek()
+        if char != '[':
+            if char and char in _VALUE_START:
+                raise ExtractionError('Invalid JSON structure. It must contain a list of objects')
+            raise self._error('Expecting value')
+        self._pos += 1
+
+        if self._peek() == ']':
+            self._pos += 1
+        else:
+            yield from self._elements()
+
+        if self._peek():
+            raise self._error('Extra data')
+
+
+def _perform_extractor(file_path: str, decoder: str = STDLIB,
+                       flattener: Optional[JSONFlattener] = None) -> Generator[MetadataRecord, None, None]:
+    """
+    Perform the extraction of records from the given JSON file.
 
-    Note: this function reads the hole JSON file and produces the records one by
-    one. It must be improved to read objects lazily.
+    The returned generator object produces one MetadataRecord for each scalar value
+    in each JSON object read from file_path, see JSONFlattener. Objects are decoded
+    lazily, one at a time, so the whole file is never held in memory.
 
     :param file_path: the path to the file to create records from
+    :param decoder: the name of the JSON decoder to use
+    :param flattener: the flattener of nested values. One with the default maximum depth is used if None
     :return: a generator object that produces MetadataField objects
     :raises ExtractionError if extraction fails
     """
-    with open(file_path, mode='r') as json_file:
-        # TODO: avoid reading the hole file at once
-        for obj in json.load(json_file):
+    flattener = flattener or JSONFlattener()
+    with open_text(file_path, newline=None) as json_file:
+        for obj in _JSONArrayStream(json_file, decoder=decoder):
             if not isinstance(obj, Mapping):
                 raise ExtractionError(f'Invalid JSON structure. It must contain a list of objects')
 
-            for key, value in obj.items():
+            for key, value in flattener.items(obj):
                 yield MetadataRecord(key, value)
 
 
@@ -37,15 +244,18 @@ def extract_data_from_json(file_path: str) -> Generator[MetadataRecord, None, No
     """
     Perform the extraction of records from the given JSON file.
 
-    The returned generator object produces one MetadataRecord for each element
-    in each JSON object read from file_path.
+    The returned generator object produces one MetadataRecord for each scalar value
+    in each JSON object read from file_path, named after its path in the object. The
+    fastest JSON decoder installed is used, see get_json_decoder().
 
     :param file_path: the path to the file to create records from
     :return: a generator object that produces MetadataField objects
     :raises ExtractionError if extraction fails
     """
+    decoder = get_json_decoder()
+    flattener = JSONFlattener()
     try:
-        yield from _perform_extractor(file_path)
+        yield from _perform_extractor(file_path, decoder, flattener)
     except ExtractionError:
         raise
     except IOError:
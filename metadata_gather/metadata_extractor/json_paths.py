@@ -0,0 +1,119 @@
+"""
+Flattening of nested JSON values into fields named after their paths.
+
+The values of nested objects are fields named after the dotted path of keys leading to
+them, e.g. "user.address.zip" in {"user": {"address": {"zip": "08001"}}}. The elements of
+arrays are values of the path of the array followed by "[]", e.g. "tags[]" in
+{"tags": ["a", "b"]}, or "items[].sku" in {"items": [{"sku": 1}, {"sku": 2}]}. Empty objects
+and arrays are a null value of their path, e.g. "user" in {"user": {}} and "tags[]" in
+{"tags": []}, so they're accounted for like any missing value.
+
+Keys are not escaped: a key with dots is indistinguishable from the nested keys it reads as,
+so {"a.b": 1} and {"a": {"b": 1}} are values of the same field "a.b".
+
+Paths are built once, the first time they are found, and interned, so flattening does not
+build strings per value. The depth of a value is the amount of keys and arrays in its path,
+e.g. 3 for "items[].sku". Values deeper than the maximum depth are ignored.
+"""
+import os
+import sys
+from typing import Any, Iterable, Iterator, Mapping, Optional, Tuple
+
+# Environment variable to set the maximum depth of the values flattened
+MAX_DEPTH_ENV_VAR = 'METADATA_GATHER_JSON_MAX_DEPTH'
+
+_DEFAULT_MAX_DEPTH = 32
+
+# Types of the decoded JSON values that are flattened
+_CONTAINERS = frozenset((dict, list))
+
+
+def get_max_depth(max_depth: Optional[int] = None) -> int:
+    """
+    Resolve the maximum depth of the values flattened.
+
+    :param max_depth: the maximum depth, where the values of top-level keys have depth 1. When
+    None, the one in the METADATA_GATHER_JSON_MAX_DEPTH environment variable is used, or else 32
+    :return: the maximum depth
+    :raises ValueError if the maximum depth is not positive
+    """
+    if max_depth is None:
+        max_depth = int(os.environ.get(MAX_DEPTH_ENV_VAR, _DEFAULT_MAX_DEPTH))
+
+    if max_depth < 1:
+        raise ValueError(f"Invalid maximum depth {max_depth}, it must be 1 or greater")
+    return max_depth
+
+
+class JSONFlattener:
+    """
+    Flatten JSON objects into (path, value) pairs, one for each scalar value they contain.
+
+    The paths found so far are kept in a tree of nodes, one for each path, so finding the path
+    of a value only takes a lookup of its key among the children of its parent. A flattener
+    should be used for all the objects of a source. The tree is not bounded: it grows with the
+    distinct paths of the source, as the fields of its metadata do, so objects used as maps,
+    whose keys are data, take memory that grows with their distinct keys.
+    """
+    __slots__ = 'max_depth', '_root'
+
+    def __init__(self, max_depth: Optional[int] = None):
+        self.max_depth = get_max_depth(max_depth)
+        # a node is [path, {key: child node}, node of the elements, if it's an array]
+        self._root = ['', dict(), None]
+
+    def items(self, obj: Mapping) -> Iterable[Tuple[str, Any]]:
+        """
+        Iterate the scalar values of an object, in order, with their paths.
+
+        :param obj: a decoded JSON object
+        :return: an iterable of (path, value) pairs
+        """
+        if _CONTAINERS.isdisjoint(map(type, obj.values())):
+            # most objects are flat, and their items are their paths and values already
+            return obj.items()
+
+        return self._flatten_object(self._root, obj, 1)
+
+    def _flatten_object(self, node: list, obj: Mapping, depth: int) -> Iterator[Tuple[str, Any]]:
+        children = node[1]
+        for key, value in obj.items():
+            try:
+                child = children[key]
+            except KeyError:
+                path = f'{node[0]}.{key}' if node is not self._root else key
+                child = children[key] = [sys.intern(path), dict(), None]
+
+            value_type = type(value)
+            if value_type is dict:
+                if depth < self.max_depth:
+                    if value:
+                        yield from self._flatten_object(child, value, depth + 1)
+                    else:
+                        yield child[0], None
+            elif value_type is list:
+                if depth < self.max_depth:
+                    yield from self._flatten_array(child, value, depth + 1)
+            else:
+                yield child[0], value
+
+    def _flatten_array(self, node: list, array: list, depth: int) -> Iterator[Tuple[str, Any]]:
+        elements = node[2]
+        if elements is None:
+            elements = node[2] = [sys.intern(f'{node[0]}[]'), dict(), None]
+
+        if not array:
+            yield elements[0], None
+        for value in array:
+            value_type = type(value)
+            if value_type is dict:
+                if depth < self.max_depth:
+                    if value:
+                        yield from self._flatten_object(elements, value, depth + 1)
+                    else:
+                        yield elements[0], None
+            elif value_type is list:
+                if depth < self.max_depth:
+                    yield from self._flatten_array(elements, value, depth + 1)
+            else:
+                yield elements[0], value
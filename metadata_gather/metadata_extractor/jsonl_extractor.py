@@ -0,0 +1,214 @@
+from collections.abc import Mapping
+from contextlib import contextmanager
+import json
+from typing import Any, Callable, Generator, Iterator, List, Optional, TextIO, Tuple
+
+from common import ColumnStatistics, MetadataRecord
+from crawler import get_spill_threshold
+
+from .exceptions import ExtractionError
+from .compression import open_text
+from .file_chunks import count_lines, open_range, split_on_lines
+from .file_extractor import file_extractor, file_splitter, statistics_extractor
+from .json_decoders import STDLIB, get_json_decoder, json_decoders
+from .json_paths import JSONFlattener
+
+
+def _open_lines(file_path: str, start: Optional[int] = None, end: Optional[int] = None) -> TextIO:
+    """
+    Open the given JSON Lines file, or a range of it, as a text stream.
+
+    :param file_path: the path to the file
+    :param start: the offset of the first line to read. The whole file is read if None
+    :param end: the offset past the last line to read
+    :return: a text stream
+    """
+    if start is None:
+        return open_text(file_path)
+
+    return open_range(file_path, start, end)
+
+
+def _objects(lines: TextIO, loads: Callable[[str], Any], first_line: int = 1) -> Iterator[Tuple[int, Mapping]]:
+    """
+    Decode the objects of a JSON Lines stream, one per line. Blank lines are skipped.
+
+    :param lines: the stream to read lines from
+    :param loads: the function of the JSON decoder to use
+    :param first_line: the line number of the first line of the stream, for errors
+    :return: an iterator of (line number, object) pairs
+    :raises ExtractionError if a line does not contain an object
+    :raises JSONDecodeError if a line is not valid JSON
+    """
+    for line_number, line in enumerate(lines, start=first_line):
+        if not line.strip():
+            continue
+
+        try:
+            obj = loads(line)
+        except ValueError:
+            # the standard library decides whether the line is invalid, see json_decoders
+            obj = json.loads(line)
+
+        if not isinstance(obj, Mapping):
+            raise ExtractionError(f'Invalid JSON Lines structure. Line {line_number} must contain an object')
+
+        yield line_number, obj
+
+
+def _perform_extraction(file_path: str, decoder: str = STDLIB,
+                        flattener: Optional[JSONFlattener] = None) -> Generator[MetadataRecord, None, None]:
+    """
+    Perform the extraction of records from the given JSON Lines file.
+
+    The returned generator object produces one MetadataRecord for each scalar value
+    in each JSON object read from file_path, see JSONFlattener. Lines are decoded
+    lazily, one at a time, so the whole file is never held in memory.
+
+    :param file_path: the path to the file to create records from
+    :param decoder: the name of the JSON decoder to use
+    :param flattener: the flattener of nested values. One with the default maximum depth is used if None
+    :return: a generator object that produces MetadataField objects
+    :raises ExtractionError if extraction fails
+    """
+    flattener = flattener or JSONFlattener()
+    with _open_lines(file_path) as lines:
+        for _, obj in _objects(lines, json_decoders[decoder]):
+            for key, value in flattener.items(obj):
+                yield MetadataRecord(key, value)
+
+
+def _perform_statistics_extraction(file_path: str, start: Optional[int] = None, end: Optional[int] = None,
+                                   decoder: str = STDLIB, flattener: Optional[JSONFlattener] = None,
+                                   spill_threshold: Optional[int] = None) -> Generator[ColumnStatistics, None, None]:
+    """
+    Perform the extraction of per-field statistics from the given JSON Lines file.
+
+    Values are only counted and classified by type, so no record is created for them.
+    Fields are reported in the order they were first found, as crawl does with records.
+    Once as many fields as the spill threshold are counted, their statistics are produced
+    and counting starts over, so the crawler summarizing them (and spilling them to disk)
+    bounds the memory used whatever the amount of fields. A field may then be reported
+    more than once, which crawl_statistics() summarizes together.
+
+    :param file_path: the path to the file to compute statistics from
+    :param start: the offset of the first line to process. All lines are processed if None
+    :param end: the offset past the last line to process
+    :param decoder: the name of the JSON decoder to use
+    :param flattener: the flattener of nested values. One with the default maximum depth is used if None
+    :param spill_threshold: the amount of fields counted before their statistics are produced, see
+    crawler.get_spill_threshold()
+    :return: a generator object that produces ColumnStatistics objects
+    :raises ExtractionError if extraction fails
+    """
+    flattener = flattener or JSONFlattener()
+    spill_threshold = get_spill_threshold(spill_threshold)
+    # field name -> [occurrences, nulls, {type: None}]. A dict keeps the types in the order
+    # they were found, so the crawler reports the same inconsistency as with records
+    fields = dict()
+
+    first_line = 1
+    if start is not None:
+        first_line += count_lines(file_path, start)
+
+    with _open_lines(file_path, start, end) as lines:
+        for _, obj in _objects(lines, json_decoders[decoder], first_line):
+            for key, value in flattener.items(obj):
+                try:
+                    field = fields[key]
+                except KeyError:
+                    if len(fields) == spill_threshold:
+                        yield from _column_statistics(fields)
+                        fields = dict()
+                    field = fields[key] = [0, 0, dict()]
+
+                field[0] += 1
+                if value is None:
+                    field[1] += 1
+                else:
+                    field[2][type(value)] = None
+
+    yield from _column_statistics(fields)
+
+
+def _column_statistics(fields: dict) -> Iterator[ColumnStatistics]:
+    return (ColumnStatistics(name, occurrences, nulls, tuple(types))
+            for name, (occurrences, nulls, types) in fields.items())
+
+
+@contextmanager
+def _extraction_errors(file_path: str):
+    """
+    Translate any error raised while processing the given JSON Lines file into an ExtractionError.
+
+    :param file_path: the path to the file being processed
+    """
+    try:
+        yield
+    except ExtractionError:
+        raise
+    except IOError:
+        raise ExtractionError(f"Could not open file '{file_path}'")
+    except ValueError:
+        # JSONDecodeError, and UnicodeDecodeError for binary files
+        raise ExtractionError(f"The file '{file_path}' is not a valid JSON Lines file")
+    except Exception:
+        raise ExtractionError(f"Unexpected error while processing JSON Lines file '{file_path}'")
+
+
+@file_extractor("ndjson")
+@file_extractor("jsonl")
+def extract_data_from_jsonl(file_path: str) -> Generator[MetadataRecord, None, None]:
+    """
+    Perform the extraction of records from the given JSON Lines file.
+
+    The returned generator object produces one MetadataRecord for each scalar value
+    in each JSON object read from file_path, one object per line, named after its
+    path in the object. The fastest JSON decoder installed is used, see get_json_decoder().
+
+    :param file_path: the path to the file to create records from
+    :return: a generator object that produces MetadataField objects
+    :raises ExtractionError if extraction fails
+    """
+    decoder = get_json_decoder()
+    flattener = JSONFlattener()
+    with _extraction_errors(file_path):
+        yield from _perform_extraction(file_path, decoder, flattener)
+
+
+@statistics_extractor("ndjson")
+@statistics_extractor("jsonl")
+def extract_statistics_from_jsonl(file_path: str, start: Optional[int] = None,
+                                  end: Optional[int] = None) -> Generator[ColumnStatistics, None, None]:
+    """
+    Perform the extraction of per-field statistics from the given JSON Lines file.
+
+    The returned generator object produces one ColumnStatistics for each field
+    found in the objects of the file, nested ones included. The fastest JSON decoder
+    installed is used, see get_json_decoder().
+
+    :param file_path: the path to the file to compute statistics from
+    :param start: the offset of a range returned by split_jsonl_file(). All lines are processed if None
+    :param end: the end of the range starting at <start>
+    :return: a generator object that produces ColumnStatistics objects
+    :raises ExtractionError if extraction fails
+    """
+    decoder = get_json_decoder()
+    flattener = JSONFlattener()
+    with _extraction_errors(file_path):
+        yield from _perform_statistics_extraction(file_path, start, end, decoder, flattener)
+
+
+@file_splitter("ndjson")
+@file_splitter("jsonl")
+def split_jsonl_file(file_path: str, chunks: int) -> List[Tuple[int, int]]:
+    """
+    Split the lines of the given JSON Lines file into byte ranges aligned to line boundaries.
+
+    :param file_path: the path to the file to split
+    :param chunks: the amount of ranges wanted. Fewer ranges may be returned
+    :return: a list of (start, end) byte offsets
+    :raises ExtractionError if splitting fails
+    """
+    with _extraction_errors(file_path):
+        return split_on_lines(file_path, chunks)
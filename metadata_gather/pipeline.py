@@ -0,0 +1,313 @@
+"""
+This module isolates an asyncio pipeline to crawl many files, overlapping disk reads, parsing
+and storing.
+
+Files flow through the following stages, connected by bounded queues:
+   - lookup -> retrieves what was stored for each file, in batches
+   - read -> fingerprints each file and prefetches it, in a pool of threads
+   - parse -> crawls each changed file, in a pool of worker processes
+   - store -> stores the results, in batches, from a single thread
+A full queue blocks the stage feeding it, so a slow stage throttles the ones before it
+instead of accumulating work in memory. Stages take the files waiting in their queue in
+small batches, so handing work to threads and processes is not paid for every file.
+"""
+import asyncio
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import os
+from typing import Iterable, List, Optional, Tuple
+
+from common import FileFingerprint, GatherError, SampleSize
+from fingerprint import fingerprint_if_changed
+from storage_manager import StorageBackend, open_storage
+from tasks import CrawlResult, FileFailure, crawl_changed, store_crawl_result
+
+# The outcome of crawling a batch of files with the pipeline: the same as BatchSummary, and
+# the statistics of each stage
+PipelineSummary = namedtuple('PipelineSummary', 'crawled, skipped, failures, stages')
+
+# Statistics of a stage: the amount of items it processed, and the maximum and mean depth of
+# its input queue, sampled every time an item was queued. A stage whose queue is often full
+# is the bottleneck of the pipeline
+StageStatistics = namedtuple('StageStatistics', 'name, items, max_depth, mean_depth')
+
+# Maximum amount of items waiting in the queue of each stage
+_QUEUE_SIZE = 64
+
+# Amount of threads reading files
+_READ_THREADS = 8
+
+# Amount of files looked up or stored at once
+_BATCH_SIZE = 100
+
+# Maximum amount of files read or parsed at once by a thread or process
+_WORKER_BATCH_SIZE = 16
+
+_UNEXPECTED_ERROR = 'Unexpected error occurred.'
+
+
+class _MonitoredQueue(asyncio.Queue):
+    """
+    Help class to sample the depth of a queue every time an item is put into it.
+
+    Only put() is monitored, it's the only way items are queued in this module.
+
+    This class is intended to use inside this module only.
+    """
+    def __init__(self, name: str, maxsize: int):
+        super().__init__(maxsize)
+        self.name = name
+        self.items = 0
+        self.max_depth = 0
+        self.total_depth = 0
+
+    async def put(self, item):
+        await super().put(item)
+        if item is None:
+            # end of input markers don't count as items
+            return
+
+        depth = self.qsize()
+        self.items += 1
+        self.max_depth = max(self.max_depth, depth)
+        self.total_depth += depth
+
+    def statistics(self) -> StageStatistics:
+        return StageStatistics(self.name, self.items, self.max_depth,
+                               self.total_depth / self.items if self.items else 0.0)
+
+    async def take(self, limit: int) -> list:
+        """
+        Take up to <limit> items, waiting for one if the queue is empty.
+
+        The end of the input is marked by a None item, which is left in the queue for the
+        other consumers.
+
+        :param limit: the maximum amount of items to take
+        :return: the items taken, empty once the end of the input was reached
+        """
+        items = []
+        item = await self.get()
+        while item is not None:
+            items.append(item)
+            if len(items) == limit or self.empty():
+                return items
+            item = self.get_nowait()
+
+        # there's room for it, it was just taken
+        self.put_nowait(None)
+        return items
+
+
+def _describe_error(e: Exception) -> str:
+    return str(e) if isinstance(e, GatherError) else _UNEXPECTED_ERROR
+
+
+def _lookup(s: StorageBackend, paths: List[str]) -> List[Tuple[str, Optional[FileFingerprint], Optional[int],
+                                                               Optional[str]]]:
+    """
+    Retrieve what was stored for each file: its fingerprint, the offset it was crawled up to,
+    and the error retrieving them, if any.
+    """
+    states = []
+    for path in paths:
+        try:
+            states.append((path, s.retrieve_fingerprint(path), s.retrieve_crawled_bytes(path), None))
+        except GatherError as e:
+            states.append((path, None, None, str(e)))
+    return states
+
+
+def _read(items: List[Tuple[str, Optional[FileFingerprint], Optional[int]]], with_hash: bool,
+          append_only: bool, prefetch: bool) -> List[Tuple[str, Optional[FileFingerprint], Optional[int],
+                                                           Optional[FileFingerprint], Optional[str]]]:
+    """
+    Fingerprint several files, returning the current fingerprint of each one (None if it did
+    not change) and the error fingerprinting it, if any.
+    """
+    outcomes = []
+    for path, stored, crawled_bytes in items:
+        try:
+            fingerprint = _read_file(path, stored, crawled_bytes, with_hash, append_only, prefetch)
+        except Exception as e:
+            outcomes.append((path, stored, crawled_bytes, None, _describe_error(e)))
+        else:
+            outcomes.append((path, stored, crawled_bytes, fingerprint, None))
+    return outcomes
+
+
+def _read_file(abs_path: str, stored: Optional[FileFingerprint], crawled_bytes: Optional[int],
+               with_hash: bool, append_only: bool, prefetch: bool = True) -> Optional[FileFingerprint]:
+    """
+    Fingerprint a file and, if it changed and prefetching is enabled, ask the OS to start
+    reading it, so it's cached by the time it's parsed.
+    """
+    fingerprint = fingerprint_if_changed(abs_path, stored, with_hash)
+    if fingerprint is not None and prefetch and hasattr(os, 'posix_fadvise'):
+        offset = crawled_bytes if append_only and crawled_bytes is not None else 0
+        fd = os.open(abs_path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, offset, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    return fingerprint
+
+
+def _parse(items: List[Tuple[str, Optional[FileFingerprint], Optional[int], FileFingerprint]], with_hash: bool,
+           append_only: bool, sample: Optional[SampleSize],
+           with_statistics: bool) -> List[Tuple[str, Optional[CrawlResult], Optional[str]]]:
+    """
+    Crawl several files that changed, returning the result of crawling each one and the error
+    crawling it, if any.
+    """
+    outcomes = []
+    for path, stored, crawled_bytes, fingerprint in items:
+        try:
+            result = crawl_changed(path, stored, crawled_bytes, fingerprint, with_hash, append_only, sample=sample,
+                                   with_statistics=with_statistics)
+        except Exception as e:
+            outcomes.append((path, None, _describe_error(e)))
+        else:
+            outcomes.append((path, result, None))
+    return outcomes
+
+
+def _store(s: StorageBackend, results: List[Tuple[str, CrawlResult]]) -> List[Tuple[str, Optional[str]]]:
+    """
+    Store the results of crawling several files, returning the error storing each one, if any.
+    """
+    outcomes = []
+    for path, result in results:
+        try:
+            store_crawl_result(s, path, result)
+        except Exception as e:
+            outcomes.append((path, _describe_error(e)))
+        else:
+            outcomes.append((path, None))
+    return outcomes
+
+
+async def _run(paths: List[str], db_path: str, workers: int, read_threads: int, queue_size: int,
+               with_hash: bool, append_only: bool, sample: Optional[SampleSize],
+               with_statistics: bool) -> PipelineSummary:
+    loop = asyncio.get_event_loop()
+    crawled, skipped, failures = [], [], []
+    read_queue = _MonitoredQueue('read', queue_size)
+    parse_queue = _MonitoredQueue('parse', queue_size)
+    store_queue = _MonitoredQueue('store', queue_size)
+
+    async def lookup():
+        for idx in range(0, len(paths), _BATCH_SIZE):
+            for path, stored, crawled_bytes, error in await loop.run_in_executor(
+                    db_executor, _lookup, s, paths[idx:idx + _BATCH_SIZE]):
+                if error is None:
+                    await read_queue.put((path, stored, crawled_bytes))
+                else:
+                    failures.append(FileFailure(path, error))
+
+    async def read():
+        while True:
+            items = await read_queue.take(_WORKER_BATCH_SIZE)
+            if not items:
+                return
+
+            for path, stored, crawled_bytes, fingerprint, error in await loop.run_in_executor(
+                    read_executor, _read, items, with_hash, append_only, sample is None):
+                if error is not None:
+                    failures.append(FileFailure(path, error))
+                elif fingerprint is None:
+                    skipped.append(path)
+                else:
+                    await parse_queue.put((path, stored, crawled_bytes, fingerprint))
+
+    async def parse():
+        while True:
+            items = await parse_queue.take(_WORKER_BATCH_SIZE)
+            if not items:
+                return
+
+            try:
+                outcomes = await loop.run_in_executor(parse_executor, _parse, items, with_hash, append_only, sample,
+                                                      with_statistics)
+            except Exception as e:
+                # the worker process died
+                outcomes = [(item[0], None, _describe_error(e)) for item in items]
+
+            for path, result, error in outcomes:
+                if error is None:
+                    await store_queue.put((path, result))
+                else:
+                    failures.append(FileFailure(path, error))
+
+    async def store():
+        while True:
+            items = await store_queue.take(_BATCH_SIZE)
+            if not items:
+                return
+
+            for path, error in await loop.run_in_executor(db_executor, _store, s, items):
+                if error is None:
+                    crawled.append(path)
+                else:
+                    failures.append(FileFailure(path, error))
+
+    # the connection to the DB is only used from the thread that opened it
+    db_executor = ThreadPoolExecutor(max_workers=1)
+    read_executor = ThreadPoolExecutor(max_workers=read_threads)
+    parse_executor = ProcessPoolExecutor(max_workers=workers)
+    s = None
+    try:
+        s = await loop.run_in_executor(db_executor, lambda: open_storage(db_path, batch_size=_BATCH_SIZE))
+
+        readers = [asyncio.ensure_future(read()) for _ in range(read_threads)]
+        parsers = [asyncio.ensure_future(parse()) for _ in range(workers)]
+        writer = asyncio.ensure_future(store())
+
+        await lookup()
+        await read_queue.put(None)
+        await asyncio.gather(*readers)
+        await parse_queue.put(None)
+        await asyncio.gather(*parsers)
+        await store_queue.put(None)
+        await writer
+    finally:
+        if s is not None:
+            await loop.run_in_executor(db_executor, s.close)
+        parse_executor.shutdown()
+        read_executor.shutdown()
+        db_executor.shutdown()
+
+    return PipelineSummary(crawled, skipped, failures,
+                           [queue.statistics() for queue in (read_queue, parse_queue, store_queue)])
+
+
+def crawl_pipeline(paths: Iterable[str], db_path: str, workers: Optional[int] = None, with_hash: bool = False,
+                   append_only: bool = False, read_threads: int = _READ_THREADS,
+                   queue_size: int = _QUEUE_SIZE, sample: Optional[SampleSize] = None,
+                   with_statistics: bool = False) -> PipelineSummary:
+    """
+    Extract metadata from several files and store it, overlapping disk reads, parsing and storing.
+
+    The result is the same as crawl_batch(): files that can't be crawled are reported as
+    failures, files that did not change are skipped and the metadata of files that changed
+    is replaced.
+
+    :param paths: the absolute paths of the files to extract metadata from
+    :param db_path: path to the db file. It's created if it doesn't exists.
+    :param workers: the amount of worker processes parsing files. Defaults to the amount of CPUs
+    :param with_hash: whether to compare content hashes to detect changes
+    :param append_only: whether files that grew can be assumed to have been appended to
+    :param read_threads: the amount of threads reading files
+    :param queue_size: the maximum amount of items waiting in the queue of each stage
+    :param sample: how much of each file to sample. Files are crawled exactly, and prefetched whole, if None
+    :param with_statistics: whether to compute the statistics of the values of each field
+    :return: a summary of the batch, with the statistics of each stage
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(_run(list(paths), db_path, workers or os.cpu_count() or 1, read_threads,
+                                            queue_size, with_hash, append_only, sample, with_statistics))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
@@ -0,0 +1,162 @@
+"""
+This module isolates the logic to estimate the metadata of a file from a random sample of it,
+without reading the whole file.
+
+The rows of a file are partitioned into blocks of a fixed amount of bytes: a row belongs to
+the block its first byte is in. Blocks are drawn at random, without replacement, and the
+statistics of the rows of each block drawn are extracted. The occurrences of each field in
+the whole file are then estimated by expanding their occurrences per byte sampled, with a
+95% confidence interval computed from their variance among the blocks drawn.
+
+Types can't be estimated: a value of a wider type in a row that was not sampled would go
+unnoticed. So the types of sampled fields are widened conservatively to strings, the type
+every value widens to, and only a crawl of the whole file tells their exact types.
+"""
+import math
+import random
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from common import ColumnStatistics, Metadata, SampleSize, widen_type
+from crawler import crawl_statistics
+from instrumentation import stage
+from metadata_extractor import extract_statistics_from_file, split_file, supports_splitting, supports_statistics
+
+# Bytes of each block the rows of a file are partitioned into
+_BLOCK_SIZE = 64 * 1024
+
+# Blocks drawn, at least, to estimate the variance among blocks
+_MIN_BLOCKS = 2
+
+# Files are crawled exactly when sampling would read more than this fraction of their blocks
+_MAX_SAMPLED_FRACTION = 0.5
+
+# Quantile of the standard normal distribution for a 95% confidence interval
+_Z_95 = 1.96
+
+# Type every sampled type is widened to, as the rows not sampled may hold any type
+_SAMPLED_TYPE = 'S'
+
+
+def _line_boundary(f, offset: int, start: int) -> int:
+    """
+    Find the first line boundary (the offset after a line break) at or after offset.
+
+    :param f: the file, opened in binary mode
+    :param offset: the offset to search from
+    :param start: the offset of the first row, which is a boundary
+    :return: the offset of the boundary, or the size of the file if there's none
+    """
+    if offset <= start:
+        return start
+
+    # starting from the previous byte keeps the offset when it is a boundary already
+    f.seek(offset - 1)
+    f.readline()
+    return f.tell()
+
+
+def _sample_block(abs_path: str, f, start: int, end: int) -> Tuple[int, List[ColumnStatistics]]:
+    """
+    Extract the statistics of the rows that begin in [start, end).
+
+    :return: the amount of lines extracted, and their statistics
+    """
+    if start >= end:
+        # a single row spans the whole block
+        return 0, []
+
+    with stage('extract'):
+        f.seek(start)
+        lines = f.read(end - start).count(b'\n')
+        return lines, list(extract_statistics_from_file(abs_path, start, end))
+
+
+def _estimate(values: List[int], sizes: List[int], total_size: int) -> Tuple[int, int]:
+    """
+    Estimate the total of a value over a file from its values in the blocks drawn.
+
+    The total is the ratio of the value to the bytes sampled, expanded to the bytes of the
+    file, so the last block of the file, which is usually smaller, does not bias it.
+
+    :param values: the value in each block drawn
+    :param sizes: the bytes of each block drawn
+    :param total_size: the bytes of every block of the file
+    :return: the estimated total, and the half-width of its 95% confidence interval
+    """
+    n = len(values)
+    ratio = sum(values) / sum(sizes)
+    residuals = sum((value - ratio * size) ** 2 for value, size in zip(values, sizes)) / (n - 1) if n > 1 else 0.0
+    blocks = total_size * n / sum(sizes)
+    # the finite population correction shrinks the interval as the sample approaches the whole file
+    margin = _Z_95 * blocks * math.sqrt(max(1 - n / blocks, 0) * residuals / n)
+    return max(round(ratio * total_size), sum(values)), math.ceil(margin)
+
+
+def sample_file(abs_path: str, sample: SampleSize, block_size: int = _BLOCK_SIZE,
+                seed: Optional[int] = None) -> Optional[List[Metadata]]:
+    """
+    Estimate the metadata of a file from a random sample of its rows.
+
+    Blocks are drawn until both targets of the sample are reached. Only formats that can be
+    split and whose statistics can be extracted can be sampled.
+
+    :param abs_path: the file to estimate metadata from
+    :param sample: how much of the file to sample
+    :param block_size: the bytes of each block the rows of the file are partitioned into
+    :param seed: the seed of the random blocks drawn. Defaults to one derived from the path and size of the file
+    :return: the approximate metadata, with types widened to strings, or None if the file can't be sampled, or
+             it's small enough (compared to the sample) that it should be crawled exactly
+    :raises ExtractionError if the rows sampled can't be extracted
+    :raises CrawlingError if the type of a field sampled is unknown
+    """
+    if not (supports_splitting(abs_path) and supports_statistics(abs_path)):
+        return None
+
+    ranges = split_file(abs_path, 1)
+    start, end = ranges[0][0], ranges[-1][1]
+    blocks = -(-(end - start) // block_size)
+    # without a fraction, the amount of blocks is only bounded by the rows wanted
+    wanted_blocks = max(math.ceil((sample.fraction or 0) * blocks), _MIN_BLOCKS)
+    max_blocks = int(blocks * _MAX_SAMPLED_FRACTION)
+    if wanted_blocks > max_blocks:
+        return None
+
+    if seed is None:
+        # the same sample is drawn from a file until it changes, so estimates are reproducible
+        seed = zlib.crc32(f'{abs_path}:{end}'.encode())
+    rng = random.Random(seed)
+    drawn = dict()
+    lines = 0
+    with open(abs_path, mode='rb') as f:
+        while len(drawn) < wanted_blocks or (sample.rows is not None and lines < sample.rows):
+            if len(drawn) >= max_blocks:
+                return None
+
+            idx = rng.randrange(blocks)
+            if idx in drawn:
+                continue
+
+            block_start = _line_boundary(f, start + idx * block_size, start)
+            block_end = _line_boundary(f, min(start + (idx + 1) * block_size, end), start)
+            block_lines, statistics = _sample_block(abs_path, f, block_start, min(block_end, end))
+            drawn[idx] = statistics
+            lines += block_lines
+
+    # blocks are summarized in the order of the file, so fields are in the order they appear in it
+    statistics = [drawn[idx] for idx in sorted(drawn)]
+    sizes = [min(block_size, end - start - idx * block_size) for idx in sorted(drawn)]
+    occurrences: Dict[str, List[int]] = {}
+    nulls: Dict[str, List[int]] = {}
+    for slot, block in enumerate(statistics):
+        for column in block:
+            occurrences.setdefault(column.name, [0] * len(statistics))[slot] += column.occurrences
+            nulls.setdefault(column.name, [0] * len(statistics))[slot] += column.nulls
+
+    metadata = []
+    for m in crawl_statistics(column for block in statistics for column in block):
+        total, total_margin = _estimate(occurrences[m.field], sizes, end - start)
+        null, null_margin = _estimate(nulls[m.field], sizes, end - start)
+        metadata.append(Metadata(m.field, widen_type(m.type, _SAMPLED_TYPE), total, min(null, total), total_margin,
+                                 null_margin))
+    return metadata
@@ -1,70 +1,552 @@
 """
 This module isolates the logic to store metadata into disk.
+
+Metadata is stored by a pluggable backend, registered with the storage_backend decorator, that
+implements the StorageBackend interface. The SQLite backend, MetadataStorageManager, is always
+available and used by default. The DuckDB backend, registered when duckdb is installed, stores
+metadata in columns, which makes bulk appends and scans of the whole catalog much faster.
 """
+from abc import ABC, abstractmethod
+import csv
+import itertools
+import json
 import os
 import sqlite3
-from typing import Iterable, Generator
-from common import Metadata
+import tempfile
+from typing import Iterable, Iterator, Generator, List, Optional, Tuple
+from common import (FieldStatistics, FieldTypes, FileFingerprint, FileMetadata, GatherError, INTERNAL_TYPES,
+                    Metadata)
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+storage_backends = {}
+
+# Environment variable to force the use of a given backend
+BACKEND_ENV_VAR = 'METADATA_GATHER_STORAGE_BACKEND'
+
+SQLITE = 'sqlite'
 
+DUCKDB = 'duckdb'
 
-class StoringException(Exception):
+
+class StoringException(GatherError):
     """
     Base exception for extraction errors
     """
     pass
 
 
-class MetadataStorageManager:
+_JOURNAL_MODES = frozenset(['delete', 'truncate', 'persist', 'memory', 'wal', 'off'])
+
+_SYNCHRONOUS_MODES = frozenset(['off', 'normal', 'full', 'extra'])
+
+
+def _create_metadata_table(con: sqlite3.Connection) -> None:
+    """
+    Create the original schema: a single table, where file_id is the path of the file
+    """
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS metadata (
+            id INTEGER PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            field_name TEXT NOT NULL,
+            field_type TEXT CHECK( field_type IN ('I','S') ),
+            total_occurrences INTEGER CHECK( total_occurrences > 0 ) NOT NULL,
+            null_occurrences INTEGER CHECK( null_occurrences >= 0 ) NOT NULL,
+            CHECK ( total_occurrences >= null_occurrences )
+        );"""
+    )
+
+
+def _create_files_table(con: sqlite3.Connection) -> None:
+    """
+    Move file paths to their own table, and reference them from metadata by an integer id
+    """
+    con.execute(
+        """
+        CREATE TABLE files (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE
+        );"""
+    )
+    con.execute("INSERT INTO files(path) SELECT file_id FROM metadata GROUP BY file_id ORDER BY MIN(id)")
+    con.execute("ALTER TABLE metadata RENAME TO legacy_metadata")
+    con.execute(
+        """
+        CREATE TABLE metadata (
+            id INTEGER PRIMARY KEY,
+            file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+            field_name TEXT NOT NULL,
+            field_type TEXT CHECK( field_type IN ('I','S') ),
+            total_occurrences INTEGER CHECK( total_occurrences > 0 ) NOT NULL,
+            null_occurrences INTEGER CHECK( null_occurrences >= 0 ) NOT NULL,
+            CHECK ( total_occurrences >= null_occurrences )
+        );"""
+    )
+    con.execute(
+        """
+        INSERT INTO metadata(id, file_id, field_name, field_type, total_occurrences, null_occurrences)
+        SELECT legacy_metadata.id, files.id, field_name, field_type, total_occurrences, null_occurrences
+        FROM legacy_metadata JOIN files ON files.path = legacy_metadata.file_id"""
+    )
+    con.execute("DROP TABLE legacy_metadata")
+    con.execute("CREATE INDEX metadata_file_id ON metadata(file_id)")
+
+
+def _add_fingerprints(con: sqlite3.Connection) -> None:
+    """
+    Add the fingerprint of the content of each file when it was crawled
+    """
+    con.execute("ALTER TABLE files ADD COLUMN size INTEGER")
+    con.execute("ALTER TABLE files ADD COLUMN mtime_ns INTEGER")
+    con.execute("ALTER TABLE files ADD COLUMN content_hash TEXT")
+
+
+def _add_crawled_bytes(con: sqlite3.Connection) -> None:
+    """
+    Add the offset up to which each file was crawled, to resume crawling files that grow
+    """
+    con.execute("ALTER TABLE files ADD COLUMN crawled_bytes INTEGER")
+
+
+def _add_margins(con: sqlite3.Connection) -> None:
+    """
+    Add the margins of error of metadata estimated from a sample, NULL for exact metadata
+    """
+    con.execute("ALTER TABLE metadata ADD COLUMN total_margin INTEGER")
+    con.execute("ALTER TABLE metadata ADD COLUMN null_margin INTEGER")
+
+
+def _create_field_statistics_table(con: sqlite3.Connection) -> None:
     """
-    Provides the logic to store metadata into the DB and retrieve it as well
+    Add the statistics of the values of each field, when they were computed. Lengths and top
+    values are JSON arrays of pairs
     """
-    def __init__(self, database_path):
+    con.execute(
+        """
+        CREATE TABLE field_statistics (
+            metadata_id INTEGER PRIMARY KEY REFERENCES metadata(id) ON DELETE CASCADE,
+            minimum INTEGER,
+            maximum INTEGER,
+            mean REAL,
+            variance REAL,
+            distinct_count INTEGER NOT NULL,
+            lengths TEXT,
+            top_values TEXT NOT NULL
+        );"""
+    )
+
+
+def _index_field_names(con: sqlite3.Connection) -> None:
+    """
+    Index metadata by field name and type, to look up the files having a field and the types of
+    each field across files
+    """
+    con.execute("CREATE INDEX metadata_field_name ON metadata(field_name, field_type)")
+
+
+def _extend_field_types(con: sqlite3.Connection) -> None:
+    """
+    Allow the types of the extended type system in metadata: booleans, floats, decimals, dates and
+    timestamps. SQLite can't alter a CHECK constraint, so the table is rebuilt. The new table is
+    renamed once the old one is dropped, so field_statistics keeps referencing metadata
+    """
+    con.execute(
+        """
+        CREATE TABLE new_metadata (
+            id INTEGER PRIMARY KEY,
+            file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+            field_name TEXT NOT NULL,
+            field_type TEXT CHECK( field_type IN ('B','I','F','N','D','T','S') ),
+            total_occurrences INTEGER CHECK( total_occurrences > 0 ) NOT NULL,
+            null_occurrences INTEGER CHECK( null_occurrences >= 0 ) NOT NULL,
+            total_margin INTEGER,
+            null_margin INTEGER,
+            CHECK ( total_occurrences >= null_occurrences )
+        );"""
+    )
+    con.execute(
+        """
+        INSERT INTO new_metadata(id, file_id, field_name, field_type, total_occurrences, null_occurrences,
+                                 total_margin, null_margin)
+        SELECT id, file_id, field_name, field_type, total_occurrences, null_occurrences, total_margin, null_margin
+        FROM metadata"""
+    )
+    con.execute("DROP TABLE metadata")
+    con.execute("ALTER TABLE new_metadata RENAME TO metadata")
+    con.execute("CREATE INDEX metadata_file_id ON metadata(file_id)")
+    con.execute("CREATE INDEX metadata_field_name ON metadata(field_name, field_type)")
+
+
+# Migrations applied, in order, to bring a DB to the current schema. The version of the
+# schema of a DB (its user_version pragma) is the amount of migrations applied to it.
+# DBs created before versioning have version 0 and the original metadata table.
+_MIGRATIONS = [
+    _create_metadata_table,
+    _create_files_table,
+    _add_fingerprints,
+    _add_crawled_bytes,
+    _add_margins,
+    _create_field_statistics_table,
+    _index_field_names,
+    _extend_field_types,
+]
+
+
+def _upgrade_schema(con: sqlite3.Connection) -> None:
+    """
+    Apply the migrations a DB is missing. Each migration is applied in its own transaction.
+
+    :param con: a connection to the DB, in autocommit mode
+    """
+    version = con.execute('PRAGMA user_version').fetchone()[0]
+    for idx, migration in enumerate(_MIGRATIONS[version:], start=version + 1):
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            migration(con)
+            con.execute(f'PRAGMA user_version={idx}')
+        except BaseException:
+            con.execute('ROLLBACK')
+            raise
+        con.execute('COMMIT')
+
+
+_INSERT_METADATA = ("insert into "
+                    "metadata(file_id, field_name, field_type, total_occurrences, null_occurrences, "
+                    "total_margin, null_margin) "
+                    "values (?, ?, ?, ?, ?, ?, ?)")
+
+
+def _store_field_statistics(con: sqlite3.Connection, metadata_id: int, statistics: FieldStatistics) -> None:
+    con.execute("insert into field_statistics(metadata_id, minimum, maximum, mean, variance, distinct_count, "
+                "lengths, top_values) values (?, ?, ?, ?, ?, ?, ?, ?)",
+                (metadata_id, statistics.minimum, statistics.maximum, statistics.mean, statistics.variance,
+                 statistics.distinct, None if statistics.lengths is None else json.dumps(statistics.lengths),
+                 json.dumps(statistics.top_values)))
+
+
+def _prefix_range(prefix: Optional[str], column: str = 'files.path') -> Tuple[str, List[str]]:
+    """
+    Build the condition matching the paths that start with a prefix, as a range of paths, so
+    it's looked up in the index of paths (LIKE can't be, as it's case-insensitive).
+
+    :param prefix: the prefix. Every path matches if None or empty
+    :param column: the column holding the paths
+    :return: the condition on the column, and its parameters
+    """
+    if not prefix:
+        return "1", []
+    if prefix[-1] == chr(0x10ffff):
+        return f"{column} >= ?", [prefix]
+    # TEXT is compared as UTF-8 bytes, which sorts as code points: paths with the prefix sort
+    # before the prefix with its last character incremented
+    return f"{column} >= ? and {column} < ?", [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+
+
+def _retrieve_field_statistics(row: sqlite3.Row) -> Optional[FieldStatistics]:
+    if row["distinct_count"] is None:
+        return None
+
+    lengths = None if row["lengths"] is None else tuple(tuple(pair) for pair in json.loads(row["lengths"]))
+    return FieldStatistics(row["minimum"], row["maximum"], row["mean"], row["variance"], row["distinct_count"],
+                           lengths, tuple(tuple(pair) for pair in json.loads(row["top_values"])))
+
+
+def _row_to_metadata(row: sqlite3.Row) -> Metadata:
+    return Metadata(row["field_name"], row["field_type"], row["total_occurrences"], row["null_occurrences"],
+                    row["total_margin"], row["null_margin"], _retrieve_field_statistics(row))
+
+
+def storage_backend(name):
+    """
+    This decorator registers classes to be used as storage backends.
+
+    :param name: the name of the backend
+    """
+    def deco(cls):
+        assert name not in storage_backends, f"backend {name} already registered"
+        storage_backends[name] = cls
+        return cls
+    return deco
+
+
+class StorageBackend(ABC):
+    """
+    Interface of the backends that store metadata into a DB and retrieve it as well.
+
+    A backend is created with the path to its DB, which is created if it doesn't exist, the
+    amount of calls to store_metadata committed together (<batch_size>) and whether only the
+    thread that created it can use it (<check_same_thread>). Backends with a batch size bigger
+    than one must be closed (or used as a context manager) to commit the last batch. Every
+    backend must retrieve the same metadata, in the same order, for the same calls.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @abstractmethod
+    def store_metadata(self, file_path: str, metadata: Iterable[Metadata],
+                       fingerprint: Optional[FileFingerprint] = None, crawled_bytes: Optional[int] = None) -> None:
+        """
+        Store metadata into the db.
+
+        The metadata of a file is stored entirely or not at all, replacing the metadata
+        previously stored for the same file.
+
+        :param file_path: the file path the metadata was obtained from
+        :param metadata: the metadata to store
+        :param fingerprint: the fingerprint of the file when the metadata was obtained
+        :param crawled_bytes: the offset up to which the file was crawled, if crawling can be resumed from it
+        :raises StoringException if storing fails
+        """
+
+    @abstractmethod
+    def commit(self) -> None:
+        """
+        Commit the metadata stored so far.
+
+        :raises StoringException if committing fails
+        """
+
+    @abstractmethod
+    def close(self) -> None:
+        """
+        Commit the metadata stored so far and close the connection to the DB.
+
+        :raises StoringException if committing fails
+        """
+
+    @abstractmethod
+    def retrieve_metadata(self, file_path: str) -> Generator[Metadata, None, None]:
+        """
+        Retrieve metadata from db, in the order it was stored.
+
+        :param file_path: the file path the metadata was obtained from
+        :raises StoringException if retrieval fails
+        """
+
+    @abstractmethod
+    def query_files(self, prefix: Optional[str] = None,
+                    field: Optional[str] = None) -> Generator[FileMetadata, None, None]:
+        """
+        Retrieve the files whose path starts with a prefix and that have a field, with their
+        metadata, in the order of their paths.
+
+        :param prefix: the prefix of the paths of the files. Every file matches if None
+        :param field: the name of a field the files must have. Only the metadata of that field is
+                      retrieved. Every file matches, with all its metadata, if None
+        :return: a generator object that produces a FileMetadata per file
+        :raises StoringException if retrieval fails
+        """
+
+    @abstractmethod
+    def query_type_conflicts(self, prefix: Optional[str] = None) -> Generator[FieldTypes, None, None]:
+        """
+        Retrieve the fields whose type differs across files, in the order of their names. Fields
+        whose values are all null in a file have no type in it, which doesn't conflict with any type.
+
+        :param prefix: the prefix of the paths of the files to compare. Every file is compared if None
+        :return: a generator object that produces FieldTypes, one per field with more than one type
+        :raises StoringException if retrieval fails
+        """
+
+    @abstractmethod
+    def retrieve_fingerprint(self, file_path: str) -> Optional[FileFingerprint]:
+        """
+        Retrieve the fingerprint a file had when its metadata was stored.
+
+        :param file_path: the file path the metadata was obtained from
+        :return: the fingerprint, or None if the file was never stored or was stored without one
+        :raises StoringException if retrieval fails
+        """
+
+    @abstractmethod
+    def retrieve_crawled_bytes(self, file_path: str) -> Optional[int]:
+        """
+        Retrieve the offset up to which a file was crawled, when crawling it can be resumed.
+
+        :param file_path: the file path the metadata was obtained from
+        :return: the offset, or None if crawling the file can't be resumed
+        :raises StoringException if retrieval fails
+        """
+
+
+@storage_backend(SQLITE)
+class MetadataStorageManager(StorageBackend):
+    """
+    Provides the logic to store metadata into a SQLite DB and retrieve it as well
+
+    A single connection to the DB is kept open for the whole life of the manager. Stored
+    metadata is committed every <batch_size> calls to store_metadata, so managers with a
+    batch size bigger than one must be closed (or used as a context manager) to commit
+    the last batch.
+
+    Unless check_same_thread is False, a manager can only be used by the thread that
+    opened its connection. Threads sharing a manager must serialize their calls.
+    """
+    def __init__(self, database_path, batch_size: int = 1, journal_mode: str = 'wal',
+                 synchronous: Optional[str] = 'normal', cache_size: Optional[int] = None,
+                 mmap_size: Optional[int] = None, check_same_thread: bool = True):
+        """
+        :param database_path: path to the db file. It's created if it doesn't exists.
+        :param batch_size: the amount of calls to store_metadata committed together
+        :param journal_mode: the journal_mode pragma of the connection
+        :param synchronous: the synchronous pragma of the connection. SQLite's default if None
+        :param cache_size: the cache_size pragma of the connection. SQLite's default if None
+        :param mmap_size: the mmap_size pragma of the connection. SQLite's default if None
+        :param check_same_thread: whether only the thread that opened the connection can use it
+        """
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive')
+        if journal_mode.lower() not in _JOURNAL_MODES:
+            raise ValueError(f"Unknown journal mode '{journal_mode}'")
+        if synchronous is not None and synchronous.lower() not in _SYNCHRONOUS_MODES:
+            raise ValueError(f"Unknown synchronous mode '{synchronous}'")
+
         self._db_path = database_path
+        self._batch_size = batch_size
+        self._pragmas = [('journal_mode', journal_mode), ('synchronous', synchronous),
+                         ('cache_size', None if cache_size is None else int(cache_size)),
+                         ('mmap_size', None if mmap_size is None else int(mmap_size))]
+        self._check_same_thread = check_same_thread
+        self._con = None
+        self._pending = 0
+
         if not os.path.isfile(database_path) or os.path.getsize(database_path) == 0:
             self._create_db_schema()
 
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Get the connection to the DB, opening it if needed.
+
+        The connection is in autocommit mode: transactions are handled explicitly. The
+        schema of the DB is created or upgraded when the connection is opened.
+        """
+        if self._con is None:
+            con = sqlite3.connect(self._db_path, isolation_level=None, check_same_thread=self._check_same_thread)
+            try:
+                for pragma, value in self._pragmas:
+                    if value is not None:
+                        con.execute(f'PRAGMA {pragma}={value}')
+                # enforced once the schema is upgraded: migrations rebuilding a table would
+                # otherwise cascade the deletion of its rows when dropping the old table
+                _upgrade_schema(con)
+                con.execute('PRAGMA foreign_keys=ON')
+            except sqlite3.DatabaseError:
+                con.close()
+                raise
+            con.row_factory = sqlite3.Row
+            self._con = con
+
+        return self._con
+
     def _create_db_schema(self):
         """
         Creates the DB schema for metadata storing
         """
         try:
-            with sqlite3.connect(self._db_path) as con:
-                con.execute(
-                    """
-                    CREATE TABLE metadata (
-                        id INTEGER PRIMARY KEY,
-                        file_id TEXT NOT NULL,
-                        field_name TEXT NOT NULL,
-                        field_type TEXT CHECK( field_type IN ('I','S') ),
-                        total_occurrences INTEGER CHECK( total_occurrences > 0 ) NOT NULL,
-                        null_occurrences INTEGER CHECK( null_occurrences >= 0 ) NOT NULL,
-                        CHECK ( total_occurrences >= null_occurrences )
-                    );"""
-                )
+            self._connection()
         except sqlite3.DatabaseError:
             raise StoringException("Could not create db schema. Is it a readable path?")
 
-    def store_metadata(self, file_path: str, metadata: Iterable[Metadata]) -> None:
+    def store_metadata(self, file_path: str, metadata: Iterable[Metadata],
+                       fingerprint: Optional[FileFingerprint] = None, crawled_bytes: Optional[int] = None) -> None:
         """
         Store metadata into the db.
 
+        The metadata of a file is stored entirely or not at all: if storing fails, the
+        metadata of the other files in the current batch is kept. Metadata previously
+        stored for the same file is replaced.
+
         :param file_path: the file path the metadata was obtained from
         :param metadata: the metadata to store
+        :param fingerprint: the fingerprint of the file when the metadata was obtained
+        :param crawled_bytes: the offset up to which the file was crawled, if crawling can be resumed from it
         :raises StoringException if storing fails
         """
         try:
-            with sqlite3.connect(self._db_path) as con:
-                con.executemany("insert into "
-                                "metadata(file_id, field_name, field_type, total_occurrences, null_occurrences) "
-                                "values (?, ?, ?, ?, ?)",
-                                [(file_path,
-                                  metadata.field,
-                                  metadata.type,
-                                  metadata.total_occurrences,
-                                  metadata.null_occurrences) for metadata in metadata])
+            con = self._connection()
+            if not con.in_transaction:
+                con.execute('BEGIN')
+            con.execute('SAVEPOINT store_metadata')
         except sqlite3.DatabaseError:
             raise StoringException("Could not store metadata into the DB. Is it corrupted?")
 
+        try:
+            size, mtime, content_hash = fingerprint or (None, None, None)
+            row = con.execute("select id from files where path=?", (file_path,)).fetchone()
+            if row is None:
+                file_id = con.execute("insert into files(path, size, mtime_ns, content_hash, crawled_bytes) "
+                                      "values (?, ?, ?, ?, ?)",
+                                      (file_path, size, mtime, content_hash, crawled_bytes)).lastrowid
+            else:
+                file_id = row["id"]
+                con.execute("update files set size=?, mtime_ns=?, content_hash=?, crawled_bytes=? where id=?",
+                            (size, mtime, content_hash, crawled_bytes, file_id))
+                con.execute("delete from metadata where file_id=?", (file_id,))
+            metadata = list(metadata)
+            rows = ((file_id,
+                     metadata.field,
+                     metadata.type,
+                     metadata.total_occurrences,
+                     metadata.null_occurrences,
+                     metadata.total_margin,
+                     metadata.null_margin) for metadata in metadata)
+            if all(m.statistics is None for m in metadata):
+                con.executemany(_INSERT_METADATA, rows)
+            else:
+                for m, row in zip(metadata, rows):
+                    metadata_id = con.execute(_INSERT_METADATA, row).lastrowid
+                    if m.statistics is not None:
+                        _store_field_statistics(con, metadata_id, m.statistics)
+        except BaseException as e:
+            con.execute('ROLLBACK TO store_metadata')
+            con.execute('RELEASE store_metadata')
+            if isinstance(e, sqlite3.DatabaseError):
+                raise StoringException("Could not store metadata into the DB. Is it corrupted?")
+            raise
+
+        con.execute('RELEASE store_metadata')
+        self._pending += 1
+        if self._pending >= self._batch_size:
+            self.commit()
+
+    def commit(self) -> None:
+        """
+        Commit the metadata stored so far.
+
+        :raises StoringException if committing fails
+        """
+        self._pending = 0
+        if self._con is None or not self._con.in_transaction:
+            return
+
+        try:
+            self._con.execute('COMMIT')
+        except sqlite3.DatabaseError:
+            raise StoringException("Could not store metadata into the DB. Is it corrupted?")
+
+    def close(self) -> None:
+        """
+        Commit the metadata stored so far and close the connection to the DB.
+
+        :raises StoringException if committing fails
+        """
+        if self._con is None:
+            return
+
+        try:
+            self.commit()
+        finally:
+            self._con.close()
+            self._con = None
+
     def retrieve_metadata(self, file_path: str) -> Generator[Metadata, None, None]:
         """
         Retrieve metadata from db.
@@ -73,10 +555,465 @@ class MetadataStorageManager:
         :raises StoringException if retrieval fails
         """
         try:
-            with sqlite3.connect(self._db_path) as con:
-                con.row_factory = sqlite3.Row
-                for row in con.execute("select * from metadata where file_id=?", (file_path,)):
-                    yield Metadata(row["field_name"], row["field_type"],
-                                   row["total_occurrences"], row["null_occurrences"])
+            for row in self._connection().execute("select metadata.*, field_statistics.* from files "
+                                                  "join metadata on metadata.file_id = files.id "
+                                                  "left join field_statistics on field_statistics.metadata_id = "
+                                                  "metadata.id "
+                                                  "where files.path=? order by metadata.id", (file_path,)):
+                yield _row_to_metadata(row)
         except sqlite3.DatabaseError:
             raise StoringException("Could not retrieve metadata from DB. Is it corrupted?")
+
+    def query_files(self, prefix: Optional[str] = None,
+                    field: Optional[str] = None) -> Generator[FileMetadata, None, None]:
+        """
+        Retrieve the files whose path starts with a prefix and that have a field, with their metadata.
+
+        Files are streamed in the order of their paths, looked up in the index of paths. When
+        only the field is given, they are looked up in the index of field names instead, and
+        sorted by SQLite (spilling to a temporary file if needed) before the first is produced.
+
+        :param prefix: the prefix of the paths of the files. Every file matches if None
+        :param field: the name of a field the files must have. Only the metadata of that field is
+                      retrieved. Every file matches, with all its metadata, if None
+        :return: a generator object that produces a FileMetadata per file
+        :raises StoringException if retrieval fails
+        """
+        condition, params = _prefix_range(prefix)
+        if field is not None:
+            condition += " and metadata.field_name = ?"
+            params.append(field)
+
+        try:
+            rows = self._connection().execute("select files.path, metadata.*, field_statistics.* from files "
+                                              "join metadata on metadata.file_id = files.id "
+                                              "left join field_statistics on field_statistics.metadata_id = "
+                                              "metadata.id "
+                                              f"where {condition} order by files.path, metadata.id", params)
+            for path, file_rows in itertools.groupby(rows, key=lambda row: row["path"]):
+                yield FileMetadata(path, [_row_to_metadata(row) for row in file_rows])
+        except sqlite3.DatabaseError:
+            raise StoringException("Could not retrieve metadata from DB. Is it corrupted?")
+
+    def query_type_conflicts(self, prefix: Optional[str] = None) -> Generator[FieldTypes, None, None]:
+        """
+        Retrieve the fields whose type differs across files. Fields whose values are all null in
+        a file have no type in it, which doesn't conflict with any type.
+
+        Fields are streamed in the order of their names. When every file is queried, types are
+        counted from the index of field names alone.
+
+        :param prefix: the prefix of the paths of the files to compare. Every file is compared if None
+        :return: a generator object that produces FieldTypes, one per field with more than one type
+        :raises StoringException if retrieval fails
+        """
+        condition, params = _prefix_range(prefix)
+        join = "" if condition == "1" else "join files on files.id = metadata.file_id "
+        try:
+            rows = self._connection().execute("select metadata.field_name, metadata.field_type, count(*) as files "
+                                              f"from metadata {join}"
+                                              f"where metadata.field_type is not null and {condition} "
+                                              "group by metadata.field_name, metadata.field_type "
+                                              "order by metadata.field_name, metadata.field_type", params)
+            for field, field_rows in itertools.groupby(rows, key=lambda row: row["field_name"]):
+                types = tuple((row["field_type"], row["files"]) for row in field_rows)
+                if len(types) > 1:
+                    yield FieldTypes(field, types)
+        except sqlite3.DatabaseError:
+            raise StoringException("Could not retrieve metadata from DB. Is it corrupted?")
+
+    def retrieve_fingerprint(self, file_path: str) -> Optional[FileFingerprint]:
+        """
+        Retrieve the fingerprint a file had when its metadata was stored.
+
+        :param file_path: the file path the metadata was obtained from
+        :return: the fingerprint, or None if the file was never stored or was stored without one
+        :raises StoringException if retrieval fails
+        """
+        try:
+            row = self._connection().execute("select size, mtime_ns, content_hash from files where path=?",
+                                             (file_path,)).fetchone()
+        except sqlite3.DatabaseError:
+            raise StoringException("Could not retrieve metadata from DB. Is it corrupted?")
+
+        if row is None or row["size"] is None:
+            return None
+        return FileFingerprint(row["size"], row["mtime_ns"], row["content_hash"])
+
+    def retrieve_crawled_bytes(self, file_path: str) -> Optional[int]:
+        """
+        Retrieve the offset up to which a file was crawled, when crawling it can be resumed.
+
+        :param file_path: the file path the metadata was obtained from
+        :return: the offset, or None if crawling the file can't be resumed
+        :raises StoringException if retrieval fails
+        """
+        try:
+            row = self._connection().execute("select crawled_bytes from files where path=?",
+                                             (file_path,)).fetchone()
+        except sqlite3.DatabaseError:
+            raise StoringException("Could not retrieve metadata from DB. Is it corrupted?")
+
+        return None if row is None else row["crawled_bytes"]
+
+
+# Columns of the DuckDB tables, in order, with their types
+_DUCKDB_FILES_COLUMNS = [('path', 'VARCHAR'), ('size', 'BIGINT'), ('mtime_ns', 'BIGINT'), ('content_hash', 'VARCHAR'),
+                         ('crawled_bytes', 'BIGINT')]
+
+_DUCKDB_METADATA_COLUMNS = [('path', 'VARCHAR'), ('position', 'INTEGER'), ('field_name', 'VARCHAR'),
+                            ('field_type', 'VARCHAR'), ('total_occurrences', 'BIGINT'), ('null_occurrences', 'BIGINT'),
+                            ('total_margin', 'BIGINT'), ('null_margin', 'BIGINT'), ('minimum', 'VARCHAR'),
+                            ('maximum', 'VARCHAR'), ('mean', 'DOUBLE'), ('variance', 'DOUBLE'),
+                            ('distinct_count', 'BIGINT'), ('lengths', 'VARCHAR'), ('top_values', 'VARCHAR')]
+
+_DUCKDB_SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS files (
+        {', '.join(f'{name} {column_type}' for name, column_type in _DUCKDB_FILES_COLUMNS)}
+    );""",
+    f"""
+    CREATE TABLE IF NOT EXISTS metadata (
+        {', '.join(f'{name} {column_type}' for name, column_type in _DUCKDB_METADATA_COLUMNS)},
+        CHECK( field_type IN ({', '.join(f"'{t}'" for t in INTERNAL_TYPES)}) ),
+        CHECK( total_occurrences > 0 ),
+        CHECK( null_occurrences >= 0 ),
+        CHECK( total_occurrences >= null_occurrences )
+    );""",
+    "CREATE INDEX IF NOT EXISTS files_path ON files(path)",
+    "CREATE INDEX IF NOT EXISTS metadata_path ON metadata(path)",
+]
+
+_DUCKDB_METADATA_SELECT = ', '.join(name for name, _ in _DUCKDB_METADATA_COLUMNS[2:])
+
+# Columns of the DuckDB tables that are never null, whose empty values are empty strings
+_DUCKDB_NOT_NULL = ['path', 'field_name']
+
+# Rows of a DuckDB query fetched at once, so results are streamed at catalog scale
+_DUCKDB_FETCH_SIZE = 1024
+
+
+def _read_staged_csv(columns: List[Tuple[str, str]]) -> str:
+    """
+    Build the call to read a CSV file of staged rows with the given columns, written by _stage_rows().
+    """
+    types = ', '.join(f"'{name}': '{column_type}'" for name, column_type in columns)
+    not_null = ', '.join(f"'{name}'" for name, _ in columns if name in _DUCKDB_NOT_NULL)
+    return (f"read_csv(?, header=false, columns={{{types}}}, quote='\"', escape='\"', nullstr='', "
+            f"force_not_null=[{not_null}])")
+
+
+def _stage_rows(rows: Iterable[tuple]) -> str:
+    """
+    Write rows into a temporary CSV file, to be loaded at once by DuckDB. Nulls are written as
+    empty values, so empty strings can only be loaded into the columns that are never null.
+
+    :return: the path of the file
+    """
+    fd, path = tempfile.mkstemp(prefix='metadata_gather-', suffix='.csv')
+    with open(fd, mode='w', encoding='utf-8', newline='') as f:
+        csv.writer(f, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+    return path
+
+
+def _metadata_rows(file_path: str, metadata: List[Metadata]) -> Generator[tuple, None, None]:
+    for position, m in enumerate(metadata):
+        statistics = m.statistics
+        if statistics is None:
+            yield (file_path, position, m.field, m.type, m.total_occurrences, m.null_occurrences, m.total_margin,
+                   m.null_margin, None, None, None, None, None, None, None)
+        else:
+            yield (file_path, position, m.field, m.type, m.total_occurrences, m.null_occurrences, m.total_margin,
+                   m.null_margin, json.dumps(statistics.minimum), json.dumps(statistics.maximum), statistics.mean,
+                   statistics.variance, statistics.distinct,
+                   None if statistics.lengths is None else json.dumps(statistics.lengths),
+                   json.dumps(statistics.top_values))
+
+
+def _duckdb_row_to_metadata(row: tuple) -> Metadata:
+    (field, field_type, total, nulls, total_margin, null_margin, minimum, maximum, mean, variance, distinct,
+     lengths, top_values) = row
+    statistics = None
+    if distinct is not None:
+        statistics = FieldStatistics(json.loads(minimum), json.loads(maximum), mean, variance, distinct,
+                                     None if lengths is None else tuple(tuple(pair) for pair in json.loads(lengths)),
+                                     tuple(tuple(pair) for pair in json.loads(top_values)))
+    return Metadata(field, field_type, total, nulls, total_margin, null_margin, statistics)
+
+
+def _valid_metadata(m: Metadata) -> bool:
+    return (m.type is None or m.type in INTERNAL_TYPES) and m.total_occurrences > 0 and \
+        0 <= m.null_occurrences <= m.total_occurrences
+
+
+if duckdb is not None:
+    @storage_backend(DUCKDB)
+    class DuckDBStorage(StorageBackend):
+        """
+        Provides the logic to store metadata into a DuckDB DB, in columns, and retrieve it as well
+
+        Stored metadata is buffered, and each batch of <batch_size> calls to store_metadata is
+        written at once: its rows are staged in a temporary CSV file, loaded by DuckDB in a single
+        statement. A batch fails as a whole if writing it fails, but metadata that can't be stored
+        is rejected by store_metadata, so that only happens if the DB can't be written. Reading
+        writes the buffered metadata first, without committing it.
+
+        The metadata of every field is a row of the metadata table, along with the path of its
+        file and its statistics, so catalog queries scan the columns they need only. Paths are
+        indexed, to look up files.
+
+        DuckDB connections can be used by any thread, so check_same_thread is ignored. Threads
+        sharing a backend must serialize their calls. A DuckDB DB can only be opened for writing
+        by one process at a time.
+        """
+        def __init__(self, database_path, batch_size: int = 1, check_same_thread: bool = True):
+            """
+            :param database_path: path to the db file. It's created if it doesn't exists, or if it's empty.
+            :param batch_size: the amount of calls to store_metadata written and committed together
+            :param check_same_thread: ignored, see the class
+            """
+            if batch_size < 1:
+                raise ValueError('batch_size must be positive')
+
+            self._db_path = database_path
+            self._batch_size = batch_size
+            self._con = None
+            # metadata to write, by path
+            self._pending = dict()
+            self._calls = 0
+            self._in_transaction = False
+
+            if os.path.isfile(database_path) and os.path.getsize(database_path) == 0:
+                # DuckDB doesn't open empty files, like the ones created to hold a new DB
+                os.remove(database_path)
+            if not os.path.isfile(database_path):
+                self._connection()
+
+        def _connection(self):
+            """
+            Get the connection to the DB, opening it and creating its schema if needed.
+
+            The connection is in autocommit mode: batches are written and committed explicitly.
+            """
+            if self._con is None:
+                try:
+                    # DBs of other formats must fail to open, instead of being attached by an extension
+                    con = duckdb.connect(self._db_path, config={'autoinstall_known_extensions': False,
+                                                                'autoload_known_extensions': False})
+                except duckdb.Error:
+                    raise StoringException("Could not create db schema. Is it a readable path?")
+                try:
+                    for statement in _DUCKDB_SCHEMA:
+                        con.execute(statement)
+                except duckdb.Error:
+                    con.close()
+                    raise StoringException("Could not create db schema. Is it a readable path?")
+                self._con = con
+
+            return self._con
+
+        def store_metadata(self, file_path: str, metadata: Iterable[Metadata],
+                           fingerprint: Optional[FileFingerprint] = None, crawled_bytes: Optional[int] = None) -> None:
+            """
+            Store metadata into the db. See StorageBackend.store_metadata().
+
+            :raises StoringException if the metadata can't be stored, like the field type is unknown
+            """
+            metadata = list(metadata)
+            if not all(map(_valid_metadata, metadata)):
+                raise StoringException("Could not store metadata into the DB. Is it corrupted?")
+
+            # a file stored again in the same batch replaces the pending metadata
+            self._pending.pop(file_path, None)
+            size, mtime, content_hash = fingerprint or (None, None, None)
+            self._pending[file_path] = ((file_path, size, mtime, content_hash, crawled_bytes), metadata)
+            self._calls += 1
+            if self._calls >= self._batch_size:
+                self.commit()
+
+        def _write_pending(self) -> None:
+            """
+            Write the buffered metadata into the DB, in the current transaction, replacing the
+            stored metadata of the same files.
+
+            :raises StoringException if writing fails. The current transaction is rolled back
+            """
+            if not self._pending:
+                return
+
+            con = self._connection()
+            pending, self._pending = self._pending, dict()
+            # sorted, so the rows of a file are contiguous and the zone maps of paths are narrow
+            paths = sorted(pending)
+            staged = []
+            try:
+                staged.append(_stage_rows(pending[path][0] for path in paths))
+                staged.append(_stage_rows(row for path in paths for row in _metadata_rows(path, pending[path][1])))
+                if not self._in_transaction:
+                    con.execute('BEGIN TRANSACTION')
+                    self._in_transaction = True
+                con.execute(f"CREATE TEMP TABLE staged_files AS SELECT * FROM "
+                            f"{_read_staged_csv(_DUCKDB_FILES_COLUMNS)}", (staged[0],))
+                con.execute("DELETE FROM metadata WHERE path IN (SELECT path FROM staged_files)")
+                con.execute("DELETE FROM files WHERE path IN (SELECT path FROM staged_files)")
+                con.execute("INSERT INTO files SELECT * FROM staged_files")
+                con.execute("DROP TABLE staged_files")
+                if os.path.getsize(staged[1]):
+                    con.execute(f"INSERT INTO metadata SELECT * FROM {_read_staged_csv(_DUCKDB_METADATA_COLUMNS)}",
+                                (staged[1],))
+            except (duckdb.Error, OSError, UnicodeError):
+                self._rollback()
+                raise StoringException("Could not store metadata into the DB. Is it corrupted?")
+            finally:
+                for path in staged:
+                    os.remove(path)
+
+        def _rollback(self) -> None:
+            if self._in_transaction:
+                self._in_transaction = False
+                try:
+                    self._con.execute('ROLLBACK')
+                except duckdb.Error:
+                    pass
+
+        def commit(self) -> None:
+            """
+            Write and commit the metadata stored so far.
+
+            :raises StoringException if committing fails
+            """
+            self._calls = 0
+            self._write_pending()
+            if not self._in_transaction:
+                return
+
+            self._in_transaction = False
+            try:
+                self._con.execute('COMMIT')
+            except duckdb.Error:
+                raise StoringException("Could not store metadata into the DB. Is it corrupted?")
+
+        def close(self) -> None:
+            """
+            Write and commit the metadata stored so far and close the connection to the DB.
+
+            :raises StoringException if committing fails
+            """
+            if self._con is None and not self._pending:
+                return
+
+            try:
+                self.commit()
+            finally:
+                self._pending = dict()
+                if self._con is not None:
+                    self._con.close()
+                    self._con = None
+
+        def _query(self, sql: str, params: Iterable = ()) -> Iterator[tuple]:
+            """
+            Run a query, once the buffered metadata is written, and stream its rows, fetched a few
+            at a time. The query runs in the connection that writes, so it sees the metadata of the
+            current transaction, and the connection can't be used until the rows are consumed.
+
+            :raises StoringException if retrieval fails
+            """
+            self._write_pending()
+            try:
+                result = self._connection().execute(sql, list(params))
+                while True:
+                    rows = result.fetchmany(_DUCKDB_FETCH_SIZE)
+                    if not rows:
+                        return
+                    yield from rows
+            except duckdb.Error:
+                raise StoringException("Could not retrieve metadata from DB. Is it corrupted?")
+
+        def retrieve_metadata(self, file_path: str) -> Generator[Metadata, None, None]:
+            """
+            Retrieve metadata from db. See StorageBackend.retrieve_metadata().
+            """
+            rows = self._query(f"SELECT {_DUCKDB_METADATA_SELECT} FROM metadata WHERE path=? ORDER BY position",
+                               (file_path,))
+            yield from map(_duckdb_row_to_metadata, rows)
+
+        def query_files(self, prefix: Optional[str] = None,
+                        field: Optional[str] = None) -> Generator[FileMetadata, None, None]:
+            """
+            Retrieve the files whose path starts with a prefix and that have a field, with their
+            metadata. See StorageBackend.query_files().
+            """
+            condition, params = _prefix_range(prefix, 'path')
+            if field is not None:
+                condition += " AND field_name = ?"
+                params.append(field)
+
+            rows = self._query(f"SELECT path, {_DUCKDB_METADATA_SELECT} FROM metadata WHERE {condition} "
+                               "ORDER BY path, position", params)
+            for path, file_rows in itertools.groupby(rows, key=lambda row: row[0]):
+                yield FileMetadata(path, [_duckdb_row_to_metadata(row[1:]) for row in file_rows])
+
+        def query_type_conflicts(self, prefix: Optional[str] = None) -> Generator[FieldTypes, None, None]:
+            """
+            Retrieve the fields whose type differs across files. See StorageBackend.query_type_conflicts().
+
+            Types are counted scanning the columns of field names, types and paths only.
+            """
+            condition, params = _prefix_range(prefix, 'path')
+            rows = self._query("SELECT field_name, field_type, count(*) FROM metadata "
+                               f"WHERE field_type IS NOT NULL AND {condition} "
+                               "GROUP BY field_name, field_type ORDER BY field_name, field_type", params)
+            for field, field_rows in itertools.groupby(rows, key=lambda row: row[0]):
+                types = tuple((field_type, files) for _, field_type, files in field_rows)
+                if len(types) > 1:
+                    yield FieldTypes(field, types)
+
+        def retrieve_fingerprint(self, file_path: str) -> Optional[FileFingerprint]:
+            """
+            Retrieve the fingerprint a file had when its metadata was stored. See
+            StorageBackend.retrieve_fingerprint().
+            """
+            row = next(self._query("SELECT size, mtime_ns, content_hash FROM files WHERE path=?", (file_path,)), None)
+            if row is None or row[0] is None:
+                return None
+            return FileFingerprint(*row)
+
+        def retrieve_crawled_bytes(self, file_path: str) -> Optional[int]:
+            """
+            Retrieve the offset up to which a file was crawled, when crawling it can be resumed. See
+            StorageBackend.retrieve_crawled_bytes().
+            """
+            row = next(self._query("SELECT crawled_bytes FROM files WHERE path=?", (file_path,)), None)
+            return row[0] if row is not None else None
+
+
+def get_storage_backend(name: Optional[str] = None) -> str:
+    """
+    Resolve the name of the storage backend to use.
+
+    :param name: the name of the backend. When None, the one in the METADATA_GATHER_STORAGE_BACKEND
+    environment variable is used, or else sqlite
+    :return: the name of a registered backend
+    :raises StoringException if the backend is not registered
+    """
+    name = name or os.environ.get(BACKEND_ENV_VAR) or SQLITE
+    if name not in storage_backends:
+        raise StoringException(f"Unknown storage backend '{name}'. Available backends are: "
+                               f"{', '.join(storage_backends)}")
+    return name
+
+
+def open_storage(database_path: str, backend: Optional[str] = None, batch_size: int = 1,
+                 check_same_thread: bool = True) -> StorageBackend:
+    """
+    Open the DB storing metadata with a storage backend.
+
+    :param database_path: path to the db file. It's created if it doesn't exists.
+    :param backend: the name of the backend, resolved by get_storage_backend()
+    :param batch_size: the amount of calls to store_metadata committed together
+    :param check_same_thread: whether only the thread that opened the DB can use the backend
+    :return: the backend, to be closed (or used as a context manager)
+    :raises StoringException if the backend is not registered, or the DB can't be opened
+    """
+    return storage_backends[get_storage_backend(backend)](database_path, batch_size=batch_size,
+                                                          check_same_thread=check_same_thread)
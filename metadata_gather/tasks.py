@@ -0,0 +1,420 @@
+"""
+This module isolates the tasks that glue extraction, crawling and storing together,
+so they can be shared by every execution mode.
+"""
+from collections import namedtuple
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from functools import partial
+import glob
+import os
+from typing import Generator, Iterable, List, Optional
+
+from metadata_extractor import (extract_metadata_from_file, extract_statistics_from_file, is_supported_file,
+                                split_file, supports_splitting, supports_statistics, ExtractionError)
+from crawler import columnize, crawl, crawl_columns, crawl_statistics, merge_metadata, CrawlingError
+from storage_manager import StorageBackend, StoringException, open_storage
+from common import FieldTypes, FileFingerprint, FileMetadata, Metadata, SampleSize
+from fingerprint import ends_with_line_break, fingerprint_if_changed, is_appended
+from instrumentation import Instrumentation, call_measured, count_values, measure_file, stage, timed
+from sampling import sample_file
+
+# A file that could not be crawled, and the reason why
+FileFailure = namedtuple('FileFailure', 'path, reason')
+
+# The outcome of crawling a file that changed: its current fingerprint, the metadata crawled, the offset
+# the crawl was resumed from (None if the whole file was crawled) and the offset crawling can be resumed
+# from next time (None if it can't be resumed)
+CrawlResult = namedtuple('CrawlResult', 'fingerprint, metadata, resumed_from, crawled_bytes')
+
+# The outcome of crawling a batch of files
+BatchSummary = namedtuple('BatchSummary', 'crawled, skipped, failures')
+
+_GLOB_CHARS = frozenset('*?[')
+
+# Files are not split into chunks smaller than this, in bytes
+_MIN_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Amount of files whose metadata is committed together in batch mode
+_COMMIT_BATCH_SIZE = 100
+
+
+def crawl_file(abs_path: str, start: Optional[int] = None, end: Optional[int] = None,
+               with_statistics: bool = False) -> Generator[Metadata, None, None]:
+    """
+    Extract metadata from abs_path and summarize it.
+
+    When the format of the file allows it, the metadata is summarized from per-column
+    statistics instead of from individual records, which is much faster. Otherwise, records
+    are transposed into column batches, summarized by an aggregation engine. Computing the
+    statistics of the values of each field requires individual records, and the whole file.
+
+    :param abs_path: the file to extract metadata from
+    :param start: the offset of a range returned by split_file(). The whole file is crawled if None
+    :param end: the end of the range starting at <start>
+    :param with_statistics: whether to compute the statistics of the values of each field. Requires start to be None
+    :return: a generator object that produces Metadata objects
+    """
+    if with_statistics:
+        assert start is None, "statistics of values can only be computed for whole files"
+        return crawl(timed(extract_metadata_from_file(abs_path), 'extract'), profile=True)
+
+    if supports_statistics(abs_path):
+        return crawl_statistics(timed(extract_statistics_from_file(abs_path, start, end), 'extract'))
+
+    return crawl_columns(columnize(timed(extract_metadata_from_file(abs_path), 'extract')))
+
+
+def _crawl_range_to_list(abs_path: str, start: int, end: int) -> List[Metadata]:
+    # Metadata must be fully computed inside the worker, generators can't be sent back
+    return list(crawl_file(abs_path, start, end))
+
+
+def _chunks(abs_path: str, workers: Optional[int], min_chunk_size: int) -> int:
+    workers = workers or os.cpu_count() or 1
+    return min(workers, os.path.getsize(abs_path) // max(min_chunk_size, 1))
+
+
+def is_worth_splitting(abs_path: str, workers: Optional[int] = None, min_chunk_size: int = _MIN_CHUNK_SIZE) -> bool:
+    """
+    Check whether crawl_file_in_chunks() would crawl a file in chunks, by several worker processes.
+
+    :param abs_path: the file to extract metadata from
+    :param workers: the amount of worker processes. Defaults to the amount of CPUs
+    :param min_chunk_size: the minimum size of a chunk, in bytes
+    :return: True if the file can be split and is big enough to be worth it
+    """
+    return _chunks(abs_path, workers, min_chunk_size) > 1 and supports_splitting(abs_path)
+
+
+def crawl_file_in_chunks(abs_path: str, workers: Optional[int] = None, min_chunk_size: int = _MIN_CHUNK_SIZE,
+                         executor: Optional[Executor] = None) -> Generator[Metadata, None, None]:
+    """
+    Extract metadata from abs_path, crawling chunks of it in parallel.
+
+    The file is split into byte ranges aligned to line boundaries, each range is crawled
+    by a worker process, and the metadata of every range is merged in order. The result
+    is the same as crawl_file(). Files that can't be split, or that are too small to be
+    worth it, are crawled by the calling process.
+
+    :param abs_path: the file to extract metadata from
+    :param workers: the amount of worker processes. Defaults to the amount of CPUs
+    :param min_chunk_size: the minimum size of a chunk, in bytes
+    :param executor: a pool of worker processes to crawl chunks with. A new pool is used if None
+    :return: a generator object that produces Metadata objects
+    """
+    if not is_worth_splitting(abs_path, workers, min_chunk_size):
+        return crawl_file(abs_path)
+
+    ranges = split_file(abs_path, _chunks(abs_path, workers, min_chunk_size))
+    if len(ranges) <= 1:
+        return crawl_file(abs_path)
+
+    with stage('workers'):
+        if executor is None:
+            with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+                partials = list(executor.map(_crawl_range_to_list, [abs_path] * len(ranges), *zip(*ranges)))
+        else:
+            partials = list(executor.map(_crawl_range_to_list, [abs_path] * len(ranges), *zip(*ranges)))
+
+    return merge_metadata(partials)
+
+
+def collect_paths(sources: Iterable[str]) -> List[str]:
+    """
+    Expand a sequence of sources into the absolute paths of the files to crawl.
+
+    Each source can be a directory, which is walked recursively looking for files with
+    a supported extension, a glob pattern, or the path to a single file. Paths are
+    returned in the order they were found, without duplicates.
+
+    :param sources: the directories, glob patterns and files to expand
+    :return: a list of absolute paths
+    """
+    paths = dict()
+
+    for source in sources:
+        if os.path.isdir(source):
+            for dir_path, dir_names, file_names in os.walk(source):
+                dir_names.sort()
+                for file_name in sorted(file_names):
+                    path = os.path.join(dir_path, file_name)
+                    if is_supported_file(path):
+                        paths[os.path.abspath(path)] = None
+        elif _GLOB_CHARS.intersection(source):
+            for path in sorted(glob.iglob(source, recursive=True)):
+                if os.path.isfile(path):
+                    paths[os.path.abspath(path)] = None
+        else:
+            paths[os.path.abspath(source)] = None
+
+    return list(paths)
+
+
+def crawl_if_changed(abs_path: str, stored: Optional[FileFingerprint], crawled_bytes: Optional[int],
+                     with_hash: bool = False, append_only: bool = False, workers: Optional[int] = 1,
+                     executor: Optional[Executor] = None, sample: Optional[SampleSize] = None,
+                     with_statistics: bool = False) -> Optional[CrawlResult]:
+    """
+    Extract metadata from abs_path and summarize it, unless it did not change since it was crawled.
+
+    When appending is allowed, a file that grew since it was crawled is only crawled from
+    the offset it was crawled up to: the resulting metadata must be merged with the stored
+    one, see store_crawl_result(). Only formats that can be split can be resumed.
+
+    When sampling, the metadata of a file that can't be resumed is estimated from a sample
+    of it, see sampling.sample_file(). Approximate metadata is stored without a fingerprint,
+    so the file is crawled again next time.
+
+    Computing the statistics of the values of each field requires every value: the file is
+    crawled whole and serially, and neither resumed nor sampled.
+
+    :param abs_path: the file to extract metadata from
+    :param stored: the fingerprint stored when the file was crawled, if any
+    :param crawled_bytes: the offset up to which the file was crawled, if crawling can be resumed
+    :param with_hash: whether to compare content hashes to detect changes
+    :param append_only: whether files that grew can be assumed to have been appended to
+    :param workers: the amount of worker processes to crawl big files. Defaults to the amount of CPUs
+    :param executor: a pool of worker processes to crawl big files with. A new pool is used if None
+    :param sample: how much of the file to sample. The file is crawled exactly if None
+    :param with_statistics: whether to compute the statistics of the values of each field
+    :return: the result of crawling the file, or None if it did not change
+    """
+    with stage('fingerprint'):
+        fingerprint = fingerprint_if_changed(abs_path, stored, with_hash)
+    if fingerprint is None:
+        return None
+
+    return crawl_changed(abs_path, stored, crawled_bytes, fingerprint, with_hash, append_only, workers, executor,
+                         sample, with_statistics)
+
+
+def crawl_changed(abs_path: str, stored: Optional[FileFingerprint], crawled_bytes: Optional[int],
+                  fingerprint: FileFingerprint, with_hash: bool = False, append_only: bool = False,
+                  workers: Optional[int] = 1, executor: Optional[Executor] = None,
+                  sample: Optional[SampleSize] = None, with_statistics: bool = False) -> CrawlResult:
+    """
+    Extract metadata from a file that changed since it was crawled, and summarize it.
+
+    See crawl_if_changed(), which also checks whether the file changed.
+
+    :param abs_path: the file to extract metadata from
+    :param stored: the fingerprint stored when the file was crawled, if any
+    :param crawled_bytes: the offset up to which the file was crawled, if crawling can be resumed
+    :param fingerprint: the current fingerprint of the file, as returned by fingerprint_if_changed()
+    :param with_hash: whether content hashes are compared to detect changes
+    :param append_only: whether files that grew can be assumed to have been appended to
+    :param workers: the amount of worker processes to crawl big files. Defaults to the amount of CPUs
+    :param executor: a pool of worker processes to crawl big files with. A new pool is used if None
+    :param sample: how much of the file to sample. The file is crawled exactly if None
+    :param with_statistics: whether to compute the statistics of the values of each field
+    :return: the result of crawling the file
+    """
+    resumable = supports_splitting(abs_path)
+    if with_statistics:
+        resumed_from = None
+        with stage('aggregate'):
+            metadata = list(crawl_file(abs_path, with_statistics=True))
+    elif (append_only and resumable and crawled_bytes is not None and crawled_bytes <= stored.size and
+            is_appended(abs_path, stored, fingerprint, with_hash)):
+        resumed_from = crawled_bytes
+        with stage('aggregate'):
+            metadata = list(crawl_file(abs_path, crawled_bytes, fingerprint.size))
+    else:
+        resumed_from = None
+        with stage('aggregate'):
+            metadata = None if sample is None else sample_file(abs_path, sample)
+        if metadata is not None:
+            return CrawlResult(None, metadata, None, None)
+        with stage('aggregate'):
+            metadata = list(crawl_file_in_chunks(abs_path, workers, executor=executor))
+    count_values(sum(m.total_occurrences for m in metadata))
+
+    # crawling can be resumed from the end of the file only if it was crawled up to a line break,
+    # and it didn't grow while being crawled
+    if resumable and os.path.getsize(abs_path) == fingerprint.size and \
+            ends_with_line_break(abs_path, fingerprint.size):
+        crawled_bytes = fingerprint.size
+    else:
+        crawled_bytes = None
+
+    return CrawlResult(fingerprint, metadata, resumed_from, crawled_bytes)
+
+
+def store_crawl_result(s: StorageBackend, abs_path: str, result: CrawlResult) -> None:
+    """
+    Store the result of crawling a file, replacing its previous metadata.
+
+    The metadata of a resumed crawl is merged with the stored one first.
+
+    :param s: the storage manager to store the result with
+    :param abs_path: the file the result was obtained from
+    :param result: the result of crawl_if_changed()
+    :raises StoringException if storing fails
+    :raises CrawlingError if the type of a field is unknown
+    """
+    with stage('store'):
+        metadata = result.metadata
+        if result.resumed_from is not None:
+            metadata = list(merge_metadata([list(s.retrieve_metadata(abs_path)), metadata]))
+
+        s.store_metadata(abs_path, metadata, result.fingerprint, result.crawled_bytes)
+
+
+def crawl_and_store(abs_path: str, db_path: str, workers: Optional[int] = None, with_hash: bool = False,
+                    append_only: bool = False, sample: Optional[SampleSize] = None,
+                    with_statistics: bool = False, instrumentation: Optional[Instrumentation] = None) -> bool:
+    """
+    Extract metadata from abs_path and store it, unless it did not change since it was crawled.
+
+    :param abs_path: the file to extract metadata from
+    :param db_path: path to the db file. It's created if it doesn't exists.
+    :param workers: the amount of worker processes to crawl big files. Defaults to the amount of CPUs
+    :param with_hash: whether to compare content hashes to detect changes
+    :param append_only: whether a file that grew can be assumed to have been appended to
+    :param sample: how much of the file to sample. The file is crawled exactly if None
+    :param with_statistics: whether to compute the statistics of the values of each field
+    :param instrumentation: if given, the measurement of crawling the file is added to it
+    :return: True if the file was crawled. False if it did not change.
+    """
+    if instrumentation is None:
+        return _crawl_and_store(abs_path, db_path, workers, with_hash, append_only, sample, with_statistics)
+
+    with measure_file(abs_path) as measurement:
+        crawled = _crawl_and_store(abs_path, db_path, workers, with_hash, append_only, sample, with_statistics)
+    instrumentation.add(measurement.result)
+    return crawled
+
+
+def _crawl_and_store(abs_path: str, db_path: str, workers: Optional[int], with_hash: bool, append_only: bool,
+                     sample: Optional[SampleSize], with_statistics: bool) -> bool:
+    with open_storage(db_path) as s:
+        with stage('store'):
+            stored, crawled_bytes = s.retrieve_fingerprint(abs_path), s.retrieve_crawled_bytes(abs_path)
+        result = crawl_if_changed(abs_path, stored, crawled_bytes, with_hash, append_only, workers, sample=sample,
+                                  with_statistics=with_statistics)
+        if result is None:
+            return False
+
+        store_crawl_result(s, abs_path, result)
+        return True
+
+
+def describe_file(abs_path: str, db_path: str) -> List[Metadata]:
+    """
+    Retrieve the metadata stored for a file.
+
+    :param abs_path: the file the metadata was extracted from
+    :param db_path: path to the db file. It's created if it doesn't exists.
+    :return: the metadata of the file, empty if it was never crawled
+    """
+    with open_storage(db_path) as s:
+        return list(s.retrieve_metadata(abs_path))
+
+
+def query_catalog(db_path: str, prefix: Optional[str] = None,
+                  field: Optional[str] = None) -> Generator[FileMetadata, None, None]:
+    """
+    Retrieve the files whose path starts with a prefix and that have a field, with their metadata,
+    in the order of their paths. See StorageBackend.query_files().
+
+    :param db_path: path to the db file. It's created if it doesn't exists.
+    :param prefix: the prefix of the paths of the files. Every file matches if None
+    :param field: the name of a field the files must have. Only the metadata of that field is retrieved
+    :return: a generator object that produces a FileMetadata per file
+    """
+    with open_storage(db_path) as s:
+        yield from s.query_files(prefix, field)
+
+
+def find_type_conflicts(db_path: str, prefix: Optional[str] = None) -> Generator[FieldTypes, None, None]:
+    """
+    Retrieve the fields whose type differs across files, in the order of their names.
+
+    :param db_path: path to the db file. It's created if it doesn't exists.
+    :param prefix: the prefix of the paths of the files to compare. Every file is compared if None
+    :return: a generator object that produces FieldTypes
+    """
+    with open_storage(db_path) as s:
+        yield from s.query_type_conflicts(prefix)
+
+
+def crawl_batch(paths: Iterable[str], db_path: str, workers: Optional[int] = None,
+                with_hash: bool = False, append_only: bool = False,
+                sample: Optional[SampleSize] = None, with_statistics: bool = False,
+                instrumentation: Optional[Instrumentation] = None) -> BatchSummary:
+    """
+    Extract metadata from several files in parallel and store it.
+
+    Files are crawled by a pool of worker processes, while storing is done by the calling
+    process only. A file that can't be crawled does not abort the batch: it's reported as
+    a failure instead. Files that did not change since they were crawled are skipped, and
+    the metadata of files that changed is replaced.
+
+    :param paths: the absolute paths of the files to extract metadata from
+    :param db_path: path to the db file. It's created if it doesn't exists.
+    :param workers: the amount of worker processes. Defaults to the amount of CPUs
+    :param with_hash: whether to compare content hashes to detect changes
+    :param append_only: whether files that grew can be assumed to have been appended to
+    :param sample: how much of each file to sample. Files are crawled exactly if None
+    :param with_statistics: whether to compute the statistics of the values of each field
+    :param instrumentation: if given, the measurement of crawling each file is added to it. Files are measured in
+                            the worker process that crawls them, and then while the calling process stores them
+    :return: a summary of the batch
+    """
+    with open_storage(db_path, batch_size=_COMMIT_BATCH_SIZE) as s:
+        return _crawl_batch(s, paths, workers, with_hash, append_only, sample, with_statistics, instrumentation)
+
+
+def _crawl_batch(s: StorageBackend, paths: Iterable[str], workers: Optional[int],
+                 with_hash: bool, append_only: bool, sample: Optional[SampleSize] = None,
+                 with_statistics: bool = False, instrumentation: Optional[Instrumentation] = None) -> BatchSummary:
+    crawled, skipped, failures = [], [], []
+
+    def measured_store(path, compute_result, previous=None):
+        if instrumentation is None:
+            store(path, compute_result)
+            return
+        with measure_file(path, previous) as measurement:
+            store(path, compute_result)
+        instrumentation.add(measurement.result)
+
+    def store(path, compute_result):
+        try:
+            result = compute_result()
+            if result is None:
+                skipped.append(path)
+                return
+            store_crawl_result(s, path, result)
+        except (ExtractionError, CrawlingError, StoringException) as e:
+            failures.append(FileFailure(path, str(e)))
+        except Exception:
+            failures.append(FileFailure(path, 'Unexpected error occurred.'))
+        else:
+            crawled.append(path)
+
+    pending = []
+    for path in paths:
+        try:
+            pending.append((path, s.retrieve_fingerprint(path), s.retrieve_crawled_bytes(path)))
+        except StoringException as e:
+            failures.append(FileFailure(path, str(e)))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for path, stored, crawled_bytes in pending:
+            measured_store(path, lambda: crawl_if_changed(path, stored, crawled_bytes, with_hash, append_only,
+                                                          sample=sample, with_statistics=with_statistics))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            task = crawl_if_changed if instrumentation is None else partial(call_measured, crawl_if_changed)
+            futures = {executor.submit(task, path, stored, crawled_bytes, with_hash, append_only,
+                                       sample=sample, with_statistics=with_statistics): path
+                       for path, stored, crawled_bytes in pending}
+            for future in as_completed(futures):
+                if instrumentation is None or future.exception() is not None:
+                    store(futures[future], future.result)
+                else:
+                    result, measurement = future.result()
+                    measured_store(futures[future], lambda: result, measurement)
+
+    return BatchSummary(crawled, skipped, failures)
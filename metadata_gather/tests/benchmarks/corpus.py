@@ -0,0 +1,139 @@
+"""
+Generator of synthetic corpora to benchmark with.
+
+A corpus is a table of random values, written as CSV, JSON and/or JSON Lines files. Its
+width, amount of rows, ratio of nulls and ratio of integer (versus string) columns are
+configurable, and the same spec always generates the same files.
+
+It can be run to generate a corpus to try things out by hand:
+    python -m tests.benchmarks.corpus OUTPUT_DIR --rows 1000000 --columns 20 --null-ratio 0.2
+"""
+from collections import namedtuple
+import argparse
+import json
+import os
+import random
+import string
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+# The shape of a corpus: the amount of rows and columns, the probability of each value being null,
+# the ratio of integer columns (the rest are strings), the mean length of strings and the random seed
+CorpusSpec = namedtuple('CorpusSpec', 'rows, columns, null_ratio, int_ratio, string_length, seed')
+CorpusSpec.__new__.__defaults__ = (0.1, 0.5, 8, 0)
+
+FORMATS = ['csv', 'json', 'jsonl']
+
+# Distinct strings a corpus draws its string values from
+_STRING_POOL_SIZE = 4096
+
+
+def column_names(spec: CorpusSpec) -> List[str]:
+    return [f'field_{idx}' for idx in range(spec.columns)]
+
+
+def column_types(spec: CorpusSpec) -> List[type]:
+    """
+    :return: the type of each column: integer columns are spread evenly among string ones
+    """
+    return [int if int((idx + 1) * spec.int_ratio) > int(idx * spec.int_ratio) else str
+            for idx in range(spec.columns)]
+
+
+def rows(spec: CorpusSpec) -> Iterator[List[Union[int, str, None]]]:
+    """
+    Generate the values of a corpus.
+
+    :param spec: the shape of the corpus
+    :return: an iterator of rows, lists with a value per column, None for nulls
+    """
+    rng = random.Random(spec.seed)
+    letters = string.ascii_letters
+    pool = [''.join(rng.choice(letters) for _ in range(rng.randint(1, 2 * spec.string_length - 1)))
+            for _ in range(_STRING_POOL_SIZE)]
+    types = column_types(spec)
+
+    for _ in range(spec.rows):
+        yield [None if rng.random() < spec.null_ratio else
+               rng.randrange(-10 ** 9, 10 ** 9) if t is int else
+               pool[rng.randrange(_STRING_POOL_SIZE)]
+               for t in types]
+
+
+def _csv_value(value: Union[int, str, None]) -> str:
+    if value is None:
+        return 'null'
+    if isinstance(value, str):
+        return f'"{value}"'
+    return str(value)
+
+
+def write_csv_corpus(path: str, spec: CorpusSpec) -> None:
+    with open(path, 'w') as csv_file:
+        csv_file.write(','.join(column_names(spec)) + '\n')
+        for row in rows(spec):
+            csv_file.write(','.join(map(_csv_value, row)) + '\n')
+
+
+def _objects(spec: CorpusSpec) -> Iterable[str]:
+    names = column_names(spec)
+    for row in rows(spec):
+        yield json.dumps(dict(zip(names, row)))
+
+
+def write_json_corpus(path: str, spec: CorpusSpec) -> None:
+    with open(path, 'w') as json_file:
+        json_file.write('[\n')
+        for idx, document in enumerate(_objects(spec)):
+            json_file.write((',\n' if idx else '') + document)
+        json_file.write('\n]\n')
+
+
+def write_jsonl_corpus(path: str, spec: CorpusSpec) -> None:
+    with open(path, 'w') as jsonl_file:
+        for document in _objects(spec):
+            jsonl_file.write(document + '\n')
+
+
+_WRITERS = {
+    'csv': write_csv_corpus,
+    'json': write_json_corpus,
+    'jsonl': write_jsonl_corpus,
+}
+
+
+def generate_corpus(directory: str, spec: CorpusSpec, formats: Optional[Iterable[str]] = None) -> Dict[str, str]:
+    """
+    Write a corpus in several formats.
+
+    :param directory: the directory to write the files to. It must exist
+    :param spec: the shape of the corpus
+    :param formats: the formats to write, every format by default
+    :return: the path of the file written for each format
+    """
+    paths = dict()
+    for file_format in formats or FORMATS:
+        paths[file_format] = os.path.join(directory, f'corpus.{file_format}')
+        _WRITERS[file_format](paths[file_format], spec)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic corpus to benchmark with')
+    parser.add_argument('directory', help='the directory to write the corpus to')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--columns', type=int, default=10)
+    parser.add_argument('--null-ratio', type=float, default=0.1)
+    parser.add_argument('--int-ratio', type=float, default=0.5)
+    parser.add_argument('--string-length', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=FORMATS)
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    spec = CorpusSpec(args.rows, args.columns, args.null_ratio, args.int_ratio, args.string_length, args.seed)
+    for path in generate_corpus(args.directory, spec, args.formats).values():
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
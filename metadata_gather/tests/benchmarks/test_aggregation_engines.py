@@ -0,0 +1,26 @@
+from aggregation_engines import aggregation_engines
+from common import MetadataRecord
+from crawler import columnize, crawl, crawl_columns
+
+from tests.benchmarks.utils import benchmark, consume, measure, report, scaled
+
+pytestmark = benchmark
+
+# Generated records: a name and a function producing the records of a row
+_CORPORA = [
+    ('narrow', lambda idx: [MetadataRecord('id', idx), MetadataRecord('name', None if idx % 5 else f'row {idx}')]),
+    ('wide', lambda idx: [MetadataRecord(f'field_{col}', idx if col % 2 else None) for col in range(40)]),
+]
+
+
+def test_aggregation_engines(capsys):
+    for name, make_row in _CORPORA:
+        records = [record for idx in range(scaled(200000)) for record in make_row(idx)]
+
+        rows = [('crawl (per record)', measure(lambda: consume(crawl(records))))]
+        for engine in sorted(aggregation_engines):
+            rows.append((f'crawl_columns ({engine})',
+                         measure(lambda: consume(crawl_columns(columnize(records), engine)))))
+
+        report(capsys, f'Aggregating {len(records)} records of the {name} corpus',
+               [(engine, {'Mcells/s': f'{len(records) / m.seconds / 1e6:.2f}'}) for engine, m in rows])
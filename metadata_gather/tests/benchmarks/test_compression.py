@@ -0,0 +1,42 @@
+import gzip
+import os
+import shutil
+
+from tasks import crawl_file
+
+from tests.benchmarks.corpus import CorpusSpec, generate_corpus
+from tests.benchmarks.utils import benchmark, consume, measure, report, scaled
+
+pytestmark = benchmark
+
+
+def _decompress_to_disk_and_crawl(gz_path, plain_path):
+    # The workaround before compressed files were supported: decompressing them to disk first
+    with gzip.open(gz_path, mode='rb') as gz_file, open(plain_path, mode='wb') as plain_file:
+        shutil.copyfileobj(gz_file, plain_file, 1024 * 1024)
+    consume(crawl_file(plain_path))
+    os.remove(plain_path)
+
+
+def _crawl(file_path):
+    consume(crawl_file(file_path))
+
+
+def test_compressed_crawling(tmp_path, capsys):
+    paths = generate_corpus(str(tmp_path), CorpusSpec(rows=scaled(200000), columns=10), ['csv', 'jsonl'])
+
+    rows = []
+    for file_format, path in paths.items():
+        gz_path = path + '.gz'
+        with open(path, mode='rb') as plain_file, gzip.open(gz_path, mode='wb', compresslevel=6) as gz_file:
+            shutil.copyfileobj(plain_file, gz_file, 1024 * 1024)
+        size_mb = os.path.getsize(path) / 2 ** 20
+
+        for name, func, args in [('plain', _crawl, (path,)), ('gzip, streamed', _crawl, (gz_path,)),
+                                 ('gzip, decompressed to disk', _decompress_to_disk_and_crawl,
+                                  (gz_path, str(tmp_path / f'decompressed.{file_format}')))]:
+            m = measure(func, *args)
+            rows.append((f'{file_format} {name}', {'MB/s (uncompressed)': f'{size_mb / m.seconds:.1f}',
+                                                   'peak RSS growth (MiB)': f'{m.peak_rss_kb / 1024:.1f}'}))
+
+    report(capsys, 'Crawling gzip-compressed files', rows)
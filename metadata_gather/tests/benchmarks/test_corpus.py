@@ -0,0 +1,29 @@
+import pytest
+
+from common import Metadata
+from tasks import crawl_file
+
+from tests.benchmarks.corpus import CorpusSpec, FORMATS, column_names, column_types, generate_corpus, rows
+
+
+def test_column_types_are_spread():
+    assert column_types(CorpusSpec(rows=1, columns=4, int_ratio=0.5)) == [str, int, str, int]
+    assert column_types(CorpusSpec(rows=1, columns=3, int_ratio=1)) == [int, int, int]
+    assert column_types(CorpusSpec(rows=1, columns=3, int_ratio=0)) == [str, str, str]
+
+
+def test_rows_are_reproducible():
+    spec = CorpusSpec(rows=50, columns=3, seed=7)
+    assert list(rows(spec)) == list(rows(spec))
+    assert list(rows(spec)) != list(rows(spec._replace(seed=8)))
+
+
+@pytest.mark.parametrize('file_format', FORMATS)
+def test_corpus_metadata(tmp_path, file_format):
+    spec = CorpusSpec(rows=300, columns=4, null_ratio=0.25, int_ratio=0.5)
+    path = generate_corpus(str(tmp_path), spec, [file_format])[file_format]
+
+    values = list(rows(spec))
+    expected = [Metadata(name, 'I' if t is int else 'S', spec.rows, sum(row[idx] is None for row in values))
+                for idx, (name, t) in enumerate(zip(column_names(spec), column_types(spec)))]
+    assert list(crawl_file(path)) == expected
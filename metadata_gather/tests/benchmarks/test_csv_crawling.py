@@ -0,0 +1,99 @@
+import os
+
+from crawler import crawl, crawl_statistics
+from metadata_extractor import csv_extractor
+from metadata_extractor.csv_extractor import extract_data_from_csv, extract_statistics_from_csv
+
+from tests.benchmarks.corpus import CorpusSpec, generate_corpus
+from tests.benchmarks.utils import benchmark, check_baseline, consume, measure, report, scaled
+
+pytestmark = benchmark
+
+
+def _crawl_records(file_path):
+    consume(crawl(extract_data_from_csv(file_path)))
+
+
+def _crawl_statistics(file_path):
+    consume(crawl_statistics(extract_statistics_from_csv(file_path)))
+
+
+def test_csv_records_vs_statistics(tmp_path, capsys):
+    file_path = str(tmp_path / 'wide.csv')
+    columns = 50
+    with open(file_path, 'w') as csv_file:
+        csv_file.write(','.join(f'field_{idx}' for idx in range(columns)) + '\n')
+        for row in range(scaled(20000)):
+            csv_file.write(','.join('null' if (row + idx) % 7 == 0 else (str(row) if idx % 2 else '"abc"')
+                                    for idx in range(columns)) + '\n')
+    size_mb = os.path.getsize(file_path) / 2 ** 20
+
+    rows = []
+    for name, func in [('records', _crawl_records), ('statistics', _crawl_statistics)]:
+        m = measure(func, file_path)
+        rows.append((name, {'MB/s': f'{size_mb / m.seconds:.1f}',
+                            'peak RSS growth (MiB)': f'{m.peak_rss_kb / 1024:.1f}'}))
+
+    report(capsys, f'CSV crawling of a {size_mb:.1f} MiB file with {columns} columns', rows)
+
+
+def test_csv_mapped_vs_decoded_statistics(tmp_path, capsys, monkeypatch):
+    # With METADATA_GATHER_BENCHMARK_SCALE=100 the file is about 2 GiB
+    spec = CorpusSpec(rows=scaled(250000), columns=10)
+    file_path = generate_corpus(str(tmp_path), spec, ['csv'])['csv']
+    size_mb = os.path.getsize(file_path) / 2 ** 20
+
+    rows, results = [], dict()
+    mapped = measure(_crawl_statistics, file_path, repeat=3)
+    # Measurements run in forked processes, which inherit the patch
+    monkeypatch.setattr(csv_extractor, '_perform_mapped_statistics_extraction', lambda *args: None)
+    decoded = measure(_crawl_statistics, file_path, repeat=3)
+
+    for name, m in [('decoded (csv.reader)', decoded), ('mapped', mapped)]:
+        results[f'csv/statistics/{name.split()[0]}'] = m
+        rows.append((name, {'MB/s': f'{size_mb / m.seconds:.1f}',
+                            'Mcells/s': f'{spec.rows * spec.columns / m.seconds / 1e6:.2f}',
+                            'peak RSS growth (MiB)': f'{m.peak_rss_kb / 1024:.1f}'}))
+
+    report(capsys, f'CSV statistics of a {size_mb:.1f} MiB file with {spec.columns} columns', rows)
+    check_baseline(results)
+
+
+def _write_typed_csv(file_path, rows):
+    # A column of each type inferred from unquoted values, besides integers and nulls
+    with open(file_path, 'w') as csv_file:
+        csv_file.write('integer,float,boolean,date,timestamp,string\n')
+        for row in range(rows):
+            csv_file.write(f'{row if row % 10 else "null"},{row / 8},{"true" if row % 3 else "false"},'
+                           f'2024-{row % 12 + 1:02}-{row % 28 + 1:02},2024-01-01T{row % 24:02}:{row % 60:02}:00Z,'
+                           f'"abc{row % 100}"\n')
+
+
+def test_csv_type_inference(tmp_path, capsys, monkeypatch):
+    # Files of integers, strings and nulls only must not pay for the checks of the other types, which only
+    # run on the values that are not integers
+    spec = CorpusSpec(rows=scaled(100000), columns=10)
+    plain_path = generate_corpus(str(tmp_path), spec, ['csv'])['csv']
+    typed_path = str(tmp_path / 'typed.csv')
+    _write_typed_csv(typed_path, scaled(100000))
+
+    files = [('int/str', plain_path), ('all types', typed_path)]
+    measurements = [(f'{name}, {kind}', func, file_path) for kind, file_path in files
+                    for name, func in [('records', _crawl_records), ('mapped statistics', _crawl_statistics)]]
+    rows, results = [], dict()
+    for name, func, file_path in measurements:
+        m = measure(func, file_path, repeat=3)
+        results[f'csv/types/{name}'] = m
+        rows.append((name, {'MB/s': f'{os.path.getsize(file_path) / 2 ** 20 / m.seconds:.1f}',
+                            'peak RSS growth (MiB)': f'{m.peak_rss_kb / 1024:.1f}'}))
+
+    # Measurements run in forked processes, which inherit the patch
+    monkeypatch.setattr(csv_extractor, '_perform_mapped_statistics_extraction', lambda *args: None)
+    for kind, file_path in files:
+        m = measure(_crawl_statistics, file_path, repeat=3)
+        results[f'csv/types/decoded statistics, {kind}'] = m
+        rows.append((f'decoded statistics, {kind}', {'MB/s': f'{os.path.getsize(file_path) / 2 ** 20 / m.seconds:.1f}',
+                                                     'peak RSS growth (MiB)': f'{m.peak_rss_kb / 1024:.1f}'}))
+
+    report(capsys, 'CSV type inference', rows)
+    check_baseline(results)
@@ -0,0 +1,47 @@
+import json
+import os
+
+from metadata_extractor.json_decoders import json_decoders
+from metadata_extractor.json_extractor import _perform_extractor
+from metadata_extractor.jsonl_extractor import _perform_extraction
+
+from tests.benchmarks.utils import benchmark, consume, measure, report, scaled
+
+pytestmark = benchmark
+
+# Generated corpora: a name and a function producing the objects of the corpus
+_CORPORA = [
+    ('flat', lambda idx: {'event': 'impression', 'width': idx, 'height': None, 'client_uid': str(idx)}),
+    ('wide', lambda idx: {f'field_{col}': idx if col % 2 else f'value {col}' for col in range(40)}),
+    ('nested', lambda idx: {'id': idx, 'user': {'name': f'user {idx}', 'tags': ['a', 'b', {'k': None}]},
+                            'text': 'with {braces} and "quotes"'}),
+]
+
+
+def _write_corpus(tmp_path, name, make_object, count):
+    array_path = str(tmp_path / f'{name}.json')
+    lines_path = str(tmp_path / f'{name}.jsonl')
+    with open(array_path, 'w') as array_file, open(lines_path, 'w') as lines_file:
+        array_file.write('[')
+        for idx in range(count):
+            text = json.dumps(make_object(idx))
+            array_file.write((',' if idx else '') + text)
+            lines_file.write(text + '\n')
+        array_file.write(']')
+
+    return array_path, lines_path
+
+
+def test_json_decoders(tmp_path, capsys):
+    for name, make_object in _CORPORA:
+        array_path, lines_path = _write_corpus(tmp_path, name, make_object, scaled(100000))
+        size_mb = os.path.getsize(array_path) / 2 ** 20
+
+        rows = []
+        for decoder in sorted(json_decoders):
+            array = measure(lambda: consume(_perform_extractor(array_path, decoder)))
+            lines = measure(lambda: consume(_perform_extraction(lines_path, decoder)))
+            rows.append((decoder, {'array MB/s': f'{size_mb / array.seconds:.1f}',
+                                   'lines MB/s': f'{size_mb / lines.seconds:.1f}'}))
+
+        report(capsys, f'JSON decoders on the {name} corpus ({size_mb:.1f} MiB)', rows)
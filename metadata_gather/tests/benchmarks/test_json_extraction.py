@@ -0,0 +1,41 @@
+import json
+import os
+
+from common import MetadataRecord
+from metadata_extractor.json_extractor import extract_data_from_json
+
+from tests.benchmarks.utils import benchmark, consume, measure, report, scaled
+
+pytestmark = benchmark
+
+
+def _load_whole_file(file_path):
+    # The extraction path used before the streaming reader: json.load on the whole file
+    with open(file_path) as json_file:
+        for obj in json.load(json_file):
+            for key, value in obj.items():
+                MetadataRecord(key, value)
+
+
+def _stream_file(file_path):
+    consume(extract_data_from_json(file_path))
+
+
+def test_json_streaming_vs_whole_file(tmp_path, capsys):
+    file_path = str(tmp_path / 'big.json')
+    with open(file_path, 'w') as json_file:
+        json_file.write('[')
+        for idx in range(scaled(500000)):
+            if idx:
+                json_file.write(',')
+            json.dump({'event': 'impression', 'width': idx, 'height': None, 'client_uid': str(idx)}, json_file)
+        json_file.write(']')
+    size_mb = os.path.getsize(file_path) / 2 ** 20
+
+    rows = []
+    for name, func in [('json.load', _load_whole_file), ('streaming', _stream_file)]:
+        m = measure(func, file_path)
+        rows.append((name, {'MB/s': f'{size_mb / m.seconds:.1f}',
+                            'peak RSS growth (MiB)': f'{m.peak_rss_kb / 1024:.1f}'}))
+
+    report(capsys, f'JSON extraction of a {size_mb:.1f} MiB array', rows)
@@ -0,0 +1,116 @@
+import json
+import os
+
+from crawler import SPILL_THRESHOLD_ENV_VAR, crawl
+from metadata_extractor.json_paths import JSONFlattener
+from metadata_extractor.jsonl_extractor import extract_data_from_jsonl
+from tasks import crawl_file, crawl_file_in_chunks
+
+from tests.benchmarks.utils import benchmark, check_baseline, consume, measure, report, scaled
+
+pytestmark = benchmark
+
+
+def _crawl_records(file_path):
+    consume(crawl(extract_data_from_jsonl(file_path)))
+
+
+def _crawl_statistics(file_path):
+    consume(crawl_file(file_path))
+
+
+def _crawl_in_chunks(file_path):
+    consume(crawl_file_in_chunks(file_path, min_chunk_size=1024 * 1024))
+
+
+def test_jsonl_crawling(tmp_path, capsys):
+    file_path = str(tmp_path / 'events.jsonl')
+    with open(file_path, 'w') as jsonl_file:
+        for row in range(scaled(200000)):
+            jsonl_file.write(json.dumps({'id': row, 'name': f'event_{row}', 'user': None if row % 5 else row,
+                                         'kind': 'click' if row % 2 else 'view'}) + '\n')
+    size_mb = os.path.getsize(file_path) / 2 ** 20
+
+    rows = []
+    for name, func in [('records', _crawl_records), ('statistics', _crawl_statistics),
+                       (f'chunks ({os.cpu_count()} CPUs)', _crawl_in_chunks)]:
+        m = measure(func, file_path)
+        rows.append((name, {'MB/s': f'{size_mb / m.seconds:.1f}',
+                            'peak RSS growth (MiB)': f'{m.peak_rss_kb / 1024:.1f}'}))
+
+    report(capsys, f'JSON Lines crawling of a {size_mb:.1f} MiB file', rows)
+
+
+def test_schema_sparse_crawling(tmp_path, capsys, monkeypatch):
+    fields = scaled(1000000)
+    file_path = str(tmp_path / 'sparse.jsonl')
+    with open(file_path, 'w') as jsonl_file:
+        # Each object has a few keys of its own, as in event payloads keyed by ids
+        for row in range(fields // 4):
+            jsonl_file.write(json.dumps({f'key_{row * 4 + idx}': None if idx == 3 else row for idx in range(4)}) + '\n')
+
+    rows, results = [], dict()
+    for name, spill_threshold in [('in memory', 0), ('spilled every 100000 fields', 100000),
+                                  ('spilled every 10000 fields', 10000)]:
+        # Measurements run in forked processes, which inherit the environment
+        monkeypatch.setenv(SPILL_THRESHOLD_ENV_VAR, str(spill_threshold))
+        m = measure(_crawl_statistics, file_path)
+        results[f'sparse-schema/{spill_threshold}'] = m
+        rows.append((name, {'Kfields/s': f'{fields / m.seconds / 1e3:.0f}',
+                            'peak RSS growth (MiB)': f'{m.peak_rss_kb / 1024:.1f}'}))
+
+    report(capsys, f'Crawling a JSON Lines file with {fields} distinct fields', rows)
+    check_baseline(results)
+
+
+def _nested_event(row):
+    return {'id': row, 'user': {'id': row % 1000, 'address': {'zip': f'{row % 99999:05}', 'city': None}},
+            'items': [{'sku': f'sku_{row + idx}', 'quantity': idx, 'tags': ['a', 'b']} for idx in range(row % 4)],
+            'context': {'device': {'os': 'linux', 'version': row % 7}, 'session': {'id': f's{row}'}}}
+
+
+def _concatenated_items(obj, prefix=''):
+    # Flattening that builds the path of every value, for comparison
+    for key, value in obj.items():
+        path = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            yield from _concatenated_items(value, path)
+        elif isinstance(value, list):
+            for element in value:
+                if isinstance(element, dict):
+                    yield from _concatenated_items(element, f'{path}[]')
+                else:
+                    yield f'{path}[]', element
+        else:
+            yield path, value
+
+
+def _flatten_interned(objects):
+    flattener = JSONFlattener()
+    for obj in objects:
+        consume(flattener.items(obj))
+
+
+def _flatten_concatenated(objects):
+    for obj in objects:
+        consume(_concatenated_items(obj))
+
+
+def test_nested_jsonl_crawling(tmp_path, capsys):
+    objects = [_nested_event(row) for row in range(scaled(100000))]
+    file_path = str(tmp_path / 'nested.jsonl')
+    with open(file_path, 'w') as jsonl_file:
+        for obj in objects:
+            jsonl_file.write(json.dumps(obj) + '\n')
+    size_mb = os.path.getsize(file_path) / 2 ** 20
+    values = sum(1 for obj in objects for _ in _concatenated_items(obj))
+
+    rows = []
+    for name, func, arg in [('flatten, interned paths', _flatten_interned, objects),
+                            ('flatten, concatenated paths', _flatten_concatenated, objects),
+                            ('records', _crawl_records, file_path), ('statistics', _crawl_statistics, file_path)]:
+        m = measure(func, arg, repeat=3)
+        rows.append((name, {'Mvalues/s': f'{values / m.seconds / 1e6:.2f}',
+                            'peak RSS growth (MiB)': f'{m.peak_rss_kb / 1024:.1f}'}))
+
+    report(capsys, f'Nested JSON Lines crawling of a {size_mb:.1f} MiB file with {values} values', rows)
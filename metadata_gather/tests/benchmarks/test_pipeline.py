@@ -0,0 +1,32 @@
+import os
+
+from pipeline import crawl_pipeline
+from tasks import collect_paths, crawl_batch
+
+from tests.benchmarks.utils import benchmark, measure, report, scaled
+
+pytestmark = benchmark
+
+
+def _write_files(directory, count):
+    for idx in range(count):
+        with open(os.path.join(directory, f'{idx}.csv'), 'w') as csv_file:
+            csv_file.write('id,name,score,comment\n')
+            for row in range(50):
+                csv_file.write(f'{row},"name {row}",{row * idx},{"null" if row % 3 else chr(34) + "ok" + chr(34)}\n')
+
+
+def test_batch_vs_pipeline(tmp_path, capsys):
+    directory = tmp_path / 'files'
+    directory.mkdir()
+    count = scaled(3000)
+    _write_files(str(directory), count)
+    paths = collect_paths([str(directory)])
+
+    rows = []
+    for name, func in [('batch', crawl_batch), ('pipeline', crawl_pipeline)]:
+        db_path = str(tmp_path / f'{name}.db')
+        m = measure(func, paths, db_path)
+        rows.append((name, {'files/s': f'{count / m.seconds:.0f}'}))
+
+    report(capsys, f'Crawling {count} small CSV files', rows)
@@ -0,0 +1,206 @@
+import random
+import shutil
+import sqlite3
+
+from common import Metadata
+from storage_manager import MetadataStorageManager, open_storage, storage_backends
+
+from tests.benchmarks.utils import benchmark, consume, measure, report, scaled
+
+pytestmark = benchmark
+
+_FIELDS = [Metadata(f'field_{idx}', 'I' if idx % 2 else 'S', 1000, idx) for idx in range(10)]
+
+
+def _store_with_connection_per_call(db_path, files):
+    # The behavior before connections were kept open: one connection and one transaction per call
+    for idx in range(files):
+        s = MetadataStorageManager(db_path, journal_mode='delete', synchronous=None)
+        s.store_metadata(f'/data/file_{idx}.csv', _FIELDS)
+        s.close()
+
+
+def _store_with_persistent_connection(db_path, files, batch_size):
+    with MetadataStorageManager(db_path, batch_size=batch_size) as s:
+        for idx in range(files):
+            s.store_metadata(f'/data/file_{idx}.csv', _FIELDS)
+
+
+def test_storing_many_files(tmp_path, capsys):
+    files = scaled(100000)
+
+    rows = []
+    m = measure(_store_with_connection_per_call, str(tmp_path / 'per_call.db'), files)
+    rows.append(('connection per call', {'files/s': f'{files / m.seconds:.0f}'}))
+    for batch_size in (1, 100, 10000):
+        m = measure(_store_with_persistent_connection, str(tmp_path / f'batch_{batch_size}.db'), files, batch_size)
+        rows.append((f'persistent connection, batch of {batch_size}', {'files/s': f'{files / m.seconds:.0f}'}))
+
+    report(capsys, f'Storing the metadata of {files} files with {len(_FIELDS)} fields each', rows)
+
+
+def _create_legacy_db(db_path, files):
+    # The schema before the files table was introduced, without any index on file_id
+    with sqlite3.connect(db_path) as con:
+        con.execute(
+            """
+            CREATE TABLE metadata (
+                id INTEGER PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                field_name TEXT NOT NULL,
+                field_type TEXT CHECK( field_type IN ('I','S') ),
+                total_occurrences INTEGER CHECK( total_occurrences > 0 ) NOT NULL,
+                null_occurrences INTEGER CHECK( null_occurrences >= 0 ) NOT NULL,
+                CHECK ( total_occurrences >= null_occurrences )
+            );"""
+        )
+        con.executemany("insert into "
+                        "metadata(file_id, field_name, field_type, total_occurrences, null_occurrences) "
+                        "values (?, ?, ?, ?, ?)",
+                        ((f'/data/2026/file_{idx}.csv', f'field_{field}', 'I', 10, 0)
+                         for idx in range(files) for field in range(3)))
+    con.close()
+
+
+def _legacy_lookups(db_path, paths):
+    with sqlite3.connect(db_path) as con:
+        for path in paths:
+            con.execute("select * from metadata where file_id=?", (path,)).fetchall()
+    con.close()
+
+
+def _migrate(db_path):
+    # the schema is upgraded when the manager is used for the first time
+    with MetadataStorageManager(db_path) as s:
+        list(s.retrieve_metadata(''))
+
+
+def _lookups(db_path, paths):
+    with MetadataStorageManager(db_path) as s:
+        for path in paths:
+            list(s.retrieve_metadata(path))
+
+
+def test_lookups_on_many_files(tmp_path, capsys):
+    files = scaled(1000000)
+    legacy_path = str(tmp_path / 'legacy.db')
+    _create_legacy_db(legacy_path, files)
+    migrated_path = str(tmp_path / 'migrated.db')
+    shutil.copyfile(legacy_path, migrated_path)
+
+    random.seed(0)
+    paths = [f'/data/2026/file_{random.randrange(files)}.csv' for _ in range(1000)]
+
+    rows = []
+    m = measure(_legacy_lookups, legacy_path, paths[:20])
+    rows.append(('single table, no index', {'ms/lookup': f'{m.seconds * 1000 / 20:.3f}'}))
+    m = measure(_migrate, migrated_path)
+    rows.append(('migration', {'seconds': f'{m.seconds:.1f}'}))
+    m = measure(_lookups, migrated_path, paths)
+    rows.append(('files table, indexed', {'ms/lookup': f'{m.seconds * 1000 / len(paths):.3f}'}))
+
+    report(capsys, f'Looking up the metadata of one file among {files}', rows)
+
+
+def _create_catalog(db_path, files):
+    # files spread over 100 directories, each with 10 common fields, and one in 1000 with a rare field
+    with MetadataStorageManager(db_path, batch_size=10000) as s:
+        for idx in range(files):
+            metadata = _FIELDS + ([Metadata('rare', 'S' if idx % 2 else 'I', 10, 0)] if idx % 1000 == 0 else [])
+            s.store_metadata(f'/data/dir_{idx % 100:03}/file_{idx}.csv', metadata)
+
+
+def _query_prefix(db_path):
+    with MetadataStorageManager(db_path) as s:
+        consume(s.query_files('/data/dir_042/'))
+
+
+def _query_field(db_path):
+    with MetadataStorageManager(db_path) as s:
+        consume(s.query_files(field='rare'))
+
+
+def _query_type_conflicts(db_path):
+    with MetadataStorageManager(db_path) as s:
+        consume(s.query_type_conflicts())
+
+
+def _drop_field_name_index(db_path):
+    with sqlite3.connect(db_path) as con:
+        con.execute("DROP INDEX metadata_field_name")
+    con.close()
+
+
+def test_catalog_queries(tmp_path, capsys):
+    files = scaled(200000)
+    db_path = str(tmp_path / 'catalog.db')
+    _create_catalog(db_path, files)
+
+    rows = []
+    for name, func in [('files under a directory (1%)', _query_prefix), ('files with a rare field', _query_field),
+                       ('fields with conflicting types', _query_type_conflicts)]:
+        m = measure(func, db_path)
+        rows.append((name, {'ms': f'{m.seconds * 1000:.1f}'}))
+
+    _drop_field_name_index(db_path)
+    for name, func in [('files with a rare field, no index', _query_field),
+                       ('fields with conflicting types, no index', _query_type_conflicts)]:
+        m = measure(func, db_path)
+        rows.append((name, {'ms': f'{m.seconds * 1000:.1f}'}))
+
+    report(capsys, f'Querying a catalog of {files} files with {len(_FIELDS)} fields each', rows)
+
+
+def _append_catalog(db_path, backend, files):
+    # one file in ten has a field typed differently, and one in 1000 a rare field
+    with open_storage(db_path, backend, batch_size=10000) as s:
+        for idx in range(files):
+            metadata = [m._replace(type='S') if idx % 10 == 0 and m.type == 'I' else m for m in _FIELDS]
+            metadata += [Metadata('rare', 'S' if idx % 2 else 'I', 10, 0)] if idx % 1000 == 0 else []
+            s.store_metadata(f'/data/dir_{idx % 100:03}/file_{idx}.csv', metadata)
+
+
+def _lookup_fingerprints(db_path, backend, paths):
+    with open_storage(db_path, backend) as s:
+        for path in paths:
+            s.retrieve_fingerprint(path)
+            list(s.retrieve_metadata(path))
+
+
+def _scan_type_distribution(db_path, backend):
+    with open_storage(db_path, backend) as s:
+        consume(s.query_type_conflicts())
+
+
+def _scan_prefix(db_path, backend):
+    with open_storage(db_path, backend) as s:
+        consume(s.query_files('/data/dir_042/'))
+
+
+def _scan_field(db_path, backend):
+    with open_storage(db_path, backend) as s:
+        consume(s.query_files(field='rare'))
+
+
+def test_storage_backends(tmp_path, capsys):
+    # With METADATA_GATHER_BENCHMARK_SCALE=25 the catalog has 50M fields
+    files = scaled(200000)
+    fields = files * len(_FIELDS)
+    random.seed(0)
+    paths = [f'/data/dir_{idx % 100:03}/file_{idx}.csv' for idx in random.sample(range(files), min(files, 1000))]
+
+    rows = []
+    for backend in sorted(storage_backends):
+        db_path = str(tmp_path / f'{backend}.db')
+        m = measure(_append_catalog, db_path, backend, files)
+        results = {'append (Kfields/s)': f'{fields / m.seconds / 1000:.0f}'}
+        m = measure(_lookup_fingerprints, db_path, backend, paths)
+        results['lookup (ms/file)'] = f'{m.seconds * 1000 / len(paths):.2f}'
+        for name, func in [('type distribution (ms)', _scan_type_distribution), ('prefix (ms)', _scan_prefix),
+                           ('rare field (ms)', _scan_field)]:
+            m = measure(func, db_path, backend)
+            results[name] = f'{m.seconds * 1000:.1f}'
+        results['size (MiB)'] = f'{sum(f.stat().st_size for f in tmp_path.glob(f"{backend}.db*")) / 2 ** 20:.1f}'
+        rows.append((backend, results))
+
+    report(capsys, f'Storage backends with a catalog of {files} files and {fields} fields', rows)
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from metadata_extractor import extract_metadata_from_file
+from tasks import crawl_and_store, crawl_file
+
+from tests.benchmarks.corpus import CorpusSpec, FORMATS, generate_corpus
+from tests.benchmarks.utils import benchmark, check_baseline, consume, measure, report, scaled
+
+pytestmark = benchmark
+
+_SHAPES = {
+    'narrow': lambda: CorpusSpec(rows=scaled(200000), columns=5),
+    'wide': lambda: CorpusSpec(rows=scaled(10000), columns=100, null_ratio=0.3, int_ratio=0.8),
+    'sparse': lambda: CorpusSpec(rows=scaled(100000), columns=10, null_ratio=0.9, string_length=32),
+}
+
+
+def _extract(file_path):
+    consume(extract_metadata_from_file(file_path))
+
+
+def _crawl(file_path):
+    consume(crawl_file(file_path))
+
+
+def _crawl_and_store(file_path, db_path):
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    crawl_and_store(file_path, db_path, workers=1)
+
+
+@pytest.mark.parametrize('shape', sorted(_SHAPES))
+def test_corpus_throughput(tmp_path, capsys, shape):
+    spec = _SHAPES[shape]()
+    paths = generate_corpus(str(tmp_path), spec)
+    db_path = str(tmp_path / 'metadata.db')
+
+    rows, results = [], dict()
+    for file_format in FORMATS:
+        size_mb = os.path.getsize(paths[file_format]) / 2 ** 20
+        for stage, func, args in [('extract', _extract, ()), ('crawl', _crawl, ()),
+                                  ('crawl and store', _crawl_and_store, (db_path,))]:
+            m = measure(func, paths[file_format], *args, repeat=3)
+            results[f'corpus/{shape}/{file_format}/{stage}'] = m
+            rows.append((f'{file_format} {stage}', {
+                'MB/s': f'{size_mb / m.seconds:.1f}',
+                'Mcells/s': f'{spec.rows * spec.columns / m.seconds / 1e6:.2f}',
+                'peak RSS growth (MiB)': f'{m.peak_rss_kb / 1024:.1f}',
+            }))
+
+    report(capsys, f'Throughput on a {shape} corpus of {spec.rows} rows and {spec.columns} columns', rows)
+    check_baseline(results)
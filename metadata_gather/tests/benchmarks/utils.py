@@ -0,0 +1,136 @@
+"""
+Helpers shared by the benchmarks.
+
+Benchmarks are skipped unless the METADATA_GATHER_BENCHMARKS environment variable
+is set. The size of the generated inputs can be tuned with METADATA_GATHER_BENCHMARK_SCALE.
+
+Benchmarks that check their measurements against a baseline save them to the JSON file in
+METADATA_GATHER_BENCHMARK_BASELINE when METADATA_GATHER_BENCHMARK_SAVE_BASELINE is set, and
+otherwise fail if they regressed by more than METADATA_GATHER_BENCHMARK_TOLERANCE (a ratio,
+0.25 by default) compared to the ones saved there.
+"""
+from collections import namedtuple
+import json
+import multiprocessing
+import os
+import resource
+import time
+from typing import Dict
+
+import pytest
+
+BENCHMARKS_ENABLED = bool(os.environ.get('METADATA_GATHER_BENCHMARKS'))
+
+SCALE = float(os.environ.get('METADATA_GATHER_BENCHMARK_SCALE', '1'))
+
+BASELINE_PATH = os.environ.get('METADATA_GATHER_BENCHMARK_BASELINE')
+
+SAVE_BASELINE = bool(os.environ.get('METADATA_GATHER_BENCHMARK_SAVE_BASELINE'))
+
+TOLERANCE = float(os.environ.get('METADATA_GATHER_BENCHMARK_TOLERANCE', '0.25'))
+
+# Peak RSS growth below this is noise, in KiB
+_RSS_SLACK_KB = 4096
+
+benchmark = pytest.mark.skipif(not BENCHMARKS_ENABLED,
+                               reason='set METADATA_GATHER_BENCHMARKS=1 to run benchmarks')
+
+# Wall time (in seconds) and peak RSS growth (in KiB) of a measured call
+Measurement = namedtuple('Measurement', 'seconds, peak_rss_kb')
+
+
+def scaled(size: int) -> int:
+    """
+    Scale a benchmark input size by METADATA_GATHER_BENCHMARK_SCALE
+    """
+    return max(1, int(size * SCALE))
+
+
+def _run_measured(conn, func, args):
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    conn.send(Measurement(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss))
+    conn.close()
+
+
+def measure(func, *args, repeat: int = 1) -> Measurement:
+    """
+    Call func(*args) in a forked process, measuring its wall time and how much it grew
+    the peak RSS of that process.
+
+    :param func: the function to measure. Its result is discarded
+    :param repeat: the amount of times to call it, in a new process each time. The best measurements are kept
+    :return: the measurement
+    """
+    ctx = multiprocessing.get_context('fork')
+    measurements = []
+    for _ in range(repeat):
+        parent_conn, child_conn = ctx.Pipe(duplex=False)
+        process = ctx.Process(target=_run_measured, args=(child_conn, func, args))
+        process.start()
+        measurements.append(parent_conn.recv())
+        process.join()
+    return Measurement(min(m.seconds for m in measurements), min(m.peak_rss_kb for m in measurements))
+
+
+def consume(iterable) -> None:
+    """
+    Exhaust an iterable, discarding its elements
+    """
+    for _ in iterable:
+        pass
+
+
+def report(capsys, title: str, rows) -> None:
+    """
+    Print a table of results, bypassing pytest's output capturing.
+
+    :param capsys: the pytest capsys fixture
+    :param title: the title of the table
+    :param rows: a sequence of (name, {column: value}) pairs
+    """
+    with capsys.disabled():
+        print(f'\n{title}')
+        for name, columns in rows:
+            print(f'\t{name}: ' + ', '.join(f'{column}={value}' for column, value in columns.items()))
+
+
+def check_baseline(results: Dict[str, Measurement]) -> None:
+    """
+    Save measurements as the baseline, or fail if they regressed compared to the baseline.
+
+    Measurements are compared only with the ones saved at the same scale. Measurements
+    missing from the baseline are not compared.
+
+    :param results: the measurements, by a name unique among every benchmark
+    """
+    if BASELINE_PATH is None:
+        return
+
+    baseline = dict()
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    if SAVE_BASELINE:
+        saved = baseline.setdefault(str(SCALE), dict())
+        saved.update((name, m._asdict()) for name, m in results.items())
+        with open(BASELINE_PATH, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        return
+
+    regressions = []
+    for name, m in results.items():
+        saved = baseline.get(str(SCALE), dict()).get(name)
+        if saved is None:
+            continue
+        if m.seconds > saved['seconds'] * (1 + TOLERANCE):
+            regressions.append(f"{name}: {m.seconds:.3f}s, {saved['seconds']:.3f}s in the baseline")
+        if m.peak_rss_kb > saved['peak_rss_kb'] * (1 + TOLERANCE) + _RSS_SLACK_KB:
+            regressions.append(f"{name}: peak RSS growth {m.peak_rss_kb} KiB, "
+                               f"{saved['peak_rss_kb']} KiB in the baseline")
+
+    if regressions:
+        pytest.fail('Regressions beyond the tolerance of the baseline:\n' + '\n'.join(regressions))
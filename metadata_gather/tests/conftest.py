@@ -18,3 +18,9 @@ def temp_csv_file():
 def temp_json_file():
     with NamedTemporaryFile('w', buffering=1, suffix='.json') as temp_file:
         yield temp_file
+
+
+@pytest.fixture
+def temp_jsonl_file():
+    with NamedTemporaryFile('w', buffering=1, suffix='.jsonl') as temp_file:
+        yield temp_file
@@ -1,6 +1,12 @@
 import argparse
+import json
+import pstats
+import threading
 
+from common import Metadata
+from daemon import CrawlDaemon
 from gather import main
+from storage_manager import open_storage
 
 from tests.utils import write_csv, write_json
 
@@ -71,3 +77,196 @@ def test_json_gathering(monkeypatch, temp_json_file, temp_db_file, capsys):
         '\tfield_three, Integer, 2, 2',
         '',
     ]
+
+
+def test_batch_gathering(monkeypatch, tmp_path, temp_db_file, capsys):
+    for name in ('one', 'two'):
+        with open(str(tmp_path / f'{name}.csv'), 'w') as csv_file:
+            write_csv(csv_file, ['field'], [{'field': 10}, {'field': 'null'}])
+
+    def namespace(_):
+        return argparse.Namespace(crawl=None, describe=None, batch=[str(tmp_path)],
+                                  database_path=temp_db_file.name, workers=2)
+
+    monkeypatch.setattr(argparse.ArgumentParser, "parse_args", namespace)
+
+    main()
+
+    def namespace(_):
+        return argparse.Namespace(crawl=None, describe=str(tmp_path / 'two.csv'), database_path=temp_db_file.name)
+
+    monkeypatch.setattr(argparse.ArgumentParser, "parse_args", namespace)
+
+    main()
+
+    captured = capsys.readouterr()
+    assert captured.out.split('\n') == [
+        'Crawled: 2, skipped: 0, failed: 0',
+        f'File: {tmp_path / "two.csv"}',
+        'Total entries: 1',
+        'Fields:',
+        '\tfield, Integer, 1, 1',
+        '',
+    ]
+
+
+def test_gathering_through_daemon(monkeypatch, tmp_path, temp_csv_file, capsys):
+    write_csv(temp_csv_file, ['field'], [{'field': 10}, {'field': 'null'}])
+    db_path = str(tmp_path / 'metadata.db')
+
+    with CrawlDaemon(db_path, workers=1) as daemon:
+        thread = threading.Thread(target=daemon.serve_forever)
+        thread.start()
+
+        def namespace(_):
+            return argparse.Namespace(crawl=temp_csv_file.name, database_path=db_path)
+
+        monkeypatch.setattr(argparse.ArgumentParser, "parse_args", namespace)
+        # the file must not be crawled in-process
+        monkeypatch.delattr('tasks.crawl_and_store')
+
+        try:
+            main()
+        finally:
+            daemon.shutdown()
+            thread.join()
+
+    # with the daemon stopped, the metadata it stored is described in-process
+    def namespace(_):
+        return argparse.Namespace(crawl=None, describe=temp_csv_file.name, database_path=db_path)
+
+    monkeypatch.setattr(argparse.ArgumentParser, "parse_args", namespace)
+
+    main()
+
+    captured = capsys.readouterr()
+    assert captured.out.split('\n') == [
+        f'File: {temp_csv_file.name}',
+        'Total entries: 1',
+        'Fields:',
+        '\tfield, Integer, 1, 1',
+        '',
+    ]
+
+
+def test_describing_approximate_metadata(monkeypatch, tmp_path, capsys):
+    db_path = str(tmp_path / 'metadata.db')
+    with open_storage(db_path) as s:
+        s.store_metadata('/data/big.csv', [Metadata('field', 'I', 1000, 100, 30, 10)])
+
+    def namespace(_):
+        return argparse.Namespace(crawl=None, describe='/data/big.csv', database_path=db_path, no_daemon=True)
+
+    monkeypatch.setattr(argparse.ArgumentParser, "parse_args", namespace)
+
+    main()
+
+    captured = capsys.readouterr()
+    assert captured.out.split('\n') == [
+        'File: /data/big.csv',
+        'Total entries: 1',
+        'Approximate: estimated from a sample, with 95% confidence intervals',
+        'Fields:',
+        '\tfield, Integer, ~900 (±40), ~100 (±10)',
+        '',
+    ]
+
+
+def test_gathering_statistics(monkeypatch, temp_csv_file, temp_db_file, capsys):
+    write_csv(temp_csv_file, ['number', 'text'], [
+        {'number': 10, 'text': '"abc"'},
+        {'number': 'null', 'text': '"abc"'},
+        {'number': 30, 'text': '"abcdef"'},
+    ])
+
+    def namespace(_):
+        return argparse.Namespace(crawl=temp_csv_file.name, database_path=temp_db_file.name, with_statistics=True,
+                                  no_daemon=True)
+
+    monkeypatch.setattr(argparse.ArgumentParser, "parse_args", namespace)
+
+    main()
+
+    def namespace(_):
+        return argparse.Namespace(crawl=None, describe=temp_csv_file.name, database_path=temp_db_file.name,
+                                  no_daemon=True)
+
+    monkeypatch.setattr(argparse.ArgumentParser, "parse_args", namespace)
+
+    main()
+
+    captured = capsys.readouterr()
+    assert captured.out.split('\n') == [
+        f'File: {temp_csv_file.name}',
+        'Total entries: 2',
+        'Fields:',
+        '\tnumber, Integer, 2, 1',
+        '\t\tmin 10, max 30, mean 20, std dev 10',
+        '\t\tdistinct: ~2',
+        '\t\ttop values: 10 (1), 30 (1)',
+        '\ttext, String, 3, 0',
+        '\t\tlengths: <=4: 2, <=8: 1',
+        '\t\tdistinct: ~2',
+        '\t\ttop values: "abc" (2), "abcdef" (1)',
+        '',
+    ]
+
+
+def test_gathering_metrics_and_profile(monkeypatch, tmp_path, temp_csv_file, temp_db_file, capsys):
+    write_csv(temp_csv_file, ['field'], [{'field': 1}, {'field': 'null'}])
+    metrics_path = str(tmp_path / 'metrics.json')
+    profile_path = str(tmp_path / 'crawl.prof')
+
+    def namespace(_):
+        return argparse.Namespace(crawl=temp_csv_file.name, database_path=temp_db_file.name, metrics='json',
+                                  metrics_output=metrics_path, profile=profile_path)
+
+    monkeypatch.setattr(argparse.ArgumentParser, "parse_args", namespace)
+
+    main()
+
+    with open(metrics_path) as metrics_file:
+        [measurement] = json.load(metrics_file)['files']
+    assert measurement['path'] == temp_csv_file.name
+    assert measurement['values'] == 2
+    assert pstats.Stats(profile_path).total_calls > 0
+    assert capsys.readouterr().err == ''
+
+
+def test_querying_the_catalog(monkeypatch, tmp_path, temp_db_file, capsys):
+    with open_storage(temp_db_file.name) as s:
+        s.store_metadata('/data/2026/a.csv', [Metadata('id', 'I', 3, 1), Metadata('name', 'S', 3, 0)])
+        s.store_metadata('/data/2026/b.csv', [Metadata('id', 'S', 2, 0)])
+        s.store_metadata('/data/2027/c.csv', [Metadata('id', 'I', 1, 0)])
+
+    def query(**kwargs):
+        def namespace(_):
+            return argparse.Namespace(crawl=None, describe=None, query='/data/2026/', database_path=temp_db_file.name,
+                                      **kwargs)
+
+        monkeypatch.setattr(argparse.ArgumentParser, "parse_args", namespace)
+        main()
+        return capsys.readouterr().out
+
+    assert query().split('\n') == [
+        '/data/2026/a.csv',
+        '\tid, Integer, 2, 1',
+        '\tname, String, 3, 0',
+        '/data/2026/b.csv',
+        '\tid, String, 2, 0',
+        '',
+    ]
+    assert query(field='id', output_format='csv').splitlines() == [
+        'path,field,type,total_occurrences,null_occurrences,total_margin,null_margin',
+        '/data/2026/a.csv,id,Integer,3,1,,',
+        '/data/2026/b.csv,id,String,2,0,,',
+    ]
+    [line] = query(field='name', output_format='json').splitlines()
+    assert json.loads(line) == {'path': '/data/2026/a.csv', 'fields': [{
+        'field': 'name', 'type': 'String', 'total_occurrences': 3, 'null_occurrences': 0, 'total_margin': None,
+        'null_margin': None, 'statistics': None,
+    }]}
+    assert query(type_conflicts=True) == 'id: Integer in 1 file, String in 1 file\n'
+    assert json.loads(query(type_conflicts=True, output_format='json')) == {
+        'field': 'id', 'types': {'Integer': 1, 'String': 1},
+    }
@@ -0,0 +1,92 @@
+import bz2
+import gzip
+import lzma
+
+import pytest
+
+from common import ColumnStatistics, Metadata, MetadataRecord
+from metadata_extractor import (extract_metadata_from_file, extract_statistics_from_file, is_supported_file,
+                                split_file, supports_splitting, supports_statistics, ExtractionError)
+from metadata_extractor.compression import compression_of
+from tasks import collect_paths, crawl_file_in_chunks
+
+_OPENERS = {
+    'gz': gzip.open,
+    'bz2': bz2.open,
+    'xz': lzma.open,
+}
+
+_CSV = 'field_1,field_2\n1,"abc"\nnull,"de"\n'
+
+_JSONL = '{"field_1": 1, "field_2": "abc"}\n{"field_1": null}\n'
+
+_JSON = '[{"field_1": 1, "field_2": "abc"},\n {"field_1": null}]'
+
+
+def _write(path, content, compression):
+    with _OPENERS[compression](path, mode='wt') as f:
+        f.write(content)
+
+
+@pytest.mark.parametrize('compression', sorted(_OPENERS))
+@pytest.mark.parametrize('extension, content, records', [
+    ('csv', _CSV, [MetadataRecord('field_1', 1), MetadataRecord('field_2', 'abc'),
+                   MetadataRecord('field_1', None), MetadataRecord('field_2', 'de')]),
+    ('jsonl', _JSONL, [MetadataRecord('field_1', 1), MetadataRecord('field_2', 'abc'),
+                       MetadataRecord('field_1', None)]),
+    ('json', _JSON, [MetadataRecord('field_1', 1), MetadataRecord('field_2', 'abc'),
+                     MetadataRecord('field_1', None)]),
+])
+def test_extracting_compressed_files(tmp_path, compression, extension, content, records):
+    path = str(tmp_path / f'data.{extension}.{compression}')
+    _write(path, content, compression)
+
+    assert is_supported_file(path)
+    assert compression_of(path) == compression
+    assert list(extract_metadata_from_file(path)) == records
+
+
+@pytest.mark.parametrize('extension, content', [('csv', _CSV), ('jsonl', _JSONL)])
+def test_extracting_statistics_from_compressed_files(tmp_path, extension, content):
+    path = str(tmp_path / f'data.{extension}.gz')
+    _write(path, content, 'gz')
+
+    assert supports_statistics(path)
+    assert list(extract_statistics_from_file(path)) == [
+        ColumnStatistics('field_1', 2, 1, (int,)),
+        ColumnStatistics('field_2', 2 if extension == 'csv' else 1, 0, (str,)),
+    ]
+
+
+def test_compressed_files_are_not_split(tmp_path):
+    path = str(tmp_path / 'data.csv.gz')
+    _write(path, 'field_1,field_2\n' + '1,"abc"\nnull,"de"\n' * 1000, 'gz')
+
+    assert not supports_splitting(path)
+    with pytest.raises(ExtractionError):
+        split_file(path, 2)
+    with pytest.raises(ExtractionError):
+        list(extract_statistics_from_file(path, 0, 10))
+    assert list(crawl_file_in_chunks(path, workers=2, min_chunk_size=1)) == [
+        Metadata('field_1', 'I', 2000, 1000), Metadata('field_2', 'S', 2000, 0),
+    ]
+
+
+@pytest.mark.parametrize('content', [b'not compressed at all', gzip.compress(_CSV.encode())[:-10]])
+def test_corrupted_compressed_files(tmp_path, content):
+    path = str(tmp_path / 'data.csv.gz')
+    with open(path, 'wb') as f:
+        f.write(content)
+
+    with pytest.raises(ExtractionError, match='Could not decompress'):
+        list(extract_metadata_from_file(path))
+
+
+def test_compressed_file_names(tmp_path):
+    for name in ('data.csv.gz', 'data.gz', 'data.txt.gz', 'data.csv'):
+        (tmp_path / name).write_bytes(b'')
+
+    assert compression_of('data.csv') is None
+    assert not is_supported_file(str(tmp_path / 'data.gz'))
+    assert not is_supported_file(str(tmp_path / 'data.txt.gz'))
+    assert collect_paths([str(tmp_path)]) == [str(tmp_path / 'data.csv'), str(tmp_path / 'data.csv.gz')]
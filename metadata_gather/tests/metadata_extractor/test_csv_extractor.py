@@ -1,10 +1,13 @@
 import csv
+from datetime import date, datetime, timedelta, timezone
 
 import pytest
 
-from common import MetadataRecord
+from common import ColumnStatistics, MetadataRecord
+from crawler import crawl, crawl_statistics, merge_metadata
 
-from metadata_extractor.csv_extractor import extract_data_from_csv
+from metadata_extractor import csv_extractor
+from metadata_extractor.csv_extractor import extract_data_from_csv, extract_statistics_from_csv, split_csv_file
 from metadata_extractor.exceptions import ExtractionError
 
 from tests.utils import write_csv
@@ -101,6 +104,34 @@ def test_csv_invalid_string_format(temp_csv_file):
     assert info.args[0] == "Unknown type for value 'abc' (column 'field_one') at line 2"
 
 
+@pytest.mark.parametrize('value, expected', [
+    ('1.5', 1.5),
+    ('-.5', -0.5),
+    ('1e3', 1000.0),
+    ('+2.5E-1', 0.25),
+    ('true', True),
+    ('FALSE', False),
+    ('2024-02-29', date(2024, 2, 29)),
+    ('2024-02-29T10:20:30', datetime(2024, 2, 29, 10, 20, 30)),
+    ('2024-02-29 10:20:30.25Z', datetime(2024, 2, 29, 10, 20, 30, 250000, timezone.utc)),
+    ('2024-02-29T10:20:30-05:30', datetime(2024, 2, 29, 10, 20, 30, tzinfo=timezone(-timedelta(hours=5, minutes=30)))),
+])
+def test_csv_inferred_types(temp_csv_file, value, expected):
+    write_csv(temp_csv_file, ['field'], [{'field': f' {value} '}])
+    records = list(extract_data_from_csv(temp_csv_file.name))
+    assert records == [MetadataRecord('field', expected)]
+    assert type(records[0].value) is type(expected)
+
+
+@pytest.mark.parametrize('value', ['1.2.3', '2024-13-01', '2024-02-30T10:00:00', '2024-02-01T10:00', 'yes', '0x10'])
+def test_csv_values_of_unknown_type(temp_csv_file, value):
+    write_csv(temp_csv_file, ['field'], [{'field': value}])
+    for extract in (extract_data_from_csv, extract_statistics_from_csv):
+        with pytest.raises(ExtractionError) as exc:
+            list(extract(temp_csv_file.name))
+        assert exc.value.args[0] == f"Unknown type for value '{value}' (column 'field') at line 2"
+
+
 def test_csv_unicode_column_name(temp_csv_file):
     write_csv(temp_csv_file, ['短消息'], [{'短消息': 50}])
     records = list(extract_data_from_csv(temp_csv_file.name))
@@ -119,3 +150,205 @@ def test_missing_file():
 
     info = exc.value
     assert info.args[0] == "Could not open file 'missing.csv'"
+
+
+def test_csv_statistics(temp_csv_file):
+    write_csv(temp_csv_file, ['field_one', 'field_two', 'field_three'], [
+        {'field_one': 10, 'field_two': '"abc"', 'field_three': 'null'},
+        {'field_one': 'null', 'field_two': 'null', 'field_three': 'null'},
+        {'field_one': 'null', 'field_two': '"def"', 'field_three': 0},
+    ])
+    statistics = list(extract_statistics_from_csv(temp_csv_file.name))
+    assert statistics == [
+        ColumnStatistics('field_one', 3, 2, (int,)),
+        ColumnStatistics('field_two', 3, 1, (str,)),
+        ColumnStatistics('field_three', 3, 2, (int,)),
+    ]
+
+
+def test_csv_statistics_mixed_types(temp_csv_file):
+    write_csv(temp_csv_file, ['field'], [{'field': 10}, {'field': '"abc"'}])
+    assert list(extract_statistics_from_csv(temp_csv_file.name)) == [ColumnStatistics('field', 2, 0, (int, str))]
+
+
+def test_csv_statistics_inferred_types(temp_csv_file):
+    write_csv(temp_csv_file, ['field_one', 'field_two'], [
+        {'field_one': 1, 'field_two': 'true'},
+        {'field_one': '1.5', 'field_two': '2024-01-01'},
+        {'field_one': '"abc"', 'field_two': '2024-01-01 10:00:00'},
+    ])
+    assert list(extract_statistics_from_csv(temp_csv_file.name)) == [
+        ColumnStatistics('field_one', 3, 0, (int, str, float)),
+        ColumnStatistics('field_two', 3, 0, (bool, date, datetime)),
+    ]
+
+
+def test_csv_statistics_without_rows(temp_csv_file):
+    write_csv(temp_csv_file, ['field_one', 'field_two'], [])
+    assert list(extract_statistics_from_csv(temp_csv_file.name)) == []
+
+
+@pytest.mark.parametrize('fieldnames, rows', [
+    (['field'], [{'field': idx} for idx in range(100)]),
+    (['field_one', 'field_two'], [{'field_one': '"abc"', 'field_two': 'null'} for _ in range(100)]),
+    (['"quoted" ', ' field'], [{'"quoted" ': ' null ', ' field': ' 5'}, {'"quoted" ': 'NULL', ' field': ' 7 '}]),
+    (['短消息', 'field'], [{'短消息': '"短消息"', 'field': 'null'}]),
+])
+def test_csv_statistics_match_records(temp_csv_file, fieldnames, rows):
+    write_csv(temp_csv_file, fieldnames, rows)
+    statistics = extract_statistics_from_csv(temp_csv_file.name)
+    records = extract_data_from_csv(temp_csv_file.name)
+    assert sorted(crawl_statistics(statistics)) == sorted(crawl(records))
+
+
+def test_csv_statistics_missing_value_for_column(temp_csv_file):
+    write_csv(temp_csv_file, ['field_one', 'field_two'],
+              [{'field_one': '"abc"', }])
+    with pytest.raises(ExtractionError) as exc:
+        list(extract_statistics_from_csv(temp_csv_file.name))
+
+    info = exc.value
+    assert info.args[0] == "Missing value for column 'field_two' at line 2"
+
+
+def test_csv_statistics_missing_column_for_value(temp_csv_file):
+    writer = csv.writer(temp_csv_file)
+    writer.writerow(['field_one', 'field_two'])
+    writer.writerow(['"abc"', 50, 100])
+    temp_csv_file.flush()
+
+    with pytest.raises(ExtractionError) as exc:
+        list(extract_statistics_from_csv(temp_csv_file.name))
+
+    info = exc.value
+    assert info.args[0] == "Missing column name for value ['100'] at line 2"
+
+
+def test_csv_statistics_invalid_string_format(temp_csv_file):
+    write_csv(temp_csv_file, ['field_one'], [{'field_one': 'abc', }])
+    with pytest.raises(ExtractionError) as exc:
+        list(extract_statistics_from_csv(temp_csv_file.name))
+
+    info = exc.value
+    assert info.args[0] == "Unknown type for value 'abc' (column 'field_one') at line 2"
+
+
+def test_statistics_missing_file():
+    with pytest.raises(ExtractionError) as exc:
+        list(extract_statistics_from_csv("missing.csv"))
+
+    info = exc.value
+    assert info.args[0] == "Could not open file 'missing.csv'"
+
+
+@pytest.mark.parametrize('chunks', [1, 2, 5, 50])
+def test_csv_statistics_by_ranges(temp_csv_file, chunks):
+    write_csv(temp_csv_file, ['field_one', 'field_two'],
+              [{'field_one': idx if idx % 3 else 'null', 'field_two': '"abc"' if idx % 5 else 'null'}
+               for idx in range(200)])
+
+    partials = [crawl_statistics(extract_statistics_from_csv(temp_csv_file.name, start, end))
+                for start, end in split_csv_file(temp_csv_file.name, chunks)]
+
+    assert list(merge_metadata(partials)) == list(crawl(extract_data_from_csv(temp_csv_file.name)))
+
+
+def test_csv_statistics_by_ranges_error_line(temp_csv_file):
+    write_csv(temp_csv_file, ['field'], [{'field': idx} for idx in range(99)] + [{'field': 'abc'}])
+
+    ranges = split_csv_file(temp_csv_file.name, 4)
+    start, end = ranges[-1]
+    with pytest.raises(ExtractionError) as exc:
+        list(extract_statistics_from_csv(temp_csv_file.name, start, end))
+
+    info = exc.value
+    assert info.args[0] == "Unknown type for value 'abc' (column 'field') at line 101"
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    # Tiny blocks and windows, so that small files span many of them
+    monkeypatch.setattr(csv_extractor, '_SCAN_BLOCK_SIZE', 64)
+    monkeypatch.setattr(csv_extractor, '_WINDOW_SIZE', 8192)
+
+
+@pytest.mark.parametrize('line_terminator', ['\n', '\r\n'])
+def test_mapped_csv_statistics_match_records(tmp_path, small_blocks, line_terminator):
+    path = tmp_path / 'data.csv'
+    lines = ['field_one,field_two,field_one']
+    for idx in range(2000):
+        # a padded value every now and then needs the exact rules
+        padded = ' 5 ' if idx % 500 == 7 else idx
+        quoted = '"' + 'x' * (idx % 7) + '"'
+        lines.append(f'{idx if idx % 3 else "null"},{quoted:>9},{padded}')
+    path.write_text(line_terminator.join(lines) + line_terminator)
+
+    statistics = extract_statistics_from_csv(str(path))
+    assert sorted(crawl_statistics(statistics)) == sorted(crawl(extract_data_from_csv(str(path))))
+
+
+@pytest.mark.parametrize('chunks', [1, 3, 20])
+def test_mapped_csv_statistics_by_ranges(tmp_path, small_blocks, chunks):
+    path = tmp_path / 'data.csv'
+    path.write_text('field\n' + ''.join(f'{idx if idx % 4 else "null"}\n' for idx in range(5000)))
+
+    partials = [crawl_statistics(extract_statistics_from_csv(str(path), start, end))
+                for start, end in split_csv_file(str(path), chunks)]
+
+    assert list(merge_metadata(partials)) == list(crawl(extract_data_from_csv(str(path))))
+
+
+def test_mapped_csv_statistics_line_longer_than_window(tmp_path, small_blocks):
+    path = tmp_path / 'data.csv'
+    long_value = '"' + 'a' * 50000 + '"'
+    path.write_text('field_one,field_two\n1,null\n' + f'2,{long_value}\n' + 'null,"b"\n' * 100)
+
+    assert list(extract_statistics_from_csv(str(path))) == [
+        ColumnStatistics('field_one', 102, 100, (int,)),
+        ColumnStatistics('field_two', 102, 1, (str,)),
+    ]
+
+
+def test_mapped_csv_statistics_last_line_without_line_break(tmp_path, small_blocks):
+    path = tmp_path / 'data.csv'
+    # the last line is longer than a block, and isn't followed by a line break
+    path.write_text('field_one,field_two\n1,null\n' + '2,"' + 'a' * 500 + '"')
+
+    assert list(extract_statistics_from_csv(str(path))) == [
+        ColumnStatistics('field_one', 2, 0, (int,)),
+        ColumnStatistics('field_two', 2, 1, (str,)),
+    ]
+
+
+def test_mapped_csv_statistics_error_line(tmp_path, small_blocks):
+    path = tmp_path / 'data.csv'
+    path.write_text('field_one,field_two\n' + '1,"abc"\n' * 1500 + '1,"abc",3\n')
+
+    with pytest.raises(ExtractionError) as exc:
+        list(extract_statistics_from_csv(str(path)))
+
+    info = exc.value
+    assert info.args[0] == "Missing column name for value ['3'] at line 1502"
+
+
+def test_mapped_csv_statistics_mixed_line_terminators(tmp_path, small_blocks):
+    path = tmp_path / 'data.csv'
+    path.write_bytes(b'field\r\n' + b'1\r\n"a"\n' * 100 + b'null\r2\n')
+
+    assert list(extract_statistics_from_csv(str(path))) == [ColumnStatistics('field', 202, 1, (int, str))]
+
+
+def test_mapped_csv_statistics_floats_and_booleans(tmp_path, small_blocks):
+    path = tmp_path / 'data.csv'
+    lines = ['field_one,field_two,field_three']
+    for idx in range(2000):
+        # an exponent or a date every now and then needs the exact rules
+        number = '1e3' if idx % 500 == 7 else (f'-{idx}.5' if idx % 2 else idx)
+        flag = ('true', 'false', 'null')[idx % 3]
+        when = '2024-01-01' if idx % 700 == 3 else 'null'
+        lines.append(f'{number},{flag},{when}')
+    path.write_text('\n'.join(lines) + '\n')
+
+    statistics = list(extract_statistics_from_csv(str(path)))
+    assert [column.types for column in statistics] == [(int, float), (bool,), (date,)]
+    assert sorted(crawl_statistics(statistics)) == sorted(crawl(extract_data_from_csv(str(path))))
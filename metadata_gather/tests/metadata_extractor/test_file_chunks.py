@@ -0,0 +1,50 @@
+import pytest
+
+from metadata_extractor.file_chunks import count_lines, open_range, split_on_lines
+
+
+@pytest.fixture
+def lines_file(tmp_path):
+    file_path = str(tmp_path / 'lines.txt')
+    with open(file_path, 'w', newline='') as f:
+        f.write(''.join(f'line {idx}\r\n' if idx % 2 else f'line {idx}\n' for idx in range(100)))
+    return file_path
+
+
+@pytest.mark.parametrize('chunks', [1, 2, 3, 7, 100, 1000])
+def test_ranges_cover_the_file(lines_file, chunks):
+    with open(lines_file, 'rb') as f:
+        content = f.read()
+
+    ranges = split_on_lines(lines_file, chunks)
+
+    assert len(ranges) <= chunks
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(content)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+        assert content[start - 1:start] == b'\n'
+
+
+def test_ranges_from_offset(lines_file):
+    ranges = split_on_lines(lines_file, 4, start=7)
+    assert ranges[0][0] == 7
+
+
+def test_open_range(lines_file):
+    with open(lines_file, newline='') as f:
+        lines = f.readlines()
+
+    ranges = split_on_lines(lines_file, 5)
+    read_lines = []
+    for start, end in ranges:
+        with open_range(lines_file, start, end) as range_file:
+            read_lines.extend(range_file.readlines())
+
+    assert read_lines == lines
+
+
+def test_count_lines(lines_file):
+    assert count_lines(lines_file, 0) == 0
+    assert count_lines(lines_file, len('line 0\n')) == 1
+    assert count_lines(lines_file, 10 ** 6) == 100
@@ -0,0 +1,75 @@
+import io
+import json
+
+import pytest
+
+from metadata_extractor import extract_metadata_from_file, ExtractionError
+from metadata_extractor.json_decoders import DECODER_ENV_VAR, get_json_decoder, json_decoders
+from metadata_extractor.json_extractor import _JSONArrayStream
+from metadata_extractor.jsonl_extractor import _perform_extraction
+
+from tests.utils import write_jsonl
+
+_DOCUMENTS = [
+    [{'field': 1, 'other': 'abc'}, {'field': None}],
+    [{'text': 'with {braces} and "quotes" and \\ backslashes', 'nested': {'inner': {'deep': [1, {'x': '}'}]}}}],
+    [{'big': 2 ** 70, 'float': 1.5, 'unicode': 'ñandú é \U0001f600', 'bool': True}],
+    [{'duplicated': 1, 'other': 2}],
+    [],
+]
+
+decoders = pytest.mark.parametrize('decoder', sorted(json_decoders))
+
+
+@decoders
+@pytest.mark.parametrize('document', _DOCUMENTS)
+@pytest.mark.parametrize('chunk_size', [1, 7, 64 * 1024])
+def test_array_decoders_produce_the_same_objects(decoder, document, chunk_size):
+    text = json.dumps(document, indent=1)
+    assert list(_JSONArrayStream(io.StringIO(text), chunk_size, decoder)) == document
+
+
+@decoders
+def test_array_decoders_with_special_values(decoder):
+    text = '[{"nan": NaN, "duplicated": 1, "duplicated": 2}, {"lone_surrogate": "\\ud800"}]'
+    assert list(_JSONArrayStream(io.StringIO(text), decoder=decoder)) == json.loads(text)
+
+
+@decoders
+@pytest.mark.parametrize('text', ['[{"field": 1}, {"field": }]', '[{"field": 1}}]', '[{"field": "abc]', '[1, 2'])
+def test_array_decoders_raise_the_same_errors(decoder, text):
+    with pytest.raises(json.JSONDecodeError):
+        list(_JSONArrayStream(io.StringIO(text), decoder=decoder))
+
+
+@decoders
+@pytest.mark.parametrize('document', _DOCUMENTS)
+def test_jsonl_decoders_produce_the_same_records(decoder, document, temp_jsonl_file):
+    write_jsonl(temp_jsonl_file, document)
+    assert list(_perform_extraction(temp_jsonl_file.name, decoder)) == \
+        list(_perform_extraction(temp_jsonl_file.name, 'stdlib'))
+
+
+def test_fastest_decoder_by_default(monkeypatch):
+    monkeypatch.delenv(DECODER_ENV_VAR, raising=False)
+    assert get_json_decoder() == ('orjson' if 'orjson' in json_decoders else 'stdlib')
+
+
+def test_decoder_from_environment(monkeypatch):
+    monkeypatch.setenv(DECODER_ENV_VAR, 'stdlib')
+    assert get_json_decoder() == 'stdlib'
+
+    monkeypatch.setenv(DECODER_ENV_VAR, 'unknown')
+    with pytest.raises(ValueError):
+        get_json_decoder()
+
+
+@decoders
+def test_error_mapping_does_not_depend_on_decoder(decoder, monkeypatch, temp_json_file):
+    monkeypatch.setenv(DECODER_ENV_VAR, decoder)
+    temp_json_file.write('[{"field": 1}, {"field": ]')
+    temp_json_file.flush()
+
+    with pytest.raises(ExtractionError) as e:
+        list(extract_metadata_from_file(temp_json_file.name))
+    assert str(e.value) == f"The file '{temp_json_file.name}' is not a valid JSON file"
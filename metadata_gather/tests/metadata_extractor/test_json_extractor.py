@@ -1,7 +1,11 @@
+import io
+import json
+
 import pytest
 
 from common import MetadataRecord
-from metadata_extractor.json_extractor import extract_data_from_json, ExtractionError
+from metadata_extractor import json_extractor
+from metadata_extractor.json_extractor import extract_data_from_json, ExtractionError, _JSONArrayStream
 
 from tests.utils import write_json
 
@@ -99,3 +103,54 @@ def test_missing_file():
 
     info = exc.value
     assert info.args[0] == "Could not open file 'missing.json'"
+
+
+def test_json_objects_split_across_chunks():
+    objects = [{'field_one': idx * 1000003, 'field_two': 'abc' * idx, 'field_three': None} for idx in range(50)]
+    content = json.dumps(objects, indent=2)
+    for chunk_size in (1, 2, 7, 64):
+        assert list(_JSONArrayStream(io.StringIO(content), chunk_size)) == objects
+
+
+def test_invalid_json_element_is_not_buffered_whole(monkeypatch):
+    monkeypatch.setattr(json_extractor, '_MAX_ELEMENT_SIZE', 1024)
+    content = io.StringIO('[{"big": "' + 'a' * 5000 + '"}, {"field": 1 2}, ' + '{"field": 1}, ' * 100000 + '{}]')
+
+    with pytest.raises(json.JSONDecodeError):
+        list(_JSONArrayStream(content, 64))
+    # elements up to twice the biggest one are buffered, not the rest of the file
+    assert content.tell() < 4 * 5000
+
+
+def test_json_empty_list(temp_json_file):
+    write_json(temp_json_file, [])
+    assert list(extract_data_from_json(temp_json_file.name)) == []
+
+
+def test_json_trailing_content(temp_json_file):
+    temp_json_file.write('[{"field": 1}] [{"field": 2}]')
+    with pytest.raises(ExtractionError) as exc:
+        list(extract_data_from_json(temp_json_file.name))
+
+    info = exc.value
+    assert info.args[0] == f"The file '{temp_json_file.name}' is not a valid JSON file"
+
+
+def test_json_truncated_list(temp_json_file):
+    temp_json_file.write('[{"field": 1}, {"field": 2}')
+    with pytest.raises(ExtractionError) as exc:
+        list(extract_data_from_json(temp_json_file.name))
+
+    info = exc.value
+    assert info.args[0] == f"The file '{temp_json_file.name}' is not a valid JSON file"
+
+
+def test_json_nested_values(temp_json_file):
+    write_json(temp_json_file, [{'user': {'id': 1, 'address': {'zip': '08001'}},
+                                 'items': [{'sku': 'a'}, {'sku': None}]},
+                                {'user': {'id': 2}, 'items': []}])
+    assert list(extract_data_from_json(temp_json_file.name)) == [
+        MetadataRecord('user.id', 1), MetadataRecord('user.address.zip', '08001'),
+        MetadataRecord('items[].sku', 'a'), MetadataRecord('items[].sku', None),
+        MetadataRecord('user.id', 2), MetadataRecord('items[]', None),
+    ]
@@ -0,0 +1,69 @@
+import pytest
+
+from metadata_extractor.json_paths import JSONFlattener, MAX_DEPTH_ENV_VAR, get_max_depth
+
+
+def test_flat_objects():
+    assert list(JSONFlattener().items({'field': 1, 'other': None})) == [('field', 1), ('other', None)]
+
+
+def test_nested_objects_and_arrays():
+    obj = {
+        'id': 1,
+        'user': {'name': 'abc', 'address': {'zip': '08001', 'street': None}},
+        'items': [{'sku': 1, 'tags': ['a', 'b']}, {'sku': 2, 'tags': []}],
+        'matrix': [[1, 2], [3]],
+        'empty': {},
+    }
+    assert list(JSONFlattener().items(obj)) == [
+        ('id', 1),
+        ('user.name', 'abc'), ('user.address.zip', '08001'), ('user.address.street', None),
+        ('items[].sku', 1), ('items[].tags[]', 'a'), ('items[].tags[]', 'b'), ('items[].sku', 2),
+        ('items[].tags[]', None),
+        ('matrix[][]', 1), ('matrix[][]', 2), ('matrix[][]', 3),
+        ('empty', None),
+    ]
+
+
+def test_empty_containers_are_null_values():
+    flattener = JSONFlattener()
+    assert list(flattener.items({'a': {}})) == [('a', None)]
+    assert list(flattener.items({'tags': []})) == [('tags[]', None)]
+    assert list(flattener.items({'items': [{}, [], 1]})) == [('items[]', None), ('items[][]', None), ('items[]', 1)]
+
+
+def test_dotted_keys_are_not_escaped():
+    flattener = JSONFlattener()
+    assert list(flattener.items({'a.b': 1, 'a': {'b': 2}})) == [('a.b', 1), ('a.b', 2)]
+
+
+@pytest.mark.parametrize('max_depth, expected', [
+    (1, [('id', 1)]),
+    (2, [('id', 1), ('a.x', 1)]),
+    (3, [('id', 1), ('a.x', 1), ('a.b.y', 2), ('a.l[]', None)]),
+    (4, [('id', 1), ('a.x', 1), ('a.b.y', 2), ('a.l[]', None), ('a.l[][]', 3)]),
+])
+def test_maximum_depth(max_depth, expected):
+    obj = {'id': 1, 'a': {'x': 1, 'b': {'y': 2}, 'l': [None, [3]]}}
+    assert list(JSONFlattener(max_depth).items(obj)) == expected
+
+
+def test_paths_are_built_once():
+    flattener = JSONFlattener()
+    first = [path for path, _ in flattener.items({'user': {'id': 1}, 'tags': ['a']})]
+    second = [path for path, _ in flattener.items({'user': {'id': 2}, 'tags': ['b']})]
+
+    assert first == second == ['user.id', 'tags[]']
+    assert all(a is b for a, b in zip(first, second))
+
+
+def test_max_depth_from_environment(monkeypatch):
+    monkeypatch.delenv(MAX_DEPTH_ENV_VAR, raising=False)
+    assert get_max_depth() == 32
+    assert get_max_depth(3) == 3
+
+    monkeypatch.setenv(MAX_DEPTH_ENV_VAR, '4')
+    assert JSONFlattener().max_depth == 4
+
+    with pytest.raises(ValueError):
+        get_max_depth(0)
@@ -0,0 +1,122 @@
+import pytest
+
+from common import ColumnStatistics, Metadata, MetadataRecord
+from crawler import SPILL_THRESHOLD_ENV_VAR, crawl, crawl_statistics
+from metadata_extractor import extract_metadata_from_file, is_supported_file, supports_splitting
+from metadata_extractor.json_paths import MAX_DEPTH_ENV_VAR
+from metadata_extractor.jsonl_extractor import (extract_data_from_jsonl, extract_statistics_from_jsonl,
+                                                split_jsonl_file, ExtractionError)
+from tasks import crawl_file
+
+from tests.utils import write_jsonl
+
+
+def test_jsonl_with_several_fields(temp_jsonl_file):
+    write_jsonl(temp_jsonl_file, [{'field_one': idx, 'field_two': None} for idx in range(3)])
+    records = list(extract_data_from_jsonl(temp_jsonl_file.name))
+    assert records == [record for idx in range(3)
+                       for record in (MetadataRecord('field_one', idx), MetadataRecord('field_two', None))]
+
+
+def test_jsonl_skips_blank_lines(temp_jsonl_file):
+    temp_jsonl_file.write('{"field": "abc"}\n\n  \n{"field": 1}')
+    records = list(extract_data_from_jsonl(temp_jsonl_file.name))
+    assert records == [MetadataRecord('field', 'abc'), MetadataRecord('field', 1)]
+
+
+def test_ndjson_extension_is_supported():
+    assert is_supported_file('file.ndjson')
+    assert is_supported_file('file.jsonl')
+    assert supports_splitting('file.ndjson')
+
+
+def test_jsonl_through_the_registry(temp_jsonl_file):
+    write_jsonl(temp_jsonl_file, [{'field': 'abc'}])
+    assert list(extract_metadata_from_file(temp_jsonl_file.name)) == [MetadataRecord('field', 'abc')]
+
+
+def test_invalid_jsonl(temp_jsonl_file):
+    temp_jsonl_file.write('{"field": 1}\n{"field": \n')
+    with pytest.raises(ExtractionError) as e:
+        list(extract_data_from_jsonl(temp_jsonl_file.name))
+    assert str(e.value) == f"The file '{temp_jsonl_file.name}' is not a valid JSON Lines file"
+
+
+def test_jsonl_line_not_an_object(temp_jsonl_file):
+    temp_jsonl_file.write('{"field": 1}\n[1, 2]\n')
+    with pytest.raises(ExtractionError) as e:
+        list(extract_data_from_jsonl(temp_jsonl_file.name))
+    assert str(e.value) == 'Invalid JSON Lines structure. Line 2 must contain an object'
+
+
+def test_jsonl_statistics(temp_jsonl_file):
+    write_jsonl(temp_jsonl_file, [{'field_one': 1, 'field_two': None}, {'field_one': 'abc'}, {'field_three': 2}])
+    statistics = list(extract_statistics_from_jsonl(temp_jsonl_file.name))
+    assert statistics == [ColumnStatistics('field_one', 2, 0, (int, str)),
+                          ColumnStatistics('field_two', 1, 1, ()),
+                          ColumnStatistics('field_three', 1, 0, (int,))]
+
+
+def test_jsonl_statistics_by_ranges(temp_jsonl_file):
+    write_jsonl(temp_jsonl_file, [{'field': idx if idx % 2 else None} for idx in range(1000)])
+
+    ranges = split_jsonl_file(temp_jsonl_file.name, 4)
+
+    assert len(ranges) == 4
+    statistics = [s for start, end in ranges for s in extract_statistics_from_jsonl(temp_jsonl_file.name, start, end)]
+    assert sum(s.occurrences for s in statistics) == 1000
+    assert sum(s.nulls for s in statistics) == 500
+
+
+def test_jsonl_error_line_in_range(temp_jsonl_file):
+    write_jsonl(temp_jsonl_file, [{'field': idx} for idx in range(100)])
+    temp_jsonl_file.write('"abc"\n')
+
+    start, end = split_jsonl_file(temp_jsonl_file.name, 2)[-1]
+    with pytest.raises(ExtractionError) as e:
+        list(extract_statistics_from_jsonl(temp_jsonl_file.name, start, end))
+    assert str(e.value) == 'Invalid JSON Lines structure. Line 101 must contain an object'
+
+
+_EVENTS = [
+    {'id': 1, 'user': {'name': 'abc', 'address': {'zip': '08001'}}, 'items': [{'sku': 1}, {'sku': None}]},
+    {'id': 2, 'user': {'name': None}, 'items': [], 'tags': ['a', 'b']},
+]
+
+
+def test_jsonl_statistics_are_produced_once_the_spill_threshold_is_reached(temp_jsonl_file, monkeypatch):
+    monkeypatch.setenv(SPILL_THRESHOLD_ENV_VAR, '10')
+    # every object has a field of its own, besides the shared ones
+    write_jsonl(temp_jsonl_file, [{'id': idx, f'key_{idx}': None if idx % 3 else 'abc', 'value': idx % 2 or 'abc'}
+                                  for idx in range(100)])
+
+    statistics = list(extract_statistics_from_jsonl(temp_jsonl_file.name))
+
+    assert len([s for s in statistics if s.name == 'id']) > 1
+    assert list(crawl_statistics(statistics)) == list(crawl(extract_data_from_jsonl(temp_jsonl_file.name)))
+
+
+def test_jsonl_nested_values(temp_jsonl_file):
+    write_jsonl(temp_jsonl_file, _EVENTS)
+    assert list(extract_data_from_jsonl(temp_jsonl_file.name)) == [
+        MetadataRecord('id', 1), MetadataRecord('user.name', 'abc'), MetadataRecord('user.address.zip', '08001'),
+        MetadataRecord('items[].sku', 1), MetadataRecord('items[].sku', None),
+        MetadataRecord('id', 2), MetadataRecord('user.name', None), MetadataRecord('items[]', None),
+        MetadataRecord('tags[]', 'a'), MetadataRecord('tags[]', 'b'),
+    ]
+
+
+def test_jsonl_nested_statistics(temp_jsonl_file):
+    write_jsonl(temp_jsonl_file, _EVENTS)
+    assert list(crawl_file(temp_jsonl_file.name)) == [
+        Metadata('id', 'I', 2, 0), Metadata('user.name', 'S', 2, 1), Metadata('user.address.zip', 'S', 1, 0),
+        Metadata('items[].sku', 'I', 2, 1), Metadata('items[]', None, 1, 1), Metadata('tags[]', 'S', 2, 0),
+    ]
+    assert list(crawl_file(temp_jsonl_file.name, with_statistics=True))[0].field == 'id'
+
+
+def test_jsonl_nested_values_maximum_depth(temp_jsonl_file, monkeypatch):
+    monkeypatch.setenv(MAX_DEPTH_ENV_VAR, '2')
+    write_jsonl(temp_jsonl_file, _EVENTS)
+    names = [s.name for s in extract_statistics_from_jsonl(temp_jsonl_file.name)]
+    assert names == ['id', 'user.name', 'items[]', 'tags[]']
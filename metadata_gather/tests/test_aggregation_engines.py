@@ -0,0 +1,56 @@
+import pytest
+
+from aggregation_engines import ENGINE_ENV_VAR, aggregation_engines, get_aggregation_engine
+from common import ColumnBatch, ColumnStatistics, MetadataRecord
+from crawler import CrawlingError, columnize, crawl, crawl_columns
+
+engines = pytest.mark.parametrize('engine', sorted(aggregation_engines))
+
+_SCENARIOS = [
+    [],
+    [MetadataRecord('field', 30)],
+    [MetadataRecord('field', None)],
+    [MetadataRecord('field', 'abc')] * 10 + [MetadataRecord('field', None)] * 5,
+    [MetadataRecord('f1', 1)] * 5 + [MetadataRecord('f2', 'abc')] * 5 + [MetadataRecord('f1', 2)] * 10 +
+    [MetadataRecord('f2', None)] * 5 + [MetadataRecord('f3', None)],
+    [MetadataRecord('field', value) for value in (20, None, True, 1.5, 'abc')],
+]
+
+
+@engines
+@pytest.mark.parametrize('records', _SCENARIOS)
+@pytest.mark.parametrize('batch_size', [1, 3, 1024])
+def test_engines_produce_the_same_metadata(engine, records, batch_size):
+    assert list(crawl_columns(columnize(records, batch_size), engine)) == list(crawl(records))
+
+
+@engines
+@pytest.mark.parametrize('records, message', [
+    ([MetadataRecord('field', 20), MetadataRecord('field', None), MetadataRecord('field', b'abc')],
+     "The type of field 'field' is unknown"),
+    ([MetadataRecord('field', 20), MetadataRecord('field', 1j)], "The type of field 'field' is unknown"),
+    ([MetadataRecord('field', [1])], "The type of field 'field' is unknown"),
+])
+def test_engines_raise_the_same_errors(engine, records, message):
+    for metadata in (lambda: list(crawl(records)), lambda: list(crawl_columns(columnize(records), engine))):
+        with pytest.raises(CrawlingError) as exc:
+            metadata()
+        assert str(exc.value) == message
+
+
+@engines
+def test_null_masks(engine):
+    batch = ColumnBatch('field', [1, 0, 3, 'ignored'], [False, True, False, True])
+    assert aggregation_engines[engine](batch) == ColumnStatistics('field', 4, 2, (int,))
+
+
+def test_get_aggregation_engine(monkeypatch):
+    monkeypatch.delenv(ENGINE_ENV_VAR, raising=False)
+    assert get_aggregation_engine() in aggregation_engines
+    assert get_aggregation_engine('python') == 'python'
+
+    monkeypatch.setenv(ENGINE_ENV_VAR, 'python')
+    assert get_aggregation_engine() == 'python'
+
+    with pytest.raises(ValueError):
+        get_aggregation_engine('unknown')
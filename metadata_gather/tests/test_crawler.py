@@ -1,7 +1,10 @@
+from datetime import date, datetime
+from decimal import Decimal
+
 import pytest
 
-from crawler import crawl, CrawlingError
-from common import MetadataRecord, Metadata
+from crawler import crawl, crawl_statistics, get_spill_threshold, merge_metadata, CrawlingError, SPILL_THRESHOLD_ENV_VAR
+from common import ColumnStatistics, FieldStatistics, MetadataRecord, Metadata
 
 
 @pytest.mark.parametrize('scenario, expected_result', [
@@ -22,21 +25,130 @@ def test_crawling_mixed_fields(scenario, expected_result):
     assert sorted(list(crawl(scenario))) == sorted(expected_result)
 
 
-def test_type_inconsistency():
-    scenario = [MetadataRecord('wrong_field', 20), MetadataRecord('wrong_field', 'abc')]
+@pytest.mark.parametrize('values, expected_type', [
+    ([20, 'abc'], 'S'),
+    ([True, 20], 'I'),
+    ([True, 1.5, None], 'F'),
+    ([20, Decimal('1.25'), 1.5], 'N'),
+    ([date(2026, 1, 2), datetime(2026, 1, 2, 3, 4)], 'T'),
+    ([date(2026, 1, 2), 20], 'S'),
+    ([False, datetime(2026, 1, 2, 3, 4)], 'S'),
+])
+def test_type_widening(values, expected_type):
+    scenario = [MetadataRecord('field', value) for value in values]
+    assert list(crawl(scenario)) == [Metadata('field', expected_type, len(values), values.count(None))]
+
+
+def test_invalid_type():
+    scenario = [MetadataRecord('wrong_field', [1, 2, 3])]
 
     with pytest.raises(CrawlingError) as exc:
         list(crawl(scenario))
 
     info = exc.value
-    assert info.args[0] == "The type of field 'wrong_field' is not consistent"
+    assert info.args[0] == "The type of field 'wrong_field' is unknown"
 
 
-def test_invalid_type():
-    scenario = [MetadataRecord('wrong_field', [1, 2, 3])]
+@pytest.mark.parametrize('scenario, expected_result', [
+    ([], []),
+    ([ColumnStatistics('field', 1, 0, (int,))], [Metadata('field', 'I', 1, 0)]),
+    ([ColumnStatistics('field', 15, 5, (str,))], [Metadata('field', 'S', 15, 5)]),
+    ([ColumnStatistics('field', 3, 3, ())], [Metadata('field', None, 3, 3)]),
+    ([ColumnStatistics('f1', 15, 0, (int,)), ColumnStatistics('f2', 10, 5, (str,))],
+     [Metadata('f1', 'I', 15, 0), Metadata('f2', 'S', 10, 5)]),
+    ([ColumnStatistics('field', 10, 2, (int,)), ColumnStatistics('field', 5, 5, ())],
+     [Metadata('field', 'I', 15, 7)]),
+])
+def test_crawling_statistics(scenario, expected_result):
+    assert sorted(list(crawl_statistics(scenario))) == sorted(expected_result)
+
+
+def test_statistics_type_widening():
+    scenario = [ColumnStatistics('field', 2, 0, (int, float)), ColumnStatistics('field', 2, 1, (bool,))]
+    assert list(crawl_statistics(scenario)) == [Metadata('field', 'F', 4, 1)]
+
+
+def test_merging_metadata():
+    partials = [
+        [Metadata('f1', 'I', 10, 2), Metadata('f2', None, 3, 3)],
+        [Metadata('f2', 'S', 5, 1), Metadata('f3', None, 1, 1)],
+        [Metadata('f1', None, 4, 4), Metadata('f2', 'S', 1, 0)],
+    ]
+    assert list(merge_metadata(partials)) == [
+        Metadata('f1', 'I', 14, 6),
+        Metadata('f2', 'S', 9, 4),
+        Metadata('f3', None, 1, 1),
+    ]
+
+
+def test_merging_type_widening():
+    partials = [[Metadata('field', 'I', 1, 0)], [Metadata('field', None, 1, 1)], [Metadata('field', 'S', 1, 0)]]
+    assert list(merge_metadata(partials)) == [Metadata('field', 'S', 3, 1)]
+
 
+def test_merging_unknown_type():
     with pytest.raises(CrawlingError) as exc:
-        list(crawl(scenario))
+        list(merge_metadata([[Metadata('wrong_field', 'X', 1, 0)]]))
 
     info = exc.value
     assert info.args[0] == "The type of field 'wrong_field' is unknown"
+
+
+def test_crawling_with_statistics():
+    scenario = [MetadataRecord('f1', 1), MetadataRecord('f2', None), MetadataRecord('f1', 3),
+                MetadataRecord('f2', 'abc'), MetadataRecord('f1', None), MetadataRecord('f3', None)]
+
+    assert list(crawl(scenario)) == [Metadata('f1', 'I', 3, 1), Metadata('f2', 'S', 2, 1), Metadata('f3', None, 1, 1)]
+    assert list(crawl(scenario, profile=True)) == [
+        Metadata('f1', 'I', 3, 1, statistics=FieldStatistics(1, 3, 2.0, 1.0, 2, None, ((1, 1), (3, 1)))),
+        Metadata('f2', 'S', 2, 1, statistics=FieldStatistics(None, None, None, None, 1, ((4, 1),), (('abc', 1),))),
+        Metadata('f3', None, 1, 1),
+    ]
+
+
+def _wide_records(fields, rows):
+    # every row has a few fields of its own, and a few fields shared with the rest
+    for row in range(rows):
+        for idx in range(row, row + fields):
+            yield MetadataRecord(f'f{idx}', None if (row + idx) % 3 == 0 else idx)
+
+
+@pytest.mark.parametrize('spill_threshold', [1, 2, 7, 50])
+def test_crawling_with_spills(spill_threshold):
+    records = list(_wide_records(10, 40))
+    expected = list(crawl(records, spill_threshold=0))
+
+    assert len(expected) == 49
+    assert list(crawl(records, spill_threshold=spill_threshold)) == expected
+    assert list(crawl(records, profile=True, spill_threshold=spill_threshold)) == list(crawl(records, profile=True))
+
+
+def test_crawling_statistics_and_merging_with_spills():
+    statistics = [ColumnStatistics(f'f{idx % 13}', idx, idx % 4, (int,) if idx % 5 else ()) for idx in range(100)]
+    partials = [list(crawl_statistics(statistics[idx:idx + 10])) for idx in range(0, 100, 10)]
+
+    expected = list(crawl_statistics(statistics, spill_threshold=0))
+    assert list(crawl_statistics(statistics, spill_threshold=3)) == expected
+    assert list(merge_metadata(partials, spill_threshold=3)) == expected
+
+
+def test_type_widening_among_spills():
+    scenario = [MetadataRecord('f1', 1), MetadataRecord('field', None), MetadataRecord('field', True),
+                MetadataRecord('f2', 'abc'), MetadataRecord('f3', 'abc'), MetadataRecord('field', 20),
+                MetadataRecord('f4', None), MetadataRecord('f5', None), MetadataRecord('field', 1.5)]
+
+    assert list(crawl(scenario, spill_threshold=2)) == list(crawl(scenario, spill_threshold=0))
+    assert list(crawl(scenario, spill_threshold=2))[1] == Metadata('field', 'F', 4, 1)
+
+
+def test_spill_threshold(monkeypatch):
+    monkeypatch.delenv(SPILL_THRESHOLD_ENV_VAR, raising=False)
+    assert get_spill_threshold() == 1000000
+    assert get_spill_threshold(0) is None
+
+    monkeypatch.setenv(SPILL_THRESHOLD_ENV_VAR, '10')
+    assert get_spill_threshold() == 10
+    assert get_spill_threshold(5) == 5
+
+    with pytest.raises(ValueError):
+        get_spill_threshold(-1)
@@ -0,0 +1,112 @@
+import socket
+import threading
+
+import pytest
+
+from client import DaemonError, remote_crawl, remote_describe, send_request
+from common import Metadata
+from daemon import CrawlDaemon
+
+from tests.utils import write_csv
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    with CrawlDaemon(str(tmp_path / 'metadata.db'), workers=1) as daemon:
+        thread = threading.Thread(target=daemon.serve_forever)
+        thread.start()
+        try:
+            yield daemon
+        finally:
+            daemon.shutdown()
+            thread.join()
+
+
+def test_crawl_and_describe(daemon, temp_csv_file):
+    write_csv(temp_csv_file, ['field'], [{'field': 10}, {'field': 'null'}])
+
+    assert remote_crawl(daemon.socket_path, temp_csv_file.name, daemon.db_path) is True
+    assert remote_crawl(daemon.socket_path, temp_csv_file.name, daemon.db_path) is False
+    assert remote_describe(daemon.socket_path, temp_csv_file.name, daemon.db_path) == [Metadata('field', 'I', 2, 1)]
+    assert remote_describe(daemon.socket_path, 'unknown.csv', daemon.db_path) == []
+
+
+def test_small_files_are_parsed_by_the_pool(daemon, temp_csv_file, monkeypatch):
+    write_csv(temp_csv_file, ['field'], [{'field': 10}])
+    submitted = []
+    submit = daemon._executor.submit
+    monkeypatch.setattr(daemon._executor, 'submit', lambda fn, *args: submitted.append(args[0]) or submit(fn, *args))
+
+    assert remote_crawl(daemon.socket_path, temp_csv_file.name, daemon.db_path) is True
+    assert submitted == [temp_csv_file.name]
+    assert remote_describe(daemon.socket_path, temp_csv_file.name, daemon.db_path) == [Metadata('field', 'I', 1, 0)]
+
+
+def test_concurrent_crawls(daemon, tmp_path):
+    paths = []
+    for idx in range(8):
+        paths.append(str(tmp_path / f'{idx}.csv'))
+        with open(paths[-1], 'w') as csv_file:
+            write_csv(csv_file, ['field'], [{'field': idx}] * (idx + 1))
+
+    results = []
+
+    def crawl(path):
+        results.append((path, remote_crawl(daemon.socket_path, path, daemon.db_path)))
+
+    # every file is requested twice at once: it must be crawled only once
+    threads = [threading.Thread(target=crawl, args=(path,)) for path in paths + paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == sorted([(path, False) for path in paths] + [(path, True) for path in paths])
+    for idx, path in enumerate(paths):
+        assert remote_describe(daemon.socket_path, path, daemon.db_path) == [Metadata('field', 'I', idx + 1, 0)]
+
+
+def test_errors_are_reported(daemon, temp_csv_file):
+    write_csv(temp_csv_file, ['field'], [{'field': 'abc'}])
+
+    with pytest.raises(DaemonError) as e:
+        remote_crawl(daemon.socket_path, temp_csv_file.name, daemon.db_path)
+    assert str(e.value) == "Unknown type for value 'abc' (column 'field') at line 2"
+
+
+def test_requests_for_another_database(daemon, temp_csv_file):
+    with pytest.raises(DaemonError):
+        remote_crawl(daemon.socket_path, temp_csv_file.name, 'other.db')
+
+
+def test_invalid_requests(daemon):
+    with pytest.raises(DaemonError) as e:
+        send_request(daemon.socket_path, {'command': 'unknown'})
+    assert str(e.value) == "Unknown command 'unknown'"
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(daemon.socket_path)
+    sock.sendall(b'not json\n')
+    assert b'"status": "error"' in sock.recv(1024)
+    sock.close()
+
+
+def test_no_daemon_running(tmp_path):
+    socket_path = str(tmp_path / 'metadata.db.sock')
+    assert remote_crawl(socket_path, 'file.csv', 'metadata.db') is None
+    assert remote_describe(socket_path, 'file.csv', 'metadata.db') is None
+
+
+def test_only_one_daemon_per_socket(daemon):
+    with pytest.raises(DaemonError):
+        CrawlDaemon(daemon.db_path, workers=1)
+
+
+def test_stale_socket_is_replaced(tmp_path):
+    socket_path = str(tmp_path / 'metadata.db.sock')
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+
+    with CrawlDaemon(str(tmp_path / 'metadata.db'), socket_path, workers=1) as daemon:
+        assert daemon.socket_path == socket_path
@@ -0,0 +1,79 @@
+from datetime import date, datetime
+from decimal import Decimal
+import random
+import statistics
+
+from common import FieldStatistics
+from field_statistics import FieldProfiler
+
+
+def _profile(values):
+    profiler = FieldProfiler()
+    for value in values:
+        profiler.update(value)
+    return profiler.statistics()
+
+
+def test_integer_statistics():
+    values = [3, 1, 4, 1, 5, 9, 2, 6]
+    result = _profile(values)
+
+    assert (result.minimum, result.maximum, result.distinct, result.lengths) == (1, 9, 7, None)
+    assert abs(result.mean - statistics.mean(values)) < 1e-9
+    assert abs(result.variance - statistics.pvariance(values)) < 1e-9
+    assert result.top_values[0] == (1, 2)
+
+
+def test_string_statistics():
+    result = _profile(['', 'a', 'ab', 'abc', 'abcd', 'abcde', 'abc'])
+
+    assert result == FieldStatistics(None, None, None, None, 6, ((0, 1), (1, 1), (2, 1), (4, 3), (8, 1)),
+                                     (('abc', 2), ('', 1), ('a', 1), ('ab', 1), ('abcd', 1), ('abcde', 1)))
+
+
+def test_float_and_decimal_statistics():
+    result = _profile([1.5, Decimal('2.5'), True, 3])
+
+    assert (result.minimum, result.maximum, result.mean, result.variance, result.lengths) == (1, 3, 2.0, 0.625, None)
+    assert result.distinct == 4
+    assert result.top_values == ((1.5, 1), (2.5, 1), (True, 1), (3, 1))
+
+
+def test_date_and_timestamp_statistics():
+    result = _profile([date(2024, 1, 1), datetime(2024, 1, 1, 10, 0), date(2024, 1, 1)])
+
+    assert result == FieldStatistics(None, None, None, None, 2, None,
+                                     (('2024-01-01', 2), ('2024-01-01T10:00:00', 1)))
+
+
+def test_no_values():
+    assert FieldProfiler().statistics() is None
+
+
+def test_distinct_values_are_estimated_beyond_a_threshold():
+    for values in (range(100000), [f'value {idx}' for idx in range(50000)]):
+        distinct = _profile(values).distinct
+        assert abs(distinct - len(values)) / len(values) < 0.05
+
+
+def test_frequent_values_with_bounded_counters():
+    rng = random.Random(0)
+    # a few frequent values hidden among many unique ones
+    values = [f'unique {idx}' for idx in range(20000)] + ['often'] * 3000 + ['sometimes'] * 1000
+    rng.shuffle(values)
+
+    top_values = _profile(values).top_values
+
+    assert [value for value, _ in top_values[:2]] == ['often', 'sometimes']
+    # counts are overestimated by at most the amount of values over the amount of counters
+    assert 3000 <= top_values[0][1] <= 3000 + len(values) // 64
+
+
+def test_frequent_values_first_seen_after_the_counters_are_full():
+    # the frequent value first appears once every counter holds a unique value
+    values = ['often' if idx % 70 == 69 else f'unique {idx}' for idx in range(200000)]
+
+    top_values = _profile(values).top_values
+
+    assert top_values[0][0] == 'often'
+    assert 200000 // 70 <= top_values[0][1] <= 200000 // 70 + len(values) // 64
@@ -0,0 +1,79 @@
+import os
+
+from common import FileFingerprint
+from fingerprint import content_hash, ends_with_line_break, fingerprint_if_changed, is_appended
+
+
+def test_fingerprint_of_new_file(temp_csv_file):
+    temp_csv_file.write('field\n1\n')
+    stat = os.stat(temp_csv_file.name)
+    assert fingerprint_if_changed(temp_csv_file.name, None) == FileFingerprint(stat.st_size, stat.st_mtime_ns, None)
+
+
+def test_unchanged_file(temp_csv_file):
+    temp_csv_file.write('field\n1\n')
+    fingerprint = fingerprint_if_changed(temp_csv_file.name, None)
+    assert fingerprint_if_changed(temp_csv_file.name, fingerprint) is None
+
+
+def test_changed_file(temp_csv_file):
+    temp_csv_file.write('field\n1\n')
+    fingerprint = fingerprint_if_changed(temp_csv_file.name, None)
+    temp_csv_file.write('2\n')
+    assert fingerprint_if_changed(temp_csv_file.name, fingerprint).size == fingerprint.size + 2
+
+
+def test_touched_file_with_hash(temp_csv_file):
+    temp_csv_file.write('field\n1\n')
+    fingerprint = fingerprint_if_changed(temp_csv_file.name, None, with_hash=True)
+    assert fingerprint.content_hash == content_hash(temp_csv_file.name)
+
+    os.utime(temp_csv_file.name, ns=(0, fingerprint.mtime + 10 ** 9))
+    assert fingerprint_if_changed(temp_csv_file.name, fingerprint, with_hash=True) is None
+    assert fingerprint_if_changed(temp_csv_file.name, fingerprint, with_hash=False) is not None
+
+
+def test_same_size_different_content_with_hash(temp_csv_file):
+    temp_csv_file.write('field\n1\n')
+    fingerprint = fingerprint_if_changed(temp_csv_file.name, None, with_hash=True)
+
+    temp_csv_file.seek(0)
+    temp_csv_file.write('field\n2\n')
+    temp_csv_file.flush()
+    os.utime(temp_csv_file.name, ns=(0, fingerprint.mtime + 10 ** 9))
+
+    assert fingerprint_if_changed(temp_csv_file.name, fingerprint, with_hash=True) is not None
+
+
+def test_appended_file(temp_csv_file):
+    temp_csv_file.write('field\n1\n')
+    temp_csv_file.flush()
+    fingerprint = fingerprint_if_changed(temp_csv_file.name, None, with_hash=True)
+    temp_csv_file.write('2\n')
+    temp_csv_file.flush()
+
+    current = fingerprint_if_changed(temp_csv_file.name, fingerprint, with_hash=True)
+    assert is_appended(temp_csv_file.name, fingerprint, current, with_hash=True)
+    assert not is_appended(temp_csv_file.name, None, current)
+    assert not is_appended(temp_csv_file.name, current, fingerprint)
+
+
+def test_rewritten_file_is_not_appended_with_hash(temp_csv_file):
+    temp_csv_file.write('field\n1\n')
+    temp_csv_file.flush()
+    fingerprint = fingerprint_if_changed(temp_csv_file.name, None, with_hash=True)
+    temp_csv_file.seek(0)
+    temp_csv_file.write('field\n2\n3\n')
+    temp_csv_file.flush()
+
+    current = fingerprint_if_changed(temp_csv_file.name, fingerprint, with_hash=True)
+    assert not is_appended(temp_csv_file.name, fingerprint, current, with_hash=True)
+    assert is_appended(temp_csv_file.name, fingerprint, current, with_hash=False)
+
+
+def test_ends_with_line_break(temp_csv_file):
+    temp_csv_file.write('field\n1')
+    temp_csv_file.flush()
+    assert ends_with_line_break(temp_csv_file.name, 6)
+    assert not ends_with_line_break(temp_csv_file.name, 7)
+    assert not ends_with_line_break(temp_csv_file.name, 0)
@@ -0,0 +1,159 @@
+import json
+import os
+import time
+
+import pytest
+
+from instrumentation import (FileMeasurement, Instrumentation, StageMeasurement, STAGES, count_values, measure_file,
+                             stage, timed)
+from tasks import crawl_and_store, crawl_batch
+
+from tests.utils import write_csv
+
+
+def _stages(measurement):
+    return {s.name: s for s in measurement.stages}
+
+
+def _slow(elements, seconds):
+    for element in elements:
+        time.sleep(seconds)
+        yield element
+
+
+def test_stages_are_exclusive():
+    with measure_file('file.csv') as measurement:
+        with stage('aggregate'):
+            time.sleep(0.02)
+            with stage('store'):
+                time.sleep(0.05)
+            time.sleep(0.02)
+
+    stages = _stages(measurement.result)
+    assert list(stages) == STAGES
+    assert 0.04 <= stages['aggregate'].wall < 0.09
+    assert 0.05 <= stages['store'].wall < 0.09
+    assert stages['store'].cpu < 0.05
+
+
+def test_timed_charges_iteration_to_the_stage():
+    with measure_file('file.csv') as measurement:
+        with stage('aggregate'):
+            assert list(timed(_slow(range(3), 0.02), 'extract')) == [0, 1, 2]
+        count_values(3)
+
+    stages = _stages(measurement.result)
+    assert stages['extract'].wall >= 0.06
+    assert stages['aggregate'].wall < 0.03
+    assert measurement.result.values == 3
+
+
+def test_nothing_is_measured_outside_files():
+    elements = [1, 2]
+    assert timed(elements, 'extract') is elements
+    with stage('extract'):
+        count_values(2)
+
+
+def test_measurements_add_to_previous_ones():
+    previous = FileMeasurement('file.csv', [StageMeasurement('extract', 1.0, 0.5)], 10, 4, 1024)
+    with measure_file('file.csv', previous) as measurement:
+        count_values(2)
+
+    assert _stages(measurement.result)['extract'] == StageMeasurement('extract', 1.0, 0.5)
+    assert measurement.result.values == 6
+
+
+def test_crawl_and_store_is_measured(temp_csv_file, temp_db_file):
+    write_csv(temp_csv_file, ['a', 'b'], [{'a': 1, 'b': 'null'}, {'a': 2, 'b': 3}])
+    instrumentation = Instrumentation()
+
+    assert crawl_and_store(temp_csv_file.name, temp_db_file.name, workers=1, instrumentation=instrumentation)
+
+    [measurement] = instrumentation.files
+    assert measurement.path == temp_csv_file.name
+    assert measurement.values == 4
+    assert measurement.peak_rss_growth_kb >= 0
+    assert measurement.bytes_read is None or measurement.bytes_read >= os.path.getsize(temp_csv_file.name)
+    stages = _stages(measurement)
+    for name in ('fingerprint', 'extract', 'aggregate', 'store'):
+        assert stages[name].wall > 0
+
+
+@pytest.mark.skipif(not os.access('/proc/self/clear_refs', os.W_OK), reason='the peak RSS can not be reset')
+def test_peak_rss_growth_is_per_file():
+    # a peak reached before measuring the file is not accounted to it
+    memory = bytearray(64 * 2 ** 20)
+    del memory
+    with measure_file('/data/small.csv') as small:
+        pass
+    with measure_file('/data/big.csv') as big:
+        memory = bytearray(64 * 2 ** 20)
+        del memory
+
+    assert small.result.peak_rss_growth_kb < 16 * 1024
+    assert big.result.peak_rss_growth_kb >= 60 * 1024
+
+
+def test_crawl_batch_is_measured(tmp_path, temp_db_file):
+    paths = []
+    for name in ('one.csv', 'two.csv'):
+        paths.append(str(tmp_path / name))
+        with open(paths[-1], 'w') as csv_file:
+            write_csv(csv_file, ['field'], [{'field': 1}])
+    invalid = str(tmp_path / 'invalid.json')
+    with open(invalid, 'w') as json_file:
+        json_file.write('{"not": "an array"}')
+
+    instrumentation = Instrumentation()
+    summary = crawl_batch(paths + [invalid], temp_db_file.name, workers=2, instrumentation=instrumentation)
+
+    assert [f.path for f in summary.failures] == [invalid]
+    assert sorted(m.path for m in instrumentation.files) == paths
+    for measurement in instrumentation.files:
+        assert measurement.values == 1
+        stages = _stages(measurement)
+        # extraction happens in the workers, storing in the calling process
+        assert stages['extract'].wall > 0 and stages['store'].wall > 0
+
+
+def _instrumentation():
+    instrumentation = Instrumentation()
+    instrumentation.add(FileMeasurement('/data/a "quoted".csv', [StageMeasurement('extract', 0.5, 0.25),
+                                                                 StageMeasurement('store', 0.5, 0.5)],
+                                        2048, 100, 2048))
+    instrumentation.add(FileMeasurement('/data/b.csv', [StageMeasurement('extract', 1.0, 1.0)], None, 50, 4096))
+    return instrumentation
+
+
+def test_json_export():
+    document = json.loads(_instrumentation().to_json())
+
+    assert {'name': 'extract', 'wall': 1.5, 'cpu': 1.25} in document['stages']
+    assert document['files'][1] == {
+        'path': '/data/b.csv',
+        'stages': [{'name': 'extract', 'wall': 1.0, 'cpu': 1.0}],
+        'bytes_read': None,
+        'values': 50,
+        'peak_rss_growth_kb': 4096,
+    }
+
+
+def test_prometheus_export():
+    lines = _instrumentation().to_prometheus().splitlines()
+
+    assert '# TYPE metadata_gather_stage_wall_seconds counter' in lines
+    assert 'metadata_gather_stage_wall_seconds{path="/data/a \\"quoted\\".csv",stage="store"} 0.5' in lines
+    assert [line for line in lines if line.startswith('metadata_gather_bytes_read{')] == [
+        'metadata_gather_bytes_read{path="/data/a \\"quoted\\".csv"} 2048',
+    ]
+    assert 'metadata_gather_peak_rss_growth_bytes{path="/data/b.csv"} 4194304' in lines
+
+
+def test_summary():
+    lines = _instrumentation().summary().split('\n')
+
+    assert lines[:3] == ['Stage totals:', '\tfingerprint: wall 0.000s, cpu 0.000s',
+                         '\textract: wall 1.500s, cpu 1.250s']
+    assert lines[-2:] == ['\t/data/b.csv: wall 1.000s, read unknown, 50 values (50/s), peak RSS growth 4.0 MiB',
+                          '\t\textract 1.000s']
@@ -0,0 +1,70 @@
+import os
+
+from common import Metadata
+from pipeline import crawl_pipeline
+from storage_manager import open_storage
+from tasks import collect_paths
+
+from tests.utils import write_csv
+
+
+def _write_files(directory, count):
+    for idx in range(count):
+        with open(os.path.join(directory, f'{idx}.csv'), 'w') as csv_file:
+            write_csv(csv_file, ['field'], [{'field': idx}] * (idx + 1))
+
+
+def test_crawl_pipeline(tmp_path, temp_db_file):
+    _write_files(str(tmp_path), 20)
+    paths = collect_paths([str(tmp_path)])
+
+    summary = crawl_pipeline(paths, temp_db_file.name, workers=2, read_threads=2, queue_size=2)
+
+    assert sorted(summary.crawled) == sorted(paths)
+    assert summary.skipped == []
+    assert summary.failures == []
+    s = open_storage(temp_db_file.name)
+    for idx in range(20):
+        assert list(s.retrieve_metadata(str(tmp_path / f'{idx}.csv'))) == [Metadata('field', 'I', idx + 1, 0)]
+
+
+def test_crawl_pipeline_statistics(tmp_path, temp_db_file):
+    _write_files(str(tmp_path), 20)
+
+    summary = crawl_pipeline(collect_paths([str(tmp_path)]), temp_db_file.name, workers=1, queue_size=3)
+
+    assert [stage.name for stage in summary.stages] == ['read', 'parse', 'store']
+    assert [stage.items for stage in summary.stages] == [20, 20, 20]
+    for stage in summary.stages:
+        assert 0 <= stage.mean_depth <= stage.max_depth <= 3
+
+
+def test_crawl_pipeline_skips_and_replaces(tmp_path, temp_db_file):
+    _write_files(str(tmp_path), 3)
+    paths = collect_paths([str(tmp_path)])
+    crawl_pipeline(paths, temp_db_file.name, workers=1)
+
+    changed_path = str(tmp_path / '0.csv')
+    with open(changed_path, 'w') as csv_file:
+        write_csv(csv_file, ['other_field'], [{'other_field': '"abc"'}])
+
+    summary = crawl_pipeline(paths, temp_db_file.name, workers=1)
+
+    assert summary.crawled == [changed_path]
+    assert sorted(summary.skipped) == sorted(paths[1:])
+    assert list(open_storage(temp_db_file.name).retrieve_metadata(changed_path)) == [
+        Metadata('other_field', 'S', 1, 0)]
+
+
+def test_crawl_pipeline_reports_failures(tmp_path, temp_db_file):
+    _write_files(str(tmp_path), 2)
+    wrong_path = str(tmp_path / 'wrong.json')
+    with open(wrong_path, 'w') as json_file:
+        json_file.write('[{"field": 1}, {"field": ]')
+    missing_path = str(tmp_path / 'missing.csv')
+
+    summary = crawl_pipeline(collect_paths([str(tmp_path)]) + [missing_path], temp_db_file.name, workers=2)
+
+    assert len(summary.crawled) == 2
+    assert sorted(summary.failures) == [(missing_path, 'Unexpected error occurred.'),
+                                        (wrong_path, f"The file '{wrong_path}' is not a valid JSON file")]
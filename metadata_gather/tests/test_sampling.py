@@ -0,0 +1,93 @@
+import random
+
+from common import Metadata, SampleSize
+from sampling import sample_file
+from storage_manager import open_storage
+from tasks import crawl_and_store, crawl_file
+
+from tests.utils import write_csv, write_json, write_jsonl
+
+
+def _write_rows(csv_file, rows, seed=0):
+    rng = random.Random(seed)
+    write_csv(csv_file, ['id', 'value'], [{'id': idx, 'value': 'null' if rng.random() < 0.2 else '"abc"'}
+                                          for idx in range(rows)])
+
+
+def _assert_within_margins(approximate, exact):
+    assert [(m.field, m.type) for m in approximate] == [(m.field, 'S') for m in exact]
+    for estimated, actual in zip(approximate, exact):
+        assert estimated.total_margin is not None and estimated.null_margin is not None
+        assert abs(estimated.total_occurrences - actual.total_occurrences) <= estimated.total_margin
+        assert abs(estimated.null_occurrences - actual.null_occurrences) <= estimated.null_margin
+
+
+def test_sample_csv_fraction(temp_csv_file):
+    _write_rows(temp_csv_file, 20000)
+
+    approximate = sample_file(temp_csv_file.name, SampleSize(0.1, None), block_size=1024, seed=0)
+
+    _assert_within_margins(approximate, list(crawl_file(temp_csv_file.name)))
+
+
+def test_sample_rows(temp_jsonl_file):
+    rng = random.Random(0)
+    write_jsonl(temp_jsonl_file, [{'id': idx, 'sparse': None if rng.random() < 0.5 else 'abc'}
+                                  if idx % 3 else {'id': idx} for idx in range(20000)])
+
+    approximate = sample_file(temp_jsonl_file.name, SampleSize(None, 2000), block_size=1024, seed=0)
+
+    _assert_within_margins(approximate, list(crawl_file(temp_jsonl_file.name)))
+
+
+def test_samples_are_reproducible(temp_csv_file):
+    _write_rows(temp_csv_file, 20000)
+
+    assert (sample_file(temp_csv_file.name, SampleSize(0.05, None), block_size=1024) ==
+            sample_file(temp_csv_file.name, SampleSize(0.05, None), block_size=1024))
+    assert (sample_file(temp_csv_file.name, SampleSize(0.05, None), block_size=1024, seed=1) !=
+            sample_file(temp_csv_file.name, SampleSize(0.05, None), block_size=1024, seed=2))
+
+
+def test_small_files_are_not_sampled(temp_csv_file):
+    _write_rows(temp_csv_file, 100)
+
+    assert sample_file(temp_csv_file.name, SampleSize(0.1, None)) is None
+    assert sample_file(temp_csv_file.name, SampleSize(0.6, None), block_size=64) is None
+    assert sample_file(temp_csv_file.name, SampleSize(None, 1000), block_size=64) is None
+
+
+def test_unsplittable_files_are_not_sampled(temp_json_file):
+    write_json(temp_json_file, [{'field': idx} for idx in range(20000)])
+
+    assert sample_file(temp_json_file.name, SampleSize(0.1, None), block_size=1024) is None
+
+
+def test_sampled_types_are_widened(temp_csv_file):
+    write_csv(temp_csv_file, ['value'], [{'value': 'null'}] * 20000)
+
+    _assert_within_margins(sample_file(temp_csv_file.name, SampleSize(0.1, None), block_size=1024, seed=0),
+                           [Metadata('value', None, 20000, 20000)])
+
+    # a late string in an integer column is unlikely to be sampled, but it's accounted for
+    temp_csv_file.seek(0)
+    temp_csv_file.truncate()
+    write_csv(temp_csv_file, ['value'], [{'value': idx} for idx in range(20000)] + [{'value': '"abc"'}])
+    temp_csv_file.flush()
+    assert list(crawl_file(temp_csv_file.name))[0].type == 'S'
+    assert [m.type for m in sample_file(temp_csv_file.name, SampleSize(0.1, None), block_size=1024, seed=0)] == ['S']
+
+
+def test_approximate_metadata_is_crawled_again(temp_csv_file, temp_db_file, monkeypatch):
+    _write_rows(temp_csv_file, 20000)
+    monkeypatch.setattr(sample_file, '__defaults__', (1024, None))
+
+    assert crawl_and_store(temp_csv_file.name, temp_db_file.name, sample=SampleSize(0.1, None)) is True
+    with open_storage(temp_db_file.name) as s:
+        assert all(m.total_margin is not None for m in s.retrieve_metadata(temp_csv_file.name))
+        assert s.retrieve_fingerprint(temp_csv_file.name) is None
+
+    assert crawl_and_store(temp_csv_file.name, temp_db_file.name) is True
+    with open_storage(temp_db_file.name) as s:
+        assert list(s.retrieve_metadata(temp_csv_file.name)) == list(crawl_file(temp_csv_file.name))
+    assert crawl_and_store(temp_csv_file.name, temp_db_file.name) is False
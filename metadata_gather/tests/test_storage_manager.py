@@ -1,10 +1,13 @@
 import os
+import sqlite3
 from stat import S_IREAD, S_IRGRP, S_IROTH
 
 import pytest
 
-from storage_manager import MetadataStorageManager, StoringException
-from common import Metadata
+import storage_manager
+from storage_manager import (_MIGRATIONS, BACKEND_ENV_VAR, MetadataStorageManager, StorageBackend, StoringException,
+                             get_storage_backend, open_storage, storage_backends)
+from common import FieldStatistics, FieldTypes, FileFingerprint, FileMetadata, Metadata
 
 
 def test_successfully_storing_one_metadata(temp_db_file):
@@ -66,3 +69,362 @@ def test_non_writable_db_file(temp_db_file):
 
     info = exc.value
     assert info.args[0] == "Could not create db schema. Is it a readable path?"
+
+
+def test_batched_metadata_is_committed_on_close(temp_db_file):
+    m = Metadata('field', 'I', 10, 0)
+    with MetadataStorageManager(temp_db_file.name, batch_size=3) as s:
+        s.store_metadata("abc", [m])
+        s.store_metadata("def", [m])
+        assert [] == list(MetadataStorageManager(temp_db_file.name).retrieve_metadata("abc"))
+        s.store_metadata("ghi", [m])
+        assert [m] == list(MetadataStorageManager(temp_db_file.name).retrieve_metadata("abc"))
+        s.store_metadata("jkl", [m])
+
+    assert [m] == list(MetadataStorageManager(temp_db_file.name).retrieve_metadata("jkl"))
+
+
+def test_failed_storing_keeps_the_batch(temp_db_file):
+    m = Metadata('field', 'I', 10, 0)
+    with MetadataStorageManager(temp_db_file.name, batch_size=10) as s:
+        s.store_metadata("abc", [m])
+        with pytest.raises(StoringException):
+            s.store_metadata("def", [m, Metadata('field', 'I', 0, 0)])
+
+    s = MetadataStorageManager(temp_db_file.name)
+    assert [m] == list(s.retrieve_metadata("abc"))
+    assert [] == list(s.retrieve_metadata("def"))
+
+
+def test_failed_metadata_computation_is_not_stored(temp_db_file):
+    def metadata():
+        yield Metadata('field', 'I', 10, 0)
+        raise ValueError
+
+    s = MetadataStorageManager(temp_db_file.name)
+    with pytest.raises(ValueError):
+        s.store_metadata("abc", metadata())
+
+    assert [] == list(s.retrieve_metadata("abc"))
+
+
+def test_connection_pragmas(temp_db_file):
+    s = MetadataStorageManager(temp_db_file.name, journal_mode='wal', synchronous='off', cache_size=-4096)
+    assert s._connection().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert s._connection().execute('PRAGMA synchronous').fetchone()[0] == 0
+    assert s._connection().execute('PRAGMA cache_size').fetchone()[0] == -4096
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'batch_size': 0},
+    {'journal_mode': 'wal; drop table metadata'},
+    {'synchronous': 'sometimes'},
+])
+def test_invalid_settings(temp_db_file, kwargs):
+    with pytest.raises(ValueError):
+        MetadataStorageManager(temp_db_file.name, **kwargs)
+
+
+def test_migrating_legacy_db(temp_db_file):
+    with sqlite3.connect(temp_db_file.name) as con:
+        con.execute(
+            """
+            CREATE TABLE metadata (
+                id INTEGER PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                field_name TEXT NOT NULL,
+                field_type TEXT CHECK( field_type IN ('I','S') ),
+                total_occurrences INTEGER CHECK( total_occurrences > 0 ) NOT NULL,
+                null_occurrences INTEGER CHECK( null_occurrences >= 0 ) NOT NULL,
+                CHECK ( total_occurrences >= null_occurrences )
+            );"""
+        )
+        con.executemany("insert into "
+                        "metadata(file_id, field_name, field_type, total_occurrences, null_occurrences) "
+                        "values (?, ?, ?, ?, ?)",
+                        [('abc', 'field_1', 'I', 10, 0), ('def', 'field_1', 'S', 5, 5), ('abc', 'field_2', None, 3, 3)])
+    con.close()
+
+    s = MetadataStorageManager(temp_db_file.name)
+    assert list(s.retrieve_metadata('abc')) == [Metadata('field_1', 'I', 10, 0), Metadata('field_2', None, 3, 3)]
+    assert list(s.retrieve_metadata('def')) == [Metadata('field_1', 'S', 5, 5)]
+
+    s.store_metadata('ghi', [Metadata('field_1', 'I', 1, 0)])
+    assert list(s.retrieve_metadata('ghi')) == [Metadata('field_1', 'I', 1, 0)]
+    paths = [row['path'] for row in s._connection().execute('select path from files order by id')]
+    assert paths == ['abc', 'def', 'ghi']
+
+
+def test_migrating_to_extended_types_keeps_metadata(temp_db_file):
+    with sqlite3.connect(temp_db_file.name, isolation_level=None) as con:
+        # the schema before the extended types
+        for migration in _MIGRATIONS[:7]:
+            migration(con)
+        con.execute('PRAGMA user_version=7')
+        con.execute("insert into files(path) values ('abc')")
+        con.execute("insert into metadata(file_id, field_name, field_type, total_occurrences, null_occurrences, "
+                    "total_margin, null_margin) values (1, 'field_1', 'I', 10, 2, 1, 1), (1, 'field_2', 'S', 5, 0, "
+                    "null, null)")
+        con.execute("insert into field_statistics(metadata_id, minimum, maximum, mean, variance, distinct_count, "
+                    "lengths, top_values) values (1, 1, 9, 4.5, 2.25, 5, null, '[[3, 4], [1, 2]]')")
+    con.close()
+
+    s = MetadataStorageManager(temp_db_file.name)
+    assert s._connection().execute('PRAGMA user_version').fetchone()[0] == len(_MIGRATIONS)
+    assert list(s.retrieve_metadata('abc')) == [
+        Metadata('field_1', 'I', 10, 2, 1, 1, FieldStatistics(1, 9, 4.5, 2.25, 5, None, ((3, 4), (1, 2)))),
+        Metadata('field_2', 'S', 5, 0),
+    ]
+    assert s._connection().execute('PRAGMA foreign_key_check').fetchall() == []
+
+    # statistics still cascade with their metadata
+    s.store_metadata('abc', [Metadata('field_1', 'F', 3, 0)])
+    assert list(s.retrieve_metadata('abc')) == [Metadata('field_1', 'F', 3, 0)]
+    assert s._connection().execute('select count(*) from field_statistics').fetchone()[0] == 0
+
+
+@pytest.mark.parametrize('field_type', ['B', 'I', 'F', 'N', 'D', 'T', 'S'])
+def test_storing_every_type(temp_db_file, field_type):
+    s = MetadataStorageManager(temp_db_file.name)
+    s.store_metadata('abc', [Metadata('field_1', field_type, 10, 0)])
+    assert list(s.retrieve_metadata('abc')) == [Metadata('field_1', field_type, 10, 0)]
+
+
+def test_storing_unknown_type_fails(temp_db_file):
+    s = MetadataStorageManager(temp_db_file.name)
+    with pytest.raises(StoringException):
+        s.store_metadata('abc', [Metadata('field_1', 'X', 10, 0)])
+
+
+def test_lookups_use_indexes(temp_db_file):
+    s = MetadataStorageManager(temp_db_file.name)
+    plan = s._connection().execute("explain query plan "
+                                   "select metadata.* from files join metadata on metadata.file_id = files.id "
+                                   "where files.path=?", ('abc',)).fetchall()
+    assert all('SCAN' not in row['detail'] for row in plan)
+
+
+def test_storing_replaces_previous_metadata(temp_db_file):
+    s = MetadataStorageManager(temp_db_file.name)
+    s.store_metadata("abc", [Metadata('field_1', 'I', 10, 0), Metadata('field_2', 'S', 10, 0)])
+    s.store_metadata("abc", [Metadata('field_3', 'S', 5, 1)])
+
+    assert [Metadata('field_3', 'S', 5, 1)] == list(s.retrieve_metadata("abc"))
+
+
+def test_failed_replacement_keeps_previous_metadata(temp_db_file):
+    s = MetadataStorageManager(temp_db_file.name)
+    m = Metadata('field_1', 'I', 10, 0)
+    s.store_metadata("abc", [m], FileFingerprint(10, 20, None))
+    with pytest.raises(StoringException):
+        s.store_metadata("abc", [Metadata('field_1', 'I', 0, 0)], FileFingerprint(30, 40, None))
+
+    assert [m] == list(s.retrieve_metadata("abc"))
+    assert FileFingerprint(10, 20, None) == s.retrieve_fingerprint("abc")
+
+
+def test_retrieving_fingerprints(temp_db_file):
+    s = MetadataStorageManager(temp_db_file.name)
+    s.store_metadata("abc", [Metadata('field_1', 'I', 10, 0)], FileFingerprint(10, 20, 'f00d'))
+    s.store_metadata("def", [Metadata('field_1', 'I', 10, 0)])
+
+    assert FileFingerprint(10, 20, 'f00d') == s.retrieve_fingerprint("abc")
+    assert s.retrieve_fingerprint("def") is None
+    assert s.retrieve_fingerprint("ghi") is None
+
+
+def test_retrieving_crawled_bytes(temp_db_file):
+    s = MetadataStorageManager(temp_db_file.name)
+    s.store_metadata("abc", [Metadata('field_1', 'I', 10, 0)], FileFingerprint(10, 20, None), crawled_bytes=10)
+    s.store_metadata("def", [Metadata('field_1', 'I', 10, 0)], FileFingerprint(10, 20, None))
+
+    assert 10 == s.retrieve_crawled_bytes("abc")
+    assert s.retrieve_crawled_bytes("def") is None
+    assert s.retrieve_crawled_bytes("ghi") is None
+
+    s.store_metadata("abc", [Metadata('field_1', 'I', 20, 0)], FileFingerprint(20, 30, None))
+    assert s.retrieve_crawled_bytes("abc") is None
+
+
+def test_retrieving_approximate_metadata(temp_db_file):
+    s = MetadataStorageManager(temp_db_file.name)
+    s.store_metadata("abc", [Metadata('field_1', 'I', 1000, 10, 50, 5), Metadata('field_2', 'S', 10, 0)])
+
+    assert list(s.retrieve_metadata("abc")) == [Metadata('field_1', 'I', 1000, 10, 50, 5),
+                                                Metadata('field_2', 'S', 10, 0, None, None)]
+
+
+def test_retrieving_field_statistics(temp_db_file):
+    s = MetadataStorageManager(temp_db_file.name)
+    metadata = [Metadata('field_1', 'I', 10, 2, statistics=FieldStatistics(1, 9, 4.5, 2.25, 5, None, ((3, 4), (1, 2)))),
+                Metadata('field_2', 'S', 10, 0,
+                         statistics=FieldStatistics(None, None, None, None, 1, ((4, 10),), (('abc', 10),))),
+                Metadata('field_3', None, 10, 10)]
+    s.store_metadata("abc", metadata)
+    assert list(s.retrieve_metadata("abc")) == metadata
+
+    s.store_metadata("abc", [Metadata('field_1', 'I', 10, 2)])
+    assert list(s.retrieve_metadata("abc")) == [Metadata('field_1', 'I', 10, 2)]
+    assert s._connection().execute("select count(*) from field_statistics").fetchone()[0] == 0
+
+
+def _store_catalog(s):
+    s.store_metadata('/data/2026/b.csv', [Metadata('id', 'I', 5, 0), Metadata('name', 'S', 5, 1)])
+    s.store_metadata('/data/2026/a.csv', [Metadata('id', 'S', 3, 0)])
+    s.store_metadata('/data/20261.csv', [Metadata('id', 'I', 2, 0), Metadata('other', None, 2, 2)])
+    s.store_metadata('/logs/c.jsonl', [Metadata('name', 'S', 1, 0), Metadata('other', 'I', 1, 0)])
+
+
+def test_querying_files(temp_db_file):
+    s = MetadataStorageManager(temp_db_file.name)
+    _store_catalog(s)
+
+    assert [f.path for f in s.query_files()] == ['/data/2026/a.csv', '/data/2026/b.csv', '/data/20261.csv',
+                                                 '/logs/c.jsonl']
+    assert list(s.query_files('/data/2026/')) == [
+        FileMetadata('/data/2026/a.csv', [Metadata('id', 'S', 3, 0)]),
+        FileMetadata('/data/2026/b.csv', [Metadata('id', 'I', 5, 0), Metadata('name', 'S', 5, 1)]),
+    ]
+    assert list(s.query_files(field='name')) == [
+        FileMetadata('/data/2026/b.csv', [Metadata('name', 'S', 5, 1)]),
+        FileMetadata('/logs/c.jsonl', [Metadata('name', 'S', 1, 0)]),
+    ]
+    assert list(s.query_files('/data/', 'other')) == [FileMetadata('/data/20261.csv', [Metadata('other', None, 2, 2)])]
+    assert list(s.query_files('/missing/')) == []
+
+
+def test_querying_type_conflicts(temp_db_file):
+    s = MetadataStorageManager(temp_db_file.name)
+    _store_catalog(s)
+
+    # a field with no type (all nulls) doesn't conflict
+    assert list(s.query_type_conflicts()) == [FieldTypes('id', (('I', 2), ('S', 1)))]
+    assert list(s.query_type_conflicts('/data/2026/')) == [FieldTypes('id', (('I', 1), ('S', 1)))]
+    assert list(s.query_type_conflicts('/logs/')) == []
+
+
+@pytest.mark.parametrize('prefix, field', [('/data/', None), ('/data/', 'id'), (None, 'id')])
+def test_queries_use_indexes(temp_db_file, prefix, field):
+    s = MetadataStorageManager(temp_db_file.name)
+    _store_catalog(s)
+
+    con = s._connection()
+    con.set_trace_callback(lambda statement: statements.append(statement))
+    statements = []
+    list(s.query_files(prefix, field))
+    con.set_trace_callback(None)
+
+    plan = con.execute('explain query plan ' + statements[-1]).fetchall()
+    assert all('SCAN' not in row['detail'] for row in plan)
+
+
+def test_get_storage_backend(monkeypatch, tmp_path):
+    monkeypatch.delenv(BACKEND_ENV_VAR, raising=False)
+    assert get_storage_backend() == 'sqlite'
+    with open_storage(str(tmp_path / 'catalog.db')) as s:
+        assert isinstance(s, MetadataStorageManager)
+
+    monkeypatch.setenv(BACKEND_ENV_VAR, 'sqlite')
+    assert get_storage_backend() == 'sqlite'
+
+    with pytest.raises(StoringException) as exc:
+        get_storage_backend('unknown')
+    assert exc.value.args[0].startswith("Unknown storage backend 'unknown'. Available backends are: sqlite")
+
+    monkeypatch.setenv(BACKEND_ENV_VAR, 'unknown')
+    with pytest.raises(StoringException):
+        open_storage(str(tmp_path / 'catalog.db'))
+
+
+def test_storage_backends_implement_the_whole_interface():
+    class Incomplete(StorageBackend):
+        def store_metadata(self, file_path, metadata, fingerprint=None, crawled_bytes=None):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+@pytest.fixture(params=sorted(storage_backends))
+def backend_db_path(request, tmp_path):
+    # every backend must behave the same
+    yield request.param, str(tmp_path / 'catalog.db')
+
+
+def test_backends_store_and_retrieve(backend_db_path):
+    backend, db_path = backend_db_path
+    statistics = FieldStatistics(1, 9.5, 4.5, 2.25, 5, ((4, 10),), (('a,"b"\n', 3), ('', 1)))
+    metadata = [Metadata('field,1', 'F', 10, 2, 1, 1, statistics), Metadata('', None, 3, 3), Metadata('é', 'T', 3, 0)]
+    with open_storage(db_path, backend, batch_size=10) as s:
+        s.store_metadata('/a', metadata, FileFingerprint(10, 20, 'f00d'), crawled_bytes=5)
+        s.store_metadata('/b', [Metadata('field_1', 'I', 10, 0)])
+        s.store_metadata('/b', [Metadata('field_2', 'S', 10, 0)])
+
+        assert list(s.retrieve_metadata('/a')) == metadata
+        assert list(s.retrieve_metadata('/b')) == [Metadata('field_2', 'S', 10, 0)]
+
+    with open_storage(db_path, backend) as s:
+        assert list(s.retrieve_metadata('/a')) == metadata
+        assert s.retrieve_fingerprint('/a') == FileFingerprint(10, 20, 'f00d')
+        assert s.retrieve_crawled_bytes('/a') == 5
+        assert s.retrieve_fingerprint('/b') is None
+        assert s.retrieve_crawled_bytes('/c') is None
+
+        s.store_metadata('/a', [Metadata('field,1', 'S', 5, 0)])
+        assert list(s.retrieve_metadata('/a')) == [Metadata('field,1', 'S', 5, 0)]
+        assert s.retrieve_crawled_bytes('/a') is None
+
+
+def test_backends_reject_invalid_metadata(backend_db_path):
+    backend, db_path = backend_db_path
+    with open_storage(db_path, backend, batch_size=10) as s:
+        s.store_metadata('/a', [Metadata('field_1', 'I', 10, 0)])
+        for invalid in [Metadata('field_1', 'X', 10, 0), Metadata('field_1', 'I', 0, 0),
+                        Metadata('field_1', 'I', 1, 2)]:
+            with pytest.raises(StoringException):
+                s.store_metadata('/a', [Metadata('field_2', 'I', 10, 0), invalid])
+        s.store_metadata('/b', [Metadata('field_1', 'I', 10, 0)])
+
+    with open_storage(db_path, backend) as s:
+        assert list(s.retrieve_metadata('/a')) == [Metadata('field_1', 'I', 10, 0)]
+        assert list(s.retrieve_metadata('/b')) == [Metadata('field_1', 'I', 10, 0)]
+
+
+def test_backends_query_the_catalog(backend_db_path):
+    backend, db_path = backend_db_path
+    with open_storage(db_path, backend, batch_size=2) as s:
+        _store_catalog(s)
+
+        assert [f.path for f in s.query_files()] == ['/data/2026/a.csv', '/data/2026/b.csv', '/data/20261.csv',
+                                                     '/logs/c.jsonl']
+        assert list(s.query_files('/data/2026/')) == [
+            FileMetadata('/data/2026/a.csv', [Metadata('id', 'S', 3, 0)]),
+            FileMetadata('/data/2026/b.csv', [Metadata('id', 'I', 5, 0), Metadata('name', 'S', 5, 1)]),
+        ]
+        assert list(s.query_files('/data/', 'other')) == [
+            FileMetadata('/data/20261.csv', [Metadata('other', None, 2, 2)])]
+        assert list(s.query_type_conflicts()) == [FieldTypes('id', (('I', 2), ('S', 1)))]
+        assert list(s.query_type_conflicts('/data/2026/')) == [FieldTypes('id', (('I', 1), ('S', 1)))]
+
+
+def test_duckdb_backend_streams_query_results(tmp_path, monkeypatch):
+    pytest.importorskip('duckdb')
+    monkeypatch.setattr(storage_manager, '_DUCKDB_FETCH_SIZE', 1)
+    with open_storage(str(tmp_path / 'catalog.duckdb'), 'duckdb') as s:
+        _store_catalog(s)
+
+        files = s.query_files()
+        assert next(files).path == '/data/2026/a.csv'
+        # the rows after the first of the next file were not fetched yet
+        assert len(s._connection().fetchall()) == 5
+
+
+def test_duckdb_backend_opening_another_db(temp_db_file):
+    pytest.importorskip('duckdb')
+    MetadataStorageManager(temp_db_file.name).close()
+
+    with pytest.raises(StoringException) as exc:
+        list(open_storage(temp_db_file.name, 'duckdb').retrieve_metadata('abc'))
+
+    info = exc.value
+    assert info.args[0] == "Could not create db schema. Is it a readable path?"
@@ -0,0 +1,167 @@
+import os
+
+from common import Metadata
+from crawler import crawl
+from metadata_extractor import extract_metadata_from_file
+from storage_manager import open_storage
+from tasks import (collect_paths, crawl_batch, crawl_file, crawl_file_in_chunks, crawl_if_changed,
+                   store_crawl_result)
+
+from tests.utils import write_csv, write_json, write_jsonl
+
+
+def _write_files(directory):
+    with open(os.path.join(directory, 'one.csv'), 'w') as csv_file:
+        write_csv(csv_file, ['field'], [{'field': 10}, {'field': 'null'}])
+    os.mkdir(os.path.join(directory, 'nested'))
+    with open(os.path.join(directory, 'nested', 'two.json'), 'w') as json_file:
+        write_json(json_file, [{'field': 'abc'}])
+    with open(os.path.join(directory, 'nested', 'notes.txt'), 'w') as txt_file:
+        txt_file.write('not metadata')
+
+
+def test_collect_paths_from_directory(tmp_path):
+    _write_files(str(tmp_path))
+    assert collect_paths([str(tmp_path)]) == [
+        str(tmp_path / 'one.csv'),
+        str(tmp_path / 'nested' / 'two.json'),
+    ]
+
+
+def test_collect_paths_from_glob(tmp_path):
+    _write_files(str(tmp_path))
+    assert collect_paths([str(tmp_path / '**' / '*.json')]) == [str(tmp_path / 'nested' / 'two.json')]
+
+
+def test_collect_paths_without_duplicates(tmp_path):
+    _write_files(str(tmp_path))
+    file_path = str(tmp_path / 'one.csv')
+    assert collect_paths([file_path, str(tmp_path / '*.csv'), file_path]) == [file_path]
+
+
+def test_crawl_batch(tmp_path, temp_db_file):
+    _write_files(str(tmp_path))
+    paths = collect_paths([str(tmp_path)])
+
+    summary = crawl_batch(paths, temp_db_file.name, workers=2)
+
+    assert sorted(summary.crawled) == sorted(paths)
+    assert summary.skipped == []
+    assert summary.failures == []
+
+    s = open_storage(temp_db_file.name)
+    assert list(s.retrieve_metadata(str(tmp_path / 'one.csv'))) == [Metadata('field', 'I', 2, 1)]
+    assert list(s.retrieve_metadata(str(tmp_path / 'nested' / 'two.json'))) == [Metadata('field', 'S', 1, 0)]
+
+
+def test_crawl_batch_skips_crawled_files(tmp_path, temp_db_file):
+    _write_files(str(tmp_path))
+    paths = collect_paths([str(tmp_path)])
+    crawl_batch(paths[:1], temp_db_file.name, workers=1)
+
+    summary = crawl_batch(paths, temp_db_file.name, workers=1)
+
+    assert summary.crawled == paths[1:]
+    assert summary.skipped == paths[:1]
+
+
+def test_crawl_batch_reports_failures(tmp_path, temp_db_file):
+    _write_files(str(tmp_path))
+    wrong_path = str(tmp_path / 'wrong.csv')
+    with open(wrong_path, 'w') as csv_file:
+        write_csv(csv_file, ['field'], [{'field': 'abc'}])
+    paths = collect_paths([str(tmp_path)])
+
+    summary = crawl_batch(paths, temp_db_file.name, workers=2)
+
+    assert sorted(summary.crawled) == sorted(set(paths) - {wrong_path})
+    assert summary.failures == [(wrong_path, "Unknown type for value 'abc' (column 'field') at line 2")]
+
+
+def test_crawl_file_in_chunks(temp_csv_file):
+    write_csv(temp_csv_file, ['field_one', 'field_two', 'field_three'],
+              [{'field_one': idx, 'field_two': '"abc"' if idx % 3 else 'null', 'field_three': 'null'}
+               for idx in range(5000)])
+
+    metadata = list(crawl_file_in_chunks(temp_csv_file.name, workers=3, min_chunk_size=1024))
+
+    assert metadata == list(crawl_file(temp_csv_file.name))
+
+
+def test_crawl_batch_replaces_changed_files(tmp_path, temp_db_file):
+    _write_files(str(tmp_path))
+    paths = collect_paths([str(tmp_path)])
+    crawl_batch(paths, temp_db_file.name, workers=2)
+
+    changed_path = str(tmp_path / 'one.csv')
+    with open(changed_path, 'w') as csv_file:
+        write_csv(csv_file, ['other_field'], [{'other_field': '"abc"'}] * 3)
+
+    summary = crawl_batch(paths, temp_db_file.name, workers=2)
+
+    assert summary.crawled == [changed_path]
+    assert summary.skipped == [str(tmp_path / 'nested' / 'two.json')]
+    s = open_storage(temp_db_file.name)
+    assert list(s.retrieve_metadata(changed_path)) == [Metadata('other_field', 'S', 3, 0)]
+
+
+def _crawl_and_store(s, path, with_hash=False, append_only=True):
+    result = crawl_if_changed(path, s.retrieve_fingerprint(path), s.retrieve_crawled_bytes(path),
+                              with_hash, append_only)
+    store_crawl_result(s, path, result)
+    return result
+
+
+def test_crawl_appended_file(temp_csv_file, temp_db_file):
+    write_csv(temp_csv_file, ['field_one', 'field_two'], [{'field_one': 1, 'field_two': 'null'}] * 10)
+    s = open_storage(temp_db_file.name)
+    assert _crawl_and_store(s, temp_csv_file.name).resumed_from is None
+    crawled_bytes = s.retrieve_crawled_bytes(temp_csv_file.name)
+    assert crawled_bytes == os.path.getsize(temp_csv_file.name)
+
+    temp_csv_file.write('2,"abc"\n3,null\n')
+    temp_csv_file.flush()
+
+    assert _crawl_and_store(s, temp_csv_file.name).resumed_from == crawled_bytes
+    assert list(s.retrieve_metadata(temp_csv_file.name)) == list(crawl_file(temp_csv_file.name))
+    assert list(s.retrieve_metadata(temp_csv_file.name)) == [Metadata('field_one', 'I', 12, 0),
+                                                             Metadata('field_two', 'S', 12, 11)]
+
+
+def test_crawl_appended_file_verifies_previous_content_with_hash(temp_csv_file, temp_db_file):
+    write_csv(temp_csv_file, ['field'], [{'field': 1}] * 10)
+    s = open_storage(temp_db_file.name)
+    _crawl_and_store(s, temp_csv_file.name, with_hash=True)
+
+    # rewrite the head of the file keeping its size, and append to it
+    temp_csv_file.seek(0)
+    temp_csv_file.write('other')
+    temp_csv_file.seek(0, os.SEEK_END)
+    temp_csv_file.write('2\n')
+    temp_csv_file.flush()
+
+    assert _crawl_and_store(s, temp_csv_file.name, with_hash=True).resumed_from is None
+    assert list(s.retrieve_metadata(temp_csv_file.name)) == [Metadata('other', 'I', 11, 0)]
+
+
+def test_crawl_file_without_trailing_line_break_is_not_resumed(temp_csv_file, temp_db_file):
+    temp_csv_file.write('field\n1\n2')
+    temp_csv_file.flush()
+    s = open_storage(temp_db_file.name)
+    _crawl_and_store(s, temp_csv_file.name)
+    assert s.retrieve_crawled_bytes(temp_csv_file.name) is None
+
+    temp_csv_file.write('3\n')
+    temp_csv_file.flush()
+
+    assert _crawl_and_store(s, temp_csv_file.name).resumed_from is None
+    assert list(s.retrieve_metadata(temp_csv_file.name)) == [Metadata('field', 'I', 2, 0)]
+
+
+def test_crawl_jsonl_file_in_chunks(temp_jsonl_file):
+    write_jsonl(temp_jsonl_file, [{'field_one': idx, 'field_two': 'abc' if idx % 3 else None} for idx in range(5000)])
+
+    metadata = list(crawl_file_in_chunks(temp_jsonl_file.name, workers=3, min_chunk_size=1024))
+
+    assert metadata == list(crawl(extract_metadata_from_file(temp_jsonl_file.name)))
+    assert metadata == [Metadata('field_one', 'I', 5000, 0), Metadata('field_two', 'S', 5000, 1667)]
@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from common import Metadata
+from storage_manager import open_storage
+from watcher import Debouncer, WatchEvent, _InotifyWatcher, watch
+
+from tests.utils import write_csv
+
+
+def _inotify_available(tmp_path) -> bool:
+    try:
+        _InotifyWatcher([str(tmp_path)]).close()
+    except OSError:
+        return False
+    return True
+
+
+@pytest.fixture(params=['inotify', 'polling'])
+def poll_interval(request, tmp_path):
+    if request.param == 'polling':
+        return 0.05
+    if not _inotify_available(tmp_path):
+        pytest.skip('inotify is not available')
+    return None
+
+
+def _write(path, rows):
+    with open(path, 'w') as csv_file:
+        write_csv(csv_file, ['field'], rows)
+
+
+def _stored_metadata(db_path, path):
+    with open_storage(db_path) as s:
+        return list(s.retrieve_metadata(path))
+
+
+def test_debouncer_coalesces_bursts():
+    debouncer = Debouncer(1)
+    debouncer.touch('a.csv', 0)
+    debouncer.touch('b.csv', 0.5)
+    debouncer.touch('a.csv', 0.8)
+
+    assert debouncer.timeout(1) == 0.5
+    assert debouncer.ready(1) == []
+    assert debouncer.ready(1.5) == ['b.csv']
+    assert debouncer.ready(1.7) == []
+    assert debouncer.ready(1.8) == ['a.csv']
+    assert debouncer.timeout(2) is None
+
+
+def test_watch_crawls_new_and_modified_files(tmp_path, poll_interval):
+    db_path = str(tmp_path / 'metadata.db')
+    directory = tmp_path / 'landing'
+    directory.mkdir()
+    existing = str(directory / 'existing.csv')
+    _write(existing, [{'field': 1}])
+
+    events = watch([str(directory)], db_path, settle=0.1, poll_interval=poll_interval, workers=1)
+    try:
+        assert next(events) == WatchEvent(existing, None)
+
+        (directory / 'ignored.txt').write_text('not crawled')
+        (directory / 'nested').mkdir()
+        created = str(directory / 'nested' / 'created.csv')
+        _write(created, [{'field': 5}])
+        assert next(events) == WatchEvent(created, None)
+
+        _write(existing, [{'field': 1}, {'field': 'null'}])
+        assert next(events) == WatchEvent(existing, None)
+    finally:
+        events.close()
+
+    assert _stored_metadata(db_path, existing) == [Metadata('field', 'I', 2, 1)]
+    assert _stored_metadata(db_path, created) == [Metadata('field', 'I', 1, 0)]
+
+
+def test_watch_waits_for_files_to_be_quiet(tmp_path, poll_interval):
+    db_path = str(tmp_path / 'metadata.db')
+    path = str(tmp_path / 'partial.csv')
+
+    events = watch([str(tmp_path)], db_path, settle=0.3, poll_interval=poll_interval, workers=1)
+    try:
+        # a burst of writes, the first ones leaving the file half-written
+        with open(path, 'w') as csv_file:
+            csv_file.write('field\n1\n')
+            csv_file.flush()
+            os.fsync(csv_file.fileno())
+            csv_file.write('2\n3')
+            csv_file.flush()
+            csv_file.write('4\n')
+
+        assert next(events) == WatchEvent(path, None)
+    finally:
+        events.close()
+
+    assert _stored_metadata(db_path, path) == [Metadata('field', 'I', 3, 0)]
+
+
+def test_watch_reports_failures(tmp_path, poll_interval):
+    path = str(tmp_path / 'invalid.json')
+    with open(path, 'w') as json_file:
+        json_file.write('{"not": "an array"}')
+
+    events = watch([str(tmp_path)], str(tmp_path / 'metadata.db'), settle=0.1, poll_interval=poll_interval)
+    try:
+        event = next(events)
+    finally:
+        events.close()
+
+    assert event.path == path
+    assert event.error is not None
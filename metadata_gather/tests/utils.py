@@ -12,3 +12,10 @@ def write_csv(file_like, fieldnames, rows):
 def write_json(file_like, mapping):
     json.dump(mapping, file_like)
     file_like.flush()
+
+
+def write_jsonl(file_like, mappings):
+    for mapping in mappings:
+        file_like.write(json.dumps(mapping))
+        file_like.write('\n')
+    file_like.flush()
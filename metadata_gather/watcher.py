@@ -0,0 +1,327 @@
+"""
+This module isolates the logic to watch directories, crawling files as soon as they are
+created or modified.
+
+Changes are noticed with inotify where it's available, or by scanning the directories
+periodically otherwise. A file is only crawled once it was quiet (no changes were noticed)
+for a while, so files being written are not crawled half-written, and bursts of changes
+to the same file are coalesced into a single crawl.
+"""
+from collections import namedtuple
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from typing import Dict, Generator, Iterable, List, Optional
+
+from metadata_extractor import is_supported_file
+from storage_manager import StorageBackend, open_storage
+from tasks import crawl_if_changed, store_crawl_result
+from common import GatherError
+
+# The outcome of crawling a file that changed: its path, and the reason why it could not be
+# crawled (None if it was crawled)
+WatchEvent = namedtuple('WatchEvent', 'path, error')
+
+# Seconds a file must be quiet before it's crawled
+_SETTLE_SECONDS = 2.0
+
+# inotify constants, from <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+_READ_SIZE = 64 * 1024
+
+
+def _walk_files(directory: str) -> Generator[str, None, None]:
+    for dir_path, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            yield os.path.join(dir_path, file_name)
+
+
+class _InotifyWatcher:
+    """
+    Help class to notice the files changed under some directories, with inotify.
+
+    Directories created under the watched ones are watched as well.
+
+    This class is intended to use inside this module only.
+    """
+    def __init__(self, directories: Iterable[str]):
+        """
+        :raises OSError if inotify is not available
+        """
+        libc_path = ctypes.util.find_library('c')
+        if libc_path is None:
+            raise OSError('libc not found')
+        self._libc = ctypes.CDLL(libc_path, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'Could not initialize inotify')
+
+        self._directories = dict()
+        self._roots = list(directories)
+        try:
+            for directory in self._roots:
+                self._watch_tree(directory)
+        except BaseException:
+            self.close()
+            raise
+
+    def _watch(self, directory: str) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Could not watch directory '{directory}'")
+        self._directories[wd] = directory
+
+    def _watch_tree(self, directory: str) -> List[str]:
+        """
+        Watch a directory and its subdirectories.
+
+        :return: the files already in the tree
+        """
+        files = []
+        for dir_path, _, file_names in os.walk(directory):
+            self._watch(dir_path)
+            files.extend(os.path.join(dir_path, file_name) for file_name in file_names)
+        return files
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def changes(self, timeout: Optional[float]) -> List[str]:
+        """
+        Wait for changes, up to <timeout> seconds (forever if None).
+
+        :return: the paths of the files changed, with repetitions
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+
+        try:
+            data = os.read(self._fd, _READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += _EVENT_HEADER.size + length
+
+            if mask & _IN_Q_OVERFLOW:
+                # events were lost: every file may have changed
+                for directory in self._roots:
+                    changed.extend(_walk_files(directory))
+            elif mask & _IN_IGNORED:
+                self._directories.pop(wd, None)
+            elif wd in self._directories:
+                path = os.path.join(self._directories[wd], os.fsdecode(name))
+                if not mask & _IN_ISDIR:
+                    changed.append(path)
+                elif mask & (_IN_CREATE | _IN_MOVED_TO):
+                    # files may have been created in the directory before it was watched
+                    try:
+                        changed.extend(self._watch_tree(path))
+                    except OSError:
+                        # it was removed already
+                        pass
+
+        return changed
+
+
+class _PollingWatcher:
+    """
+    Help class to notice the files changed under some directories, by comparing the size
+    and modification time of every file every <interval> seconds.
+
+    This class is intended to use inside this module only.
+    """
+    def __init__(self, directories: Iterable[str], interval: float):
+        self._directories = list(directories)
+        self._interval = interval
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self) -> Dict[str, tuple]:
+        snapshot = dict()
+        for directory in self._directories:
+            for path in _walk_files(directory):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def close(self) -> None:
+        pass
+
+    def changes(self, timeout: Optional[float]) -> List[str]:
+        """
+        Wait for changes, up to <timeout> seconds (forever if None).
+
+        :return: the paths of the files changed
+        """
+        wait = self._next_scan - time.monotonic()
+        if timeout is not None and timeout < wait:
+            time.sleep(max(timeout, 0))
+            return []
+
+        time.sleep(max(wait, 0))
+        self._next_scan = time.monotonic() + self._interval
+        previous, self._snapshot = self._snapshot, self._scan()
+        return [path for path, state in self._snapshot.items() if previous.get(path) != state]
+
+
+class Debouncer:
+    """
+    Keeps the files changed until they were quiet for <settle> seconds.
+
+    Changes to a file that is already waiting postpone it, so bursts of changes are
+    coalesced into a single one.
+    """
+    def __init__(self, settle: float):
+        """
+        :param settle: the seconds a file must be quiet to be ready
+        """
+        self._settle = settle
+        self._pending = dict()
+
+    def touch(self, path: str, now: float) -> None:
+        """
+        Record a change to a file.
+
+        :param path: the file changed
+        :param now: the time of the change, in seconds
+        """
+        # re-inserting keeps the files sorted by their last change
+        self._pending.pop(path, None)
+        self._pending[path] = now
+
+    def timeout(self, now: float) -> Optional[float]:
+        """
+        :param now: the current time, in seconds
+        :return: the seconds until the next file is ready, or None if there are no files waiting
+        """
+        for changed in self._pending.values():
+            return max(changed + self._settle - now, 0)
+        return None
+
+    def ready(self, now: float) -> List[str]:
+        """
+        Take the files that were quiet for long enough.
+
+        :param now: the current time, in seconds
+        :return: the files ready, in the order they were last changed
+        """
+        ready = []
+        for path, changed in self._pending.items():
+            if changed + self._settle > now:
+                break
+            ready.append(path)
+
+        for path in ready:
+            del self._pending[path]
+        return ready
+
+
+def _open_watcher(directories: List[str], poll_interval: Optional[float]):
+    if poll_interval is None:
+        try:
+            return _InotifyWatcher(directories)
+        except OSError:
+            poll_interval = _SETTLE_SECONDS
+
+    return _PollingWatcher(directories, poll_interval)
+
+
+def watch(directories: Iterable[str], db_path: str, settle: float = _SETTLE_SECONDS,
+          poll_interval: Optional[float] = None, workers: Optional[int] = None, with_hash: bool = False,
+          append_only: bool = False) -> Generator[WatchEvent, None, None]:
+    """
+    Crawl the supported files under some directories as they are created or modified.
+
+    The files already in the directories are crawled first, skipping those that did not
+    change since they were crawled. Then, every file created or modified is crawled once it
+    was quiet for <settle> seconds. The returned generator never ends: files are only
+    watched while it's being consumed.
+
+    :param directories: the directories to watch, recursively
+    :param db_path: path to the db file. It's created if it doesn't exists.
+    :param settle: the seconds a file must be quiet to be crawled
+    :param poll_interval: if given, directories are scanned every <poll_interval> seconds instead of using inotify
+    :param workers: the amount of worker processes to crawl big files. Defaults to the amount of CPUs
+    :param with_hash: whether to compare content hashes to detect changes
+    :param append_only: whether files that grew can be assumed to have been appended to
+    :return: a generator object that produces a WatchEvent for every file crawled, or that could not be crawled
+    """
+    directories = list(directories)
+    debouncer = Debouncer(settle)
+    watcher = _open_watcher(directories, poll_interval)
+    try:
+        with open_storage(db_path) as s:
+            for directory in directories:
+                for path in _walk_files(directory):
+                    if is_supported_file(path):
+                        debouncer.touch(path, 0)
+
+            while True:
+                for path in debouncer.ready(time.monotonic()):
+                    event = _crawl(s, path, workers, with_hash, append_only)
+                    if event is not None:
+                        yield event
+
+                now = time.monotonic()
+                for path in watcher.changes(debouncer.timeout(now)):
+                    if is_supported_file(path):
+                        debouncer.touch(path, now)
+    finally:
+        watcher.close()
+
+
+def _crawl(s: StorageBackend, abs_path: str, workers: Optional[int], with_hash: bool,
+           append_only: bool) -> Optional[WatchEvent]:
+    """
+    Crawl a file that may have changed, and store its metadata.
+
+    :return: the outcome, or None if the file did not change or does not exist anymore
+    """
+    if not os.path.isfile(abs_path):
+        return None
+
+    try:
+        result = crawl_if_changed(abs_path, s.retrieve_fingerprint(abs_path), s.retrieve_crawled_bytes(abs_path),
+                                  with_hash, append_only, workers)
+        if result is None:
+            return None
+        store_crawl_result(s, abs_path, result)
+    except GatherError as e:
+        return WatchEvent(abs_path, str(e))
+    except FileNotFoundError:
+        return None
+    except Exception:
+        return WatchEvent(abs_path, 'Unexpected error occurred.')
+
+    return WatchEvent(abs_path, None)